@@ -1,5 +1,25 @@
 from loguru import logger
+import ins_metrics
+import mmap
+import os
 import re
+import time
+from typing import Collection, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MiB of text per read
+ISA_LENGTH = 106  # Fixed-width ISA header including its segment terminator
+ESCAPE_CHARACTER = "\\"
+
+# Per-segment diagnostics (one log line per segment/model) are off by default so they cost
+# a single flag check in production; set EDI_SEGMENT_LOGGING=1 or call set_segment_logging(True).
+SEGMENT_LOGGING = os.environ.get("EDI_SEGMENT_LOGGING", "0").lower() not in ("", "0", "false", "no")
+
+
+def set_segment_logging(enabled: bool) -> None:
+    """Turns per-segment debug logging in the parser and segment classes on or off."""
+    global SEGMENT_LOGGING
+    SEGMENT_LOGGING = enabled
+
 
 def split_edi_line(line: str, field_separator: str = "*", segment_terminator: str = "~") -> list[str]:
     """Splits an EDI line into its constituent fields.
@@ -119,13 +139,511 @@ def split_edi_file_to_segments(input_filepath):
     """
     try:
         logger.debug(f"Input File Path: {input_filepath}")
-        with open(input_filepath, 'r') as infile:
-            edi_content = infile.read()
-
-        segmented_content = split_edi_to_segments(edi_content)
+        # Built from the streaming reader so only the resulting list is held in memory,
+        # not the raw text plus the intermediate split/strip/replace lists.
+        segmented_content = list(iter_edi_segments(input_filepath))
         return segmented_content
     except FileNotFoundError:
         print(f"Input file not found: {input_filepath}")
     except Exception as e:
         print(f"An error occurred: {e}")
 
+
+
+class EdiDelimiters(NamedTuple):
+    """Interchange delimiters, as declared by the ISA header."""
+    element_separator: str = "*"
+    sub_element_separator: str = ":"
+    repetition_separator: str = "^"
+    segment_terminator: str = "~"
+
+
+def detect_delimiters(isa_header: str) -> EdiDelimiters:
+    """
+    Reads the interchange delimiters from the fixed-width ISA header.
+
+    Args:
+        isa_header: Text starting with the ISA segment. Its 106th character is taken as the
+            segment terminator; a 105 character ISA (already split off) keeps the default "~".
+    Returns:
+        EdiDelimiters with the element (ISA pos 4), repetition (ISA11), sub-element (ISA16)
+        separators and the segment terminator.
+    """
+    if not isa_header.startswith("ISA") or len(isa_header) < ISA_LENGTH - 1:
+        raise ValueError(f"Not a fixed-width ISA header: {isa_header[:ISA_LENGTH]!r}")
+
+    return EdiDelimiters(
+        element_separator=isa_header[3],
+        sub_element_separator=isa_header[104],
+        repetition_separator=isa_header[82],
+        segment_terminator=isa_header[105] if len(isa_header) >= ISA_LENGTH else EdiDelimiters().segment_terminator,
+    )
+
+
+class EnvelopeError(ValueError):
+    """An interchange, functional group or transaction set envelope that does not add up."""
+
+    def __init__(self, message: str, segment_id: str, element: Optional[str] = None, rule: str = "envelope",
+                 value: Optional[str] = None):
+        super().__init__(message)
+        self.segment_id = segment_id
+        self.element = element  # e.g. "SE01"
+        self.rule = rule  # e.g. "control_count_mismatch", "control_number_mismatch", "truncated"
+        self.value = value
+
+
+def _envelope_element(fields: Tuple[str, ...], position: int) -> Optional[str]:
+    value = fields[position].strip() if position < len(fields) else ""
+    return value or None
+
+
+def _same_control_number(opened: Optional[str], closed: Optional[str]) -> bool:
+    # Numeric control numbers may be zero-padded on one side only (ISA13 is always 9 digits)
+    if opened is not None and closed is not None and opened.isdigit() and closed.isdigit():
+        return int(opened) == int(closed)
+    return opened == closed
+
+
+class EnvelopeVerifier:
+    """
+    Verifies the ISA/IEA, GS/GE and ST/SE envelopes while the segments stream by.
+
+    Each trailer is checked against its header when it is read: SE01 against the segments
+    counted since ST, GE01 against the transaction sets of the group, IEA01 against the
+    groups of the interchange, and SE02/GE02/IEA02 against ST02/GS06/ISA13. Only the open
+    envelopes are held, so memory is O(1) whatever the file size. finish() rejects input
+    that ends inside an envelope (a truncated transfer).
+
+    Every method updates the open envelopes before raising EnvelopeError, so a caller that
+    records the error and carries on (see ins_validation) keeps checking the rest of the file.
+    Envelopes may be absent (e.g. bare ST/SE fragments); only those that are opened are checked.
+    """
+
+    def __init__(self):
+        self.interchange_control_number: Optional[str] = None
+        self.interchange_open = False
+        self.groups = 0
+        self.group_control_number: Optional[str] = None
+        self.group_open = False
+        self.transaction_sets = 0
+        self.transaction_set_control_number: Optional[str] = None
+        self.transaction_set_open = False
+        self.interchanges = 0
+
+    def isa(self, fields: Tuple[str, ...]) -> None:
+        unclosed = self.interchange_open
+        previous = self.interchange_control_number
+        self.interchange_control_number = _envelope_element(fields, 13)
+        self.interchange_open = True
+        self.groups = 0
+        self.interchanges += 1
+        if unclosed:
+            raise EnvelopeError(f"ISA {self.interchange_control_number} starts before interchange {previous} is closed by IEA",
+                                "ISA", "ISA13", "unclosed_envelope", self.interchange_control_number)
+
+    def gs(self, fields: Tuple[str, ...]) -> None:
+        unclosed = self.group_open
+        previous = self.group_control_number
+        self.group_control_number = _envelope_element(fields, 6)
+        self.group_open = True
+        self.transaction_sets = 0
+        self.groups += 1
+        if unclosed:
+            raise EnvelopeError(f"GS {self.group_control_number} starts before group {previous} is closed by GE",
+                                "GS", "GS06", "unclosed_envelope", self.group_control_number)
+
+    def st(self, fields: Tuple[str, ...]) -> None:
+        unclosed = self.transaction_set_open
+        previous = self.transaction_set_control_number
+        self.transaction_set_control_number = _envelope_element(fields, 2)
+        self.transaction_set_open = True
+        self.transaction_sets += 1
+        if unclosed:
+            raise EnvelopeError(f"ST {self.transaction_set_control_number} starts before transaction set {previous} "
+                                f"is closed by SE", "ST", "ST02", "unclosed_envelope", self.transaction_set_control_number)
+
+    @staticmethod
+    def _check_trailer(segment_id: str, fields: Tuple[str, ...], opened: bool, control_number: Optional[str],
+                       header_element: str, actual_count: int, counted: str) -> None:
+        count, closing_number = _envelope_element(fields, 1), _envelope_element(fields, 2)
+        if not opened:
+            raise EnvelopeError(f"{segment_id} {closing_number} without an open envelope", segment_id,
+                                f"{segment_id}02", "unopened_envelope", closing_number)
+        if not _same_control_number(control_number, closing_number):
+            raise EnvelopeError(f"{segment_id}02 control number {closing_number} does not match {header_element} {control_number}",
+                                segment_id, f"{segment_id}02", "control_number_mismatch", closing_number)
+        if count is None or not count.isdigit() or int(count) != actual_count:
+            raise EnvelopeError(f"{segment_id}01 says {count} {counted}, {actual_count} were read ({header_element} {control_number})",
+                                segment_id, f"{segment_id}01", "control_count_mismatch", count)
+
+    def se(self, fields: Tuple[str, ...], segment_count: int) -> None:
+        """segment_count: segments from ST to this SE, both included."""
+        opened = self.transaction_set_open
+        self.transaction_set_open = False
+        self._check_trailer("SE", fields, opened, self.transaction_set_control_number, "ST02", segment_count, "segments")
+
+    def ge(self, fields: Tuple[str, ...]) -> None:
+        opened = self.group_open
+        self.group_open = False
+        self._check_trailer("GE", fields, opened, self.group_control_number, "GS06", self.transaction_sets, "transaction sets")
+
+    def iea(self, fields: Tuple[str, ...]) -> None:
+        opened = self.interchange_open
+        self.interchange_open = False
+        self._check_trailer("IEA", fields, opened, self.interchange_control_number, "ISA13", self.groups, "functional groups")
+
+    def finish(self) -> None:
+        """Raises EnvelopeError if the input ended inside an envelope."""
+        for segment_id, trailer, is_open, control_number in (
+                ("ST", "SE", self.transaction_set_open, self.transaction_set_control_number),
+                ("GS", "GE", self.group_open, self.group_control_number),
+                ("ISA", "IEA", self.interchange_open, self.interchange_control_number)):
+            if is_open:
+                self.transaction_set_open = self.group_open = self.interchange_open = False
+                raise EnvelopeError(f"Input ends without the {trailer} closing {segment_id} {control_number} (truncated?)",
+                                    trailer, None, "truncated", control_number)
+
+
+class EdiTokenizer:
+    """
+    Splits EDI text into segments and segments into field tuples for one set of delimiters.
+
+    The terminator pattern is compiled once per interchange, and every segment is split on
+    the element separator exactly once, so segment classes receive ready-made field tuples.
+    """
+
+    def __init__(self, delimiters: EdiDelimiters = EdiDelimiters()):
+        self.delimiters = delimiters
+        self.element_separator = delimiters.element_separator
+        terminator = delimiters.segment_terminator
+        # Split by segment terminator while handling escaped terminators (e.g. \\~)
+        self._segment_split_re = re.compile(r'(?<!' + re.escape(ESCAPE_CHARACTER) + r')' + re.escape(terminator))
+        self._escaped_terminator = ESCAPE_CHARACTER + terminator
+        self._terminator = terminator
+
+    def split_segment(self, segment: str) -> Tuple[str, ...]:
+        """Splits one segment (without terminator) into its fields, segment ID first."""
+        return tuple(segment.split(self.element_separator))
+
+    def iter_segments(self, stream: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE, head: str = "") -> Iterator[str]:
+        """
+        Yields EDI segments one at a time from an open text stream.
+
+        The stream is read in fixed-size chunks; the trailing partial segment of each
+        chunk is carried over and completed by the next one, so memory stays bounded by
+        chunk_size plus the longest segment regardless of the input size.
+
+        Args:
+            stream: A text stream opened on the EDI content.
+            chunk_size: Number of characters to read per chunk.
+            head: Text already read from the stream (e.g. the ISA header) to process first.
+        Yields:
+            Stripped segments without their terminator, escaped terminators restored.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+        split_chunk = self.split_chunk
+        metrics = ins_metrics.ACTIVE
+        if metrics is not None:
+            def split_timed_chunk(carry: str, chunk: str, final: bool = False) -> Tuple[List[str], str]:
+                started = time.perf_counter_ns()
+                segments, carry = self.split_chunk(carry, chunk, final)
+                metrics.inc("edi_stage_seconds_total", "tokenize", (time.perf_counter_ns() - started) / 1e9)
+                metrics.inc("edi_stage_items_total", "tokenize", len(segments))
+                return segments, carry
+            split_chunk = split_timed_chunk
+
+        carry = ""
+        chunk = head or stream.read(chunk_size)
+        while chunk:
+            segments, carry = split_chunk(carry, chunk)
+            yield from segments
+            chunk = stream.read(chunk_size)
+        yield from split_chunk(carry, "", final=True)[0]
+
+    def split_chunk(self, carry: str, chunk: str, final: bool = False) -> Tuple[List[str], str]:
+        """
+        Splits one chunk of EDI text, prefixed by the partial segment left over from the
+        previous chunk, into complete segments. Used by iter_segments, and directly by
+        callers that receive chunks from elsewhere (e.g. ins_pipeline's read stage).
+
+        Args:
+            carry: The partial segment returned for the previous chunk ("" for the first).
+            chunk: The next piece of text.
+            final: No more text follows; the trailing partial segment is a segment too.
+        Returns:
+            (segments, carry): stripped segments without their terminator, escaped
+            terminators restored, and the new partial segment ("" when final).
+        """
+        # The carry is re-split with the new chunk so an escape character left at
+        # the end of the previous chunk still protects a terminator at the start of this one.
+        pieces = self._segment_split_re.split(carry + chunk)
+        carry = "" if final else pieces.pop()
+        escaped, terminator = self._escaped_terminator, self._terminator
+        segments = []
+        for segment in pieces:
+            segment = segment.strip()
+            if segment:
+                segments.append(segment.replace(escaped, terminator))
+        return segments, carry
+
+    def iter_fields(self, stream: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE, head: str = "") -> Iterator[Tuple[str, ...]]:
+        """Same as iter_segments but yields each segment as a tuple of fields."""
+        split_segment = self.split_segment
+        for segment in self.iter_segments(stream, chunk_size, head):
+            yield split_segment(segment)
+
+
+class SegmentEnvelopeVerifier(EnvelopeVerifier):
+    """
+    EnvelopeVerifier for a stream of unsplit segments, for callers that hand the segments
+    on to parsers that cannot check the envelopes themselves (e.g. chunks of INS loops cut
+    inside a transaction set, see ins_834.iter_ins_file_parallel).
+
+    Only the ISA/GS/ST/SE/GE/IEA segments are split; the others are just counted for SE01.
+    """
+
+    def __init__(self, tokenizer: EdiTokenizer):
+        super().__init__()
+        self.split_segment = tokenizer.split_segment
+        self._envelope_prefixes = tuple(segment_id + tokenizer.element_separator
+                                        for segment_id in ("ISA", "GS", "ST", "SE", "GE", "IEA"))
+        self.segment_count = 0  # segments since ST, ST included
+
+    def verify(self, segments: Iterable[str]) -> Iterator[str]:
+        """Yields segments unchanged, raising EnvelopeError at the first envelope mismatch.
+
+        May be called again with the next segments of the same input; call finish() after
+        the last one.
+        """
+        envelope_prefixes, split_segment = self._envelope_prefixes, self.split_segment
+        for segment in segments:
+            self.segment_count += 1
+            if segment.startswith(envelope_prefixes):
+                self._verify_envelope(split_segment(segment))
+            yield segment
+
+    def _verify_envelope(self, fields: Tuple[str, ...]) -> None:
+        segment_id = fields[0]
+        if segment_id == "ST":
+            self.segment_count = 1
+            self.st(fields)
+        elif segment_id == "SE":
+            self.se(fields, self.segment_count)
+        elif segment_id == "ISA":
+            self.isa(fields)
+        elif segment_id == "GS":
+            self.gs(fields)
+        elif segment_id == "GE":
+            self.ge(fields)
+        else:
+            self.iea(fields)
+
+
+def tokenizer_from_stream(stream: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[EdiTokenizer, str]:
+    """
+    Reads the start of the stream and builds a tokenizer from its ISA header.
+
+    Streams that do not start with ISA fall back to the default "*" / "~" delimiters.
+
+    Returns:
+        (tokenizer, head) where head is the text consumed so far, to be passed back to
+        EdiTokenizer.iter_segments / iter_fields.
+    """
+    head = stream.read(max(chunk_size, ISA_LENGTH))
+    while len(head.lstrip("\ufeff \t\r\n")) < ISA_LENGTH:
+        more = stream.read(chunk_size)
+        if not more:
+            break
+        head += more
+    head = head.lstrip("\ufeff \t\r\n")
+
+    if head.startswith("ISA") and len(head) >= ISA_LENGTH:
+        delimiters = detect_delimiters(head)
+        logger.debug(f"Delimiters from ISA header: {delimiters}")
+    else:
+        delimiters = EdiDelimiters()
+        logger.debug(f"No ISA header found; using default delimiters: {delimiters}")
+    return EdiTokenizer(delimiters), head
+
+
+def iter_edi_segments_from_stream(stream: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Yields EDI segments one at a time from an open text stream, delimiters taken from its ISA header."""
+    tokenizer, head = tokenizer_from_stream(stream, chunk_size)
+    yield from tokenizer.iter_segments(stream, chunk_size, head)
+
+
+def iter_edi_segments(input_filepath, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Streams an EDI file segment by segment without loading it into memory.
+
+    Args:
+        input_filepath: Path to the input EDI file.
+        chunk_size: Number of characters to read per chunk.
+    Yields:
+        One segment at a time, in file order.
+    """
+    logger.debug(f"Streaming input file path: {input_filepath} chunk_size: {chunk_size}")
+    # newline=None normalizes \r\n and \r to \n just like split_edi_to_segments
+    with open(input_filepath, 'r', newline=None) as infile:
+        yield from iter_edi_segments_from_stream(infile, chunk_size)
+
+
+def iter_edi_fields(input_filepath, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[str, ...]]:
+    """
+    Streams an EDI file as field tuples, using the delimiters declared in its ISA header.
+
+    Args:
+        input_filepath: Path to the input EDI file.
+        chunk_size: Number of characters to read per chunk.
+    Yields:
+        One tuple of fields per segment, segment ID first.
+    """
+    logger.debug(f"Tokenizing input file path: {input_filepath} chunk_size: {chunk_size}")
+    with open(input_filepath, 'r', newline=None) as infile:
+        tokenizer, head = tokenizer_from_stream(infile, chunk_size)
+        yield from tokenizer.iter_fields(infile, chunk_size, head)
+
+
+def tokenize_edi_segments(edi_segments: Iterable[str]) -> Iterator[Tuple[str, ...]]:
+    """
+    Splits already separated segments into field tuples.
+
+    The element separator is taken from the ISA segment when one is seen (a new ISA
+    switches delimiters for the interchange that follows); "*" is used until then.
+    """
+    tokenizer = EdiTokenizer()
+    split_segment = tokenizer.split_segment
+    for segment in edi_segments:
+        if segment.startswith("ISA") and len(segment) >= ISA_LENGTH - 1:
+            tokenizer = EdiTokenizer(detect_delimiters(segment))
+            split_segment = tokenizer.split_segment
+        yield split_segment(segment)
+
+
+_WHITESPACE_BYTES = b" \t\r\n"
+_UTF8_BOM = b"\xef\xbb\xbf"
+
+
+class MappedEdiFile:
+    """
+    Memory-maps an EDI file and scans it for segments in place.
+
+    Segments are located with a compiled bytes pattern run directly over the mapping and handed out as (start, end) byte
+    offsets; nothing is copied or decoded until decode()/fields() is asked for a segment.
+    Use as a context manager, or call close(). Views returned by view() must be released
+    before closing.
+    """
+
+    def __init__(self, input_filepath, encoding: str = "utf-8"):
+        self.input_filepath = input_filepath
+        self.encoding = encoding
+        self._file = open(input_filepath, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file; an empty bytes object behaves the same for scanning
+        self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if size and hasattr(self.buffer, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.buffer.madvise(mmap.MADV_SEQUENTIAL)
+
+        start = len(_UTF8_BOM) if self.buffer[:len(_UTF8_BOM)] == _UTF8_BOM else 0
+        while start < size and self.buffer[start] in _WHITESPACE_BYTES:
+            start += 1
+        self._start = start
+        head = self.buffer[start:start + ISA_LENGTH].decode(encoding, "replace")
+        if head.startswith("ISA") and len(head) >= ISA_LENGTH:
+            delimiters = detect_delimiters(head)
+        else:
+            delimiters = EdiDelimiters()
+        logger.debug(f"Mapped {input_filepath} ({size} bytes) delimiters: {delimiters}")
+        self.tokenizer = EdiTokenizer(delimiters)
+        self.delimiters = delimiters
+        self._terminator = delimiters.segment_terminator.encode(encoding)
+        self._separator = delimiters.element_separator.encode(encoding)
+        self._escaped_terminator = (ESCAPE_CHARACTER + delimiters.segment_terminator)
+        self._escape_byte = ESCAPE_CHARACTER.encode(encoding)[0]
+        # One match per segment: group 1 is the segment ID, the match is trimmed of whitespace
+        # and stops at the terminator (escaped terminators are rejoined in iter_segment_spans)
+        terminator_class = re.escape(self._terminator)
+        self._segment_re = re.compile(
+            rb"([^" + terminator_class + re.escape(self._separator) + rb"\s]+)"
+            rb"(?:[^" + terminator_class + rb"]*[^" + terminator_class + rb"\s])?")
+
+    def __enter__(self) -> "MappedEdiFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self._file.close()
+
+    def iter_segment_spans(self) -> Iterator[Tuple[bytes, int, int]]:
+        """Yields (segment ID, start, end) per segment, terminator and surrounding whitespace excluded."""
+        buffer = self.buffer
+        escape_byte, terminator = self._escape_byte, self._terminator
+        terminator_length = len(terminator)
+        resume = 0  # matches before this offset belong to a segment with an escaped terminator
+        for match in self._segment_re.finditer(buffer, self._start):
+            start, end = match.span()
+            if start < resume:
+                continue
+            if buffer[end - 1] == escape_byte and buffer[end:end + terminator_length] == terminator:
+                position = end + terminator_length
+                while True:
+                    end = buffer.find(terminator, position)
+                    if end == -1:
+                        end = len(buffer)
+                        break
+                    if buffer[end - 1] != escape_byte:
+                        break
+                    position = end + terminator_length
+                resume = end
+                while end > start and buffer[end - 1] in _WHITESPACE_BYTES:
+                    end -= 1
+            yield match.group(1), start, end
+
+    def iter_spans(self) -> Iterator[Tuple[int, int]]:
+        """Yields the (start, end) byte offsets of every segment, terminator and surrounding whitespace excluded."""
+        for _, start, end in self.iter_segment_spans():
+            yield start, end
+
+    def segment_id(self, start: int, end: int) -> bytes:
+        """The segment ID (bytes before the first element separator), without decoding the segment."""
+        separator = self.buffer.find(self._separator, start, end)
+        return self.buffer[start:separator if separator != -1 else end]
+
+    def view(self, start: int, end: int) -> memoryview:
+        """Zero-copy view of a segment's bytes."""
+        return memoryview(self.buffer)[start:end]
+
+    def decode(self, start: int, end: int) -> str:
+        segment = self.buffer[start:end].decode(self.encoding)
+        if self._escaped_terminator in segment:
+            segment = segment.replace(self._escaped_terminator, self.delimiters.segment_terminator)
+        return segment
+
+    def fields(self, start: int, end: int) -> Tuple[str, ...]:
+        return self.tokenizer.split_segment(self.decode(start, end))
+
+    def iter_fields(self, materialize: Optional[Collection[str]] = None) -> Iterator[Tuple[str, ...]]:
+        """
+        Yields one field tuple per segment.
+
+        Args:
+            materialize: Segment IDs to decode and split. Other segments are yielded as a
+                1-tuple holding only their ID and are never decoded. None decodes everything.
+        """
+        if materialize is None:
+            for _, start, end in self.iter_segment_spans():
+                yield self.fields(start, end)
+            return
+        wanted = {segment_id.encode(self.encoding) for segment_id in materialize}
+        fields, encoding = self.fields, self.encoding
+        for identifier, start, end in self.iter_segment_spans():
+            if identifier in wanted:
+                yield fields(start, end)
+            else:
+                yield (identifier.decode(encoding),)
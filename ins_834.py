@@ -1,120 +1,843 @@
+import os
 import re
-from typing import Optional,List,Literal
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional,List,Literal,Iterable,Iterator,Sequence,Callable,Dict,Collection
 from loguru import logger
-from edi_utils import split_edi_file_to_segments
-from ins_class import INS,REF,DTP,NM1,PER,N3,N4,DMG,HD
+from pydantic import ValidationError
+import edi_utils
+import ins_metrics
+from edi_utils import split_edi_file_to_segments, iter_edi_fields, tokenize_edi_segments, DEFAULT_CHUNK_SIZE
+from edi_utils import EdiDelimiters, EdiTokenizer, EnvelopeError, EnvelopeVerifier, MappedEdiFile, SegmentEnvelopeVerifier, \
+    tokenizer_from_stream
+from ins_class import INS,REF,DTP,NM1,PER,N3,N4,DMG,HD,AMT,N1,NM1Loop,Coverage,Interchange,FunctionalGroup,TransactionSet
+from ins_class import member_to_values,member_from_values
+from ins_validation import ValidationReport
 from ins_excel import create_excel
 
 # Example usage (splitting from a file):
 input_file = "edi_x834.edi"  # Replace with your input file
 
-def parse_ins_segment(edi_segments:List[str])->List[INS]:
-    ins_segments=[]
-    ins_segments_count=0
-    current_ins_segment:INS=None
-
-    for segment in edi_segments:
-        if segment.startswith("INS*"):
-            logger.info(f"INS Segment: {segment}")
-            seg_INS=INS.from_line_ins_segment(segment)
-            seg_INS.init_INS_HD()
-            logger.info(seg_INS)
-            if current_ins_segment:
-                ins_segments.append(current_ins_segment)
-                ins_segments_count += 1
-                logger.info(f"Appended INS Segment: {ins_segments_count}")
-            current_ins_segment=seg_INS
-            # if ins_segments_count>10:
-            #     break
-        elif segment.startswith("REF*"):
-            logger.info(f"REF Segment: {segment}")
-            seg_INS_REF=REF.from_line_ins_ref_segment(segment)
-            logger.info(seg_INS_REF)
-            current_ins_segment.ref_segments.append(seg_INS_REF)
-        elif segment.startswith("DTP*"):
-            logger.info(f"DTP Segment: {segment}")
-            if not current_ins_segment:
-                logger.error("DTP Segment found without INS Segment. Ignoring it as it may be a header segment.")
-                continue
-            seg_INS_DTP=DTP.from_line_ins_dtp_segment(segment)
-            logger.info(seg_INS_DTP)
-            current_ins_segment.dtp_segments.append(seg_INS_DTP)
-        elif segment.startswith("NM1*"):
-            logger.info(f"NM1 Segment: {segment}")
-            seg_INS_NM1=NM1.from_line_ins_nm1_segment(segment)
-            logger.info(seg_INS_NM1)
-            if current_ins_segment.nm1_segment:
-                logger.info(f"Aleady an NM1 Segment exists. Overwitring it with new one.{ins_segments_count}")
-                current_ins_segment.nm1_segment.append(seg_INS_NM1)
-            else:
-                current_ins_segment.nm1_segment=seg_INS_NM1
-        elif segment.startswith("PER*"):
-            logger.info(f"PER Segment: {segment}")
-            seg_INS_PER=PER.from_line_ins_per_segment(segment)
-            logger.info(seg_INS_PER)
-            if current_ins_segment.per_segment:
-                logger.info(f"Aleady an PER Segment exists. Overwitring it with new one.{ins_segments_count}")
-                current_ins_segment.per_segment=seg_INS_PER
-            else:
-                current_ins_segment.per_segment=seg_INS_PER
-        elif segment.startswith("N3*"):
-            logger.info(f"N3 Segment: {segment}")
-            seg_INS_N3=N3.from_line_ins_n3_segment(segment)
-            logger.info(seg_INS_N3)
-            if current_ins_segment.n3_segment:
-                logger.info(f"Aleady an N3 Segment exists. Overwitring it with new one.{ins_segments_count}")
-                current_ins_segment.n3_segment=seg_INS_N3
-            else:
-                current_ins_segment.n3_segment=seg_INS_N3
-        elif segment.startswith("N4*"):
-            logger.info(f"N4 Segment: {segment}")
-            seg_INS_N4=N4.from_line_ins_n4_segment(segment)
-            logger.info(seg_INS_N4)
-            if current_ins_segment.n4_segment:
-                logger.info(f"Aleady an N4 Segment exists. Overwitring it with new one.{ins_segments_count}")
-                current_ins_segment.n4_segment=seg_INS_N4
-            else:
-                current_ins_segment.n4_segment=seg_INS_N4
-        elif segment.startswith("DMG*"):
-            logger.info(f"DMG Segment: {segment}")
-            seg_INS_DMG=DMG.from_line_ins_dmg_segment(segment)
-            logger.info(seg_INS_DMG)
-            if current_ins_segment.dmg_segment:
-                logger.info(f"Aleady an DMG Segment exists. Overwitring it with new one.{ins_segments_count}")
-                current_ins_segment.dmg_segment=seg_INS_DMG
-            else:
-                current_ins_segment.dmg_segment=seg_INS_DMG
-        elif segment.startswith("HD*"):
-            logger.info(f"HD Segment: {segment}")
-            seg_INS_HD=HD.from_line_ins_hd_segment(segment)
-            logger.info(seg_INS_HD)
-            if current_ins_segment.hd_segment:
-                logger.info(f"Aleady an HD Segment exists. Overwitring it with new one.{ins_segments_count}")
-                current_ins_segment.hd_segment=seg_INS_HD
-            else:
-                current_ins_segment.hd_segment=seg_INS_HD
+class InsParseState:
+    """Mutable parser state threaded through the segment handlers.
+
+    Tracks the open loop at every level (interchange, functional group, transaction set,
+    member, NM1 sub-loop, coverage) so each segment is attached where it belongs with O(1) work.
+    Envelopes and header loops are always modeled (they are few); completed members are
+    only kept in their TransactionSet when build_tree is set (see parse_interchanges),
+    otherwise they are just yielded and memory stays bounded by one member.
+    Unless verify_envelopes is off (for callers that parse part of a file), the
+    ISA/GS/ST/SE/GE/IEA control counts and numbers are checked as they are read and an
+    edi_utils.EnvelopeError is raised on the first mismatch or at the end of truncated input.
+    """
+    def __init__(self, trusted:bool=False, log_summary:bool=True, build_tree:bool=False, verify_envelopes:bool=True):
+        self.trusted=trusted
+        self.log_summary=log_summary
+        self.build_tree=build_tree
+        self.loop_id:Optional[str]=None  # e.g. "ISA", "1000A", "2000", "2100C", "2300"
+        self.interchanges:List[Interchange]=[]
+        self.current_interchange:Optional[Interchange]=None
+        self.current_group:Optional[FunctionalGroup]=None
+        self.current_transaction_set:Optional[TransactionSet]=None
+        self.current_ins_segment:INS=None
+        self.current_name_loop:Optional[NM1Loop]=None
+        self.current_coverage:Optional[Coverage]=None
+        self.in_reporting_category=False  # inside the member's 2700/2750 loops, which are not modeled
+        self.in_skipped_loop=False  # inside an HD or NM1 sub-loop a query does not build (see query_handlers)
+        self.skipping_member=False  # inside a member a query filtered out
+        self.members_skipped=0
+        self.ins_segments_count=0
+        self.transaction_set_control_number:Optional[str]=None
+        self.transaction_set_start_count=0
+        self.transaction_set_open=False
+        self.transaction_sets_count=0
+        self.segment_counts:Counter=Counter()
+        self.envelopes:Optional[EnvelopeVerifier]=EnvelopeVerifier() if verify_envelopes else None
+
+
+# A segment handler receives the parser state and the segment's field tuple. It returns
+# the member that was completed by this segment (only INS does so), or None.
+SegmentHandler=Callable[[InsParseState,Sequence[str]],Optional[INS]]
+
+SEGMENT_HANDLERS:Dict[str,SegmentHandler]={}
+
+
+def register_segment_handler(*segment_ids:str):
+    """Decorator registering a handler for one or more segment IDs (e.g. "AMT", "LUI").
+
+    Registering an ID that already has a handler replaces it.
+    """
+    def decorator(handler:SegmentHandler)->SegmentHandler:
+        for segment_id in segment_ids:
+            SEGMENT_HANDLERS[segment_id]=handler
+        return handler
+    return decorator
+
+
+def _log_segment(fields:Sequence[str], model=None)->None:
+    # Only called behind an edi_utils.SEGMENT_LOGGING check; loguru formats the
+    # arguments only if a sink accepts DEBUG.
+    logger.debug("{} Segment: {} -> {!r}", fields[0], fields, model)
+
+
+def _complete_current_member(state:InsParseState)->Optional[INS]:
+    completed=state.current_ins_segment
+    if completed:
+        state.ins_segments_count += 1
+        if state.build_tree and state.current_transaction_set is not None:
+            state.current_transaction_set.members.append(completed)
+    state.current_ins_segment=None
+    state.current_name_loop=None
+    state.current_coverage=None
+    state.in_reporting_category=False
+    state.in_skipped_loop=False
+    state.skipping_member=False
+    return completed
+
+
+def _log_transaction_set_summary(state:InsParseState)->None:
+    if not state.log_summary:
+        return
+    members=state.ins_segments_count-state.transaction_set_start_count
+    logger.info(f"Transaction set {state.transaction_set_control_number}: {members} members, "
+                f"segment counts {dict(state.segment_counts)}")
+
+
+def handle_unknown_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        logger.debug("Unknown Segment: {}", fields)
+    return None
+
+
+def _member_or_none(state:InsParseState, segment_id:str)->Optional[INS]:
+    if not state.current_ins_segment and not state.skipping_member:
+        logger.error(f"{segment_id} Segment found without INS Segment. Ignoring it as it may be a header segment.")
+    return state.current_ins_segment
+
+
+def _replace_member_segment(state:InsParseState, attr:str, segment_id:str, value)->None:
+    # PER/N3/N4/DMG following an NM1 sub-loop belong to that loop, not to the member name (2100A)
+    if state.in_skipped_loop:
+        return
+    target=state.current_name_loop or state.current_ins_segment
+    if edi_utils.SEGMENT_LOGGING and getattr(target, attr):
+        logger.debug("Aleady an {} Segment exists. Overwitring it with new one.{}", segment_id, state.ins_segments_count)
+    setattr(target, attr, value)
+
+
+def _child_target(state:InsParseState, segment_id:str):
+    """Where a REF/DTP/AMT belongs: the open coverage (2300), else the member (2000), else the
+    transaction set header before the first member. None if it is to be ignored."""
+    target=state.current_coverage or state.current_ins_segment
+    if target is None:
+        if state.skipping_member:
+            return None
+        target=state.current_transaction_set
+        if target is None:
+            logger.error(f"{segment_id} Segment found without INS Segment. Ignoring it as it may be a header segment.")
+        return target
+    if state.in_reporting_category or state.in_skipped_loop:
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug("{} Segment in a reporting category or skipped loop. Ignoring it.", segment_id)
+        return None
+    return target
+
+
+@register_segment_handler("INS")
+def handle_ins_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    return _start_member(state, INS.from_fields_ins_segment(fields, state.trusted), fields)
+
+
+def _start_member(state:InsParseState, seg_INS:INS, fields:Sequence[str])->Optional[INS]:
+    seg_INS.init_INS_HD()
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS)
+    completed=_complete_current_member(state)
+    state.current_ins_segment=seg_INS
+    state.loop_id="2000"
+    return completed
+
+
+@register_segment_handler("REF")
+def handle_ref_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    target=_child_target(state, "REF")
+    if target is None:
+        return None
+    seg_INS_REF=REF.from_fields_ins_ref_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_REF)
+    target.ref_segments.append(seg_INS_REF)
+    return None
+
+
+@register_segment_handler("DTP")
+def handle_dtp_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    target=_child_target(state, "DTP")
+    if target is None:
+        return None
+    seg_INS_DTP=DTP.from_fields_ins_dtp_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_DTP)
+    target.dtp_segments.append(seg_INS_DTP)
+    return None
+
+
+@register_segment_handler("AMT")
+def handle_amt_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    coverage=state.current_coverage
+    if coverage is None:
+        # Member level (2100A) and header amounts are not modeled
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug("AMT Segment outside of a coverage loop. Ignoring it: {}", fields)
+        return None
+    seg_INS_AMT=AMT.from_fields_ins_amt_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_AMT)
+    coverage.amt_segments.append(seg_INS_AMT)
+    return None
+
+
+@register_segment_handler("NM1")
+def handle_nm1_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if not _member_or_none(state, "NM1"):
+        return None
+    seg_INS_NM1=NM1.from_fields_ins_nm1_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_NM1)
+    state.in_skipped_loop=False
+    current_ins_segment=state.current_ins_segment
+    if current_ins_segment.nm1_segment is None:
+        # The member's first NM1 is its name (2100A, NM1*IL or NM1*74)
+        current_ins_segment.nm1_segment=seg_INS_NM1
+        state.current_name_loop=None
+        state.loop_id="2100A"
+    else:
+        # Any further NM1 opens a sub-loop (2100B-2100H, 2310) that owns the PER/N3/N4/DMG after it
+        nm1_loop=NM1Loop.from_nm1(seg_INS_NM1, state.trusted)
+        current_ins_segment.nm1_loops.append(nm1_loop)
+        state.current_name_loop=nm1_loop
+        state.loop_id=nm1_loop.loop_id
+    return None
+
+
+@register_segment_handler("PER")
+def handle_per_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if not _member_or_none(state, "PER"):
+        return None
+    seg_INS_PER=PER.from_fields_ins_per_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_PER)
+    _replace_member_segment(state, "per_segment", "PER", seg_INS_PER)
+    return None
+
+
+@register_segment_handler("N3")
+def handle_n3_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if not _member_or_none(state, "N3"):
+        return None
+    seg_INS_N3=N3.from_fields_ins_n3_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_N3)
+    _replace_member_segment(state, "n3_segment", "N3", seg_INS_N3)
+    return None
+
+
+@register_segment_handler("N4")
+def handle_n4_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if not _member_or_none(state, "N4"):
+        return None
+    seg_INS_N4=N4.from_fields_ins_n4_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_N4)
+    _replace_member_segment(state, "n4_segment", "N4", seg_INS_N4)
+    return None
+
+
+@register_segment_handler("DMG")
+def handle_dmg_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if not _member_or_none(state, "DMG"):
+        return None
+    seg_INS_DMG=DMG.from_fields_ins_dmg_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_DMG)
+    _replace_member_segment(state, "dmg_segment", "DMG", seg_INS_DMG)
+    return None
+
+
+@register_segment_handler("HD")
+def handle_hd_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if not _member_or_none(state, "HD"):
+        return None
+    seg_INS_HD=HD.from_fields_ins_hd_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_INS_HD)
+    # Each HD starts a coverage loop (2300); the DTP/AMT/REF after it belong to that coverage
+    coverage=Coverage.from_hd(seg_INS_HD, state.trusted)
+    state.in_skipped_loop=False
+    current_ins_segment=state.current_ins_segment
+    current_ins_segment.coverages.append(coverage)
+    if current_ins_segment.hd_segment is None:
+        current_ins_segment.hd_segment=seg_INS_HD
+    state.current_coverage=coverage
+    state.current_name_loop=None
+    state.loop_id="2300"
+    return None
+
+
+@register_segment_handler("LX")
+def handle_lx_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.current_ins_segment is not None:
+        # LX starts the member's reporting categories (2700), after all of its coverages
+        state.current_coverage=None
+        state.current_name_loop=None
+        state.in_reporting_category=True
+        state.loop_id="2700"
+    return None
+
+
+# N1 entity identifier code -> header loop
+_N1_LOOP_IDS={"P5":"1000A", "IN":"1000B"}
+
+
+@register_segment_handler("N1")
+def handle_n1_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if state.current_ins_segment is not None:
+        # N1 inside a member is a 2750 reporting category, which is not modeled
+        if edi_utils.SEGMENT_LOGGING:
+            _log_segment(fields)
+        state.in_reporting_category=True
+        state.loop_id="2750"
+        return None
+    if state.skipping_member:
+        return None  # 2750 loop of a member a query filtered out
+    transaction_set=state.current_transaction_set
+    if transaction_set is None:
+        logger.error(f"N1 Segment found outside of a transaction set. Ignoring it: {fields}")
+        return None
+    seg_N1=N1.from_fields_n1_segment(fields, state.trusted)
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields, seg_N1)
+    state.loop_id=_N1_LOOP_IDS.get(seg_N1.entity_identifier_code, "1000C")
+    if state.loop_id=="1000A":
+        transaction_set.sponsor=seg_N1
+    elif state.loop_id=="1000B":
+        transaction_set.payer=seg_N1
+    else:
+        transaction_set.brokers.append(seg_N1)
+    return None
+
+
+@register_segment_handler("ISA")
+def handle_isa_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.envelopes is not None:
+        state.envelopes.isa(fields)
+    state.current_interchange=Interchange.from_fields_isa_segment(fields)
+    state.interchanges.append(state.current_interchange)
+    state.current_group=None
+    state.current_transaction_set=None
+    state.loop_id="ISA"
+    return None
+
+
+@register_segment_handler("GS")
+def handle_gs_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.envelopes is not None:
+        state.envelopes.gs(fields)
+    state.current_group=FunctionalGroup.from_fields_gs_segment(fields)
+    if state.current_interchange is not None:
+        state.current_interchange.functional_groups.append(state.current_group)
+    state.current_transaction_set=None
+    state.loop_id="GS"
+    return None
+
+
+@register_segment_handler("BGN")
+def handle_bgn_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.current_transaction_set is not None:
+        state.current_transaction_set.set_bgn(fields)
+    return None
+
+
+@register_segment_handler("ST")
+def handle_st_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.envelopes is not None:
+        state.envelopes.st(fields)
+    state.transaction_set_control_number=fields[2] if len(fields)>2 else None
+    state.transaction_set_start_count=state.ins_segments_count
+    state.transaction_set_open=True
+    state.transaction_sets_count+=1
+    state.segment_counts=Counter(ST=1)
+    state.current_transaction_set=TransactionSet.from_fields_st_segment(fields)
+    if state.current_group is not None:
+        state.current_group.transaction_sets.append(state.current_transaction_set)
+    state.loop_id="ST"
+    return None
+
+
+@register_segment_handler("SE")
+def handle_se_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.envelopes is not None:
+        # segment_counts restarts at ST and already counts this SE: SE01 is its total
+        state.envelopes.se(fields, sum(state.segment_counts.values()))
+    # SE closes the last member loop of the transaction set
+    completed=_complete_current_member(state)
+    _log_transaction_set_summary(state)
+    state.transaction_set_open=False
+    state.current_transaction_set=None
+    state.loop_id="GS"
+    return completed
+
+
+@register_segment_handler("GE")
+def handle_ge_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.envelopes is not None:
+        state.envelopes.ge(fields)
+    state.current_group=None
+    state.loop_id="ISA"
+    return None
+
+
+@register_segment_handler("IEA")
+def handle_iea_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    if state.envelopes is not None:
+        state.envelopes.iea(fields)
+    state.current_interchange=None
+    state.loop_id=None
+    return None
+
+
+def handle_envelope_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    """Handler for segments that are only counted; iter_ins_mapped does not decode them."""
+    if edi_utils.SEGMENT_LOGGING:
+        _log_segment(fields)
+    return None
+
+
+# Appended to a segment that failed validation before it is rebuilt trusted, so required
+# elements missing from a short segment read as empty instead of raising IndexError
+_MISSING_ELEMENTS=("",)*16
+
+
+def _recover_segment(state:InsParseState, handler:SegmentHandler, fields:Sequence[str], segment_index:int,
+                     error:Exception, report:ValidationReport)->Optional[INS]:
+    """Records a segment that failed validation and runs its handler again without validation.
+
+    EnvelopeVerifier has already moved on when it raises, so the handler reruns without it."""
+    trusted, envelopes=state.trusted, state.envelopes
+    state.trusted=True
+    state.envelopes=None
+    try:
+        completed=handler(state, tuple(fields)+_MISSING_ELEMENTS)
+    except Exception:
+        logger.exception(f"Segment {segment_index} could not be rebuilt either. Skipping it: {fields}")
+        report.segments_skipped+=1
+        completed=None
+    finally:
+        state.trusted=trusted
+        state.envelopes=envelopes
+    # Recorded after the retry, so a failed INS is attributed to the member it starts
+    member_seq=state.ins_segments_count+1 if state.current_ins_segment is not None else None
+    report.record(segment_index, fields, error, member_seq)
+    return completed
+
+
+def iter_ins_fields(edi_fields:Iterable[Sequence[str]], handlers:Optional[Dict[str,SegmentHandler]]=None, trusted:bool=False,
+                    log_summary:bool=True, state:Optional[InsParseState]=None,
+                    report:Optional[ValidationReport]=None)->Iterator[INS]:
+    """Yields each INS member once all of its child segments have been read.
+
+    Accepts any iterable of pre-split field tuples (e.g. edi_utils.iter_edi_fields), so a
+    file can be parsed end to end holding only the current member in memory. Each segment
+    is routed by a single dict lookup on its ID (fields[0]) into handlers, which defaults
+    to the SEGMENT_HANDLERS registry. Summary counts are logged once per transaction set.
+    trusted=True builds the segment models without validation (see ins_class).
+    log_summary=False suppresses the summary logs, for callers that parse part of a file.
+    state lets the caller supply (and afterwards inspect) the parser state, e.g. the
+    envelopes it modeled; its trusted and log_summary settings then apply.
+    report collects segments that fail validation (see ins_validation) instead of raising:
+    they are rebuilt without validation and parsing continues.
+    """
+    state=state or InsParseState(trusted, log_summary)
+    get_handler=(SEGMENT_HANDLERS if handlers is None else handlers).get
+
+    metrics=ins_metrics.ACTIVE
+    if report is not None:
+        # Collecting validation: same loop, catching per segment (handler timings are not recorded)
+        for segment_index, fields in enumerate(edi_fields, 1):
+            segment_id=fields[0]
+            state.segment_counts[segment_id]+=1
+            handler=get_handler(segment_id, handle_unknown_segment)
+            try:
+                completed=handler(state, fields)
+            except (ValidationError, IndexError, EnvelopeError) as e:
+                if metrics is not None:
+                    metrics.inc("edi_validation_errors_total", segment_id)
+                completed=_recover_segment(state, handler, fields, segment_index, e, report)
+            if completed is not None:
+                yield completed
+    elif metrics is None:
+        for fields in edi_fields:
+            segment_id=fields[0]
+            state.segment_counts[segment_id]+=1
+            completed=get_handler(segment_id, handle_unknown_segment)(state, fields)
+            if completed is not None:
+                yield completed
+    else:
+        # Same loop, timing each handler call (see ins_metrics)
+        parse_times=metrics.histograms["edi_segment_parse_seconds"]
+        clock=time.perf_counter_ns
+        parse_ns=0
+        try:
+            for fields in edi_fields:
+                segment_id=fields[0]
+                state.segment_counts[segment_id]+=1
+                started=clock()
+                try:
+                    completed=get_handler(segment_id, handle_unknown_segment)(state, fields)
+                except ValidationError:
+                    metrics.inc("edi_validation_errors_total", segment_id)
+                    raise
+                elapsed=clock()-started
+                parse_ns+=elapsed
+                histogram=parse_times[segment_id]  # Histogram.observe, inlined
+                histogram.buckets[elapsed.bit_length()]+=1
+                histogram.sum_ns+=elapsed
+                if completed is not None:
+                    yield completed
+        finally:
+            # Segments seen come from the parser's own counts instead of a second counter per segment
+            for segment_id, count in state.segment_counts.items():
+                metrics.inc("edi_segments_total", segment_id, count)
+            metrics.inc("edi_stage_seconds_total", "parse", parse_ns/1e9)
+            metrics.inc("edi_stage_items_total", "parse", state.ins_segments_count)
+
+    if state.envelopes is not None:
+        # Truncated input is rejected before its last member is handed out
+        try:
+            state.envelopes.finish()
+        except EnvelopeError as e:
+            if report is None:
+                raise
+            report.record(None, (e.segment_id,), e, None)
+    completed=_complete_current_member(state)
+    if state.log_summary and (state.transaction_set_open or not state.transaction_sets_count):
+        # Input without a closing SE (truncated, or bare segments) still gets its summary
+        _log_transaction_set_summary(state)
+    if completed is not None:
+        yield completed
+    if state.log_summary:
+        logger.info(f"Parsed {state.ins_segments_count} INS members")
+
+
+def iter_ins_segments(edi_segments:Iterable[str], report:Optional[ValidationReport]=None)->Iterator[INS]:
+    """Same as iter_ins_fields for segments that have not been split into fields yet."""
+    return iter_ins_fields(tokenize_edi_segments(edi_segments), report=report)
+
+
+def iter_ins_file(input_filepath, chunk_size:int=DEFAULT_CHUNK_SIZE, trusted:bool=False)->Iterator[INS]:
+    """Streams the members of an 834 file, using the delimiters declared in its ISA header."""
+    return iter_ins_fields(iter_edi_fields(input_filepath, chunk_size), trusted=trusted)
+
+
+def parse_interchanges(edi_fields:Iterable[Sequence[str]], trusted:bool=False)->List[Interchange]:
+    """Parses an 834 into its loop hierarchy in one pass.
+
+    Interchange -> FunctionalGroup -> TransactionSet (BGN, header REF/DTP, 1000A sponsor,
+    1000B payer, 1000C brokers) -> INS members -> NM1 sub-loops and coverages (2300 HD
+    with its DTP/AMT/REF). Members read outside of
+    any ST/SE are not part of the tree. The whole file is held in memory; use
+    iter_ins_fields to stream members instead.
+    """
+    state=InsParseState(trusted, build_tree=True)
+    deque(iter_ins_fields(edi_fields, state=state), maxlen=0)
+    return state.interchanges
+
+
+def parse_interchanges_file(input_filepath, chunk_size:int=DEFAULT_CHUNK_SIZE, trusted:bool=False)->List[Interchange]:
+    """Same as parse_interchanges for an 834 file, using the delimiters declared in its ISA header."""
+    return parse_interchanges(iter_edi_fields(input_filepath, chunk_size), trusted)
+
+
+def iter_ins_mapped(input_filepath, handlers:Optional[Dict[str,SegmentHandler]]=None, trusted:bool=False)->Iterator[INS]:
+    """Same members as iter_ins_file, scanning a memory-mapped file in place.
+
+    Only segments whose handler needs their elements are decoded and split; unknown
+    segment IDs (and any routed to handle_envelope_segment) are counted from their ID
+    alone (unless per-segment logging is on).
+    """
+    handlers=SEGMENT_HANDLERS if handlers is None else handlers
+    materialize=None
+    if not edi_utils.SEGMENT_LOGGING:
+        materialize={segment_id for segment_id, handler in handlers.items() if handler is not handle_envelope_segment}
+    with MappedEdiFile(input_filepath) as edi:
+        fields=edi.iter_fields(materialize)
+        try:
+            yield from iter_ins_fields(fields, handlers, trusted)
+        finally:
+            fields.close()  # releases the scan's hold on the mapping, which cannot be closed while exported
+
+
+def iter_ins_validated(input_filepath, report:ValidationReport, handlers:Optional[Dict[str,SegmentHandler]]=None)->Iterator[INS]:
+    """Same members as iter_ins_mapped, collecting validation failures into report instead of
+    raising; each issue carries the byte offset of its segment in the file."""
+    with MappedEdiFile(input_filepath) as edi:
+        def iter_fields_at_offsets()->Iterator[Sequence[str]]:
+            fields=edi.fields
+            for _, start, end in edi.iter_segment_spans():
+                report.byte_offset=start
+                yield fields(start, end)
+        fields=iter_fields_at_offsets()
+        try:
+            yield from iter_ins_fields(fields, handlers, report=report)
+        finally:
+            fields.close()
+
+
+# Filter / projection pushdown
+#
+# A query names the child segment types to build and an INS predicate. Segment types that
+# are not wanted are routed to the skip handlers below, which keep the loop structure right
+# (coverage and NM1 sub-loop boundaries, reporting categories) from the segment ID alone, so
+# their elements are never read. The predicate sees the bare INS before any child segment
+# is read; a member that fails it is dropped with all of its loops.
+
+# Segments every query parses: member boundaries and the envelopes (see EnvelopeVerifier)
+QUERY_REQUIRED_SEGMENTS=frozenset({"INS","ISA","GS","ST","SE","GE","IEA"})
+# Segments that end the loop of a member a query filtered out
+_MEMBER_END_SEGMENT_IDS=frozenset({b"INS",b"SE",b"ST",b"GS",b"GE",b"ISA",b"IEA"})
+
+
+def handle_skipped_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    return None
+
+
+def handle_skipped_hd_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    # The coverage loop (2300) is not built, and neither are its DTP/AMT/REF
+    if state.current_ins_segment is not None:
+        state.current_coverage=None
+        state.current_name_loop=None
+        state.in_skipped_loop=True
+        state.loop_id="2300"
+    return None
+
+
+def handle_skipped_nm1_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if state.current_ins_segment is None:
+        return None
+    state.current_name_loop=None
+    if state.loop_id=="2000":
+        # The member's first NM1 (2100A): its PER/N3/N4/DMG still belong to the member
+        state.in_skipped_loop=False
+        state.loop_id="2100A"
+    else:
+        # An NM1 sub-loop, whose PER/N3/N4/DMG are not built either
+        state.in_skipped_loop=True
+        state.loop_id="2100"
+    return None
+
+
+def handle_skipped_n1_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+    if state.current_ins_segment is not None:
+        state.in_reporting_category=True
+        state.loop_id="2750"
+    return None
+
+
+_SKIPPED_SEGMENT_HANDLERS:Dict[str,SegmentHandler]={
+    "HD":handle_skipped_hd_segment, "NM1":handle_skipped_nm1_segment, "N1":handle_skipped_n1_segment,
+}
+# Handlers that only look at the segment ID; iter_ins_query does not decode their segments
+_FIELDLESS_HANDLERS=frozenset({handle_envelope_segment, handle_lx_segment, handle_skipped_segment,
+                               handle_skipped_hd_segment, handle_skipped_nm1_segment, handle_skipped_n1_segment})
+
+
+def _filtering_ins_handler(where:Callable[[INS],bool])->SegmentHandler:
+    def handle_filtered_ins_segment(state:InsParseState, fields:Sequence[str])->Optional[INS]:
+        seg_INS=INS.from_fields_ins_segment(fields, state.trusted)
+        if where(seg_INS):
+            return _start_member(state, seg_INS, fields)
+        completed=_complete_current_member(state)
+        state.skipping_member=True
+        state.members_skipped+=1
+        return completed
+    return handle_filtered_ins_segment
+
+
+def query_handlers(segments:Optional[Collection[str]]=None, where:Optional[Callable[[INS],bool]]=None,
+                   handlers:Optional[Dict[str,SegmentHandler]]=None)->Dict[str,SegmentHandler]:
+    """Handler table for a query, usable with iter_ins_fields as well as iter_ins_query.
+
+    Args:
+        segments: Child segment IDs to build, e.g. {"NM1", "DMG"}; None builds all of them.
+            INS and the envelopes are always parsed; coverage DTP/AMT/REF need "HD", NM1
+            sub-loops and their PER/N3/N4/DMG need "NM1".
+        where: Predicate on the bare INS (its children are not read yet), e.g.
+            lambda ins: ins.maintenance_type_code=="024". Members failing it are dropped.
+        handlers: Table to start from (default: the SEGMENT_HANDLERS registry). Custom
+            handlers of unwanted segment IDs are replaced by handle_skipped_segment.
+    """
+    table=dict(SEGMENT_HANDLERS if handlers is None else handlers)
+    if segments is not None:
+        for segment_id, handler in table.items():
+            if segment_id not in segments and segment_id not in QUERY_REQUIRED_SEGMENTS and handler not in _FIELDLESS_HANDLERS:
+                table[segment_id]=_SKIPPED_SEGMENT_HANDLERS.get(segment_id, handle_skipped_segment)
+    if where is not None:
+        table["INS"]=_filtering_ins_handler(where)
+    return table
+
+
+def _iter_query_fields(edi:MappedEdiFile, state:InsParseState, materialize:Optional[Collection[str]])->Iterator[Sequence[str]]:
+    # Like MappedEdiFile.iter_fields, and the segments of a filtered-out member are only
+    # counted (for the SE01 check), neither decoded nor handed to the parser
+    wanted=None if materialize is None else {segment_id.encode(edi.encoding) for segment_id in materialize}
+    fields, encoding=edi.fields, edi.encoding
+    for identifier, start, end in edi.iter_segment_spans():
+        if state.skipping_member and identifier not in _MEMBER_END_SEGMENT_IDS:
+            state.segment_counts[identifier.decode(encoding)]+=1
+        elif wanted is None or identifier in wanted:
+            yield fields(start, end)
         else:
-            if segment.startswith("ISA*"):
-                logger.info(f"ISA Segment: {segment}")
-            elif segment.startswith("GS*"):
-                logger.info(f"GS Segment: {segment}")
-            elif segment.startswith("ST*"):
-                logger.info(f"ST Segment: {segment}")
-            elif segment.startswith("SE*"):
-                logger.info(f"SE Segment: {segment}")
-            elif segment.startswith("GE*"):
-                logger.info(f"GE Segment: {segment}")
-            elif segment.startswith("IEA*"):
-                logger.info(f"IEA Segment: {segment}")
-            elif segment.startswith("BGN*"):
-                logger.info(f"BGN Segment: {segment}")
-            else:
-                logger.info(f"Unknown Segment: {segment}")
-    return ins_segments
-
-
-if __name__=="main":
-    edi_segments=split_edi_file_to_segments("../edi_x834.edi")
+            yield (identifier.decode(encoding),)
+
+
+def iter_ins_query(input_filepath, where:Optional[Callable[[INS],bool]]=None, segments:Optional[Collection[str]]=None,
+                   trusted:bool=False, handlers:Optional[Dict[str,SegmentHandler]]=None)->Iterator[INS]:
+    """Streams the members of a memory-mapped 834 file that pass where, building only the wanted segments.
+
+    Segments routed to a skip handler (see query_handlers) are never decoded; neither is
+    anything inside a member that fails where. Members keep the usual shape, with unwanted
+    segments absent (None / empty lists), e.g.
+
+        iter_ins_query(path, where=lambda ins: ins.maintenance_type_code=="024", segments={"NM1", "DMG"})
+    """
+    handlers=query_handlers(segments, where, handlers)
+    materialize=None
+    if not edi_utils.SEGMENT_LOGGING:
+        materialize={segment_id for segment_id, handler in handlers.items() if handler not in _FIELDLESS_HANDLERS}
+    state=InsParseState(trusted)
+    with MappedEdiFile(input_filepath) as edi:
+        fields=_iter_query_fields(edi, state, materialize)
+        try:
+            yield from iter_ins_fields(fields, handlers, state=state)
+        finally:
+            fields.close()
+    if where is not None:
+        logger.info(f"Query skipped {state.members_skipped} INS members")
+
+
+DEFAULT_PARALLEL_CHUNK_MEMBERS=2000
+
+
+def parse_segment_chunk(delimiters:EdiDelimiters, segments:List[str], trusted:bool=False)->List[tuple]:
+    """Tokenizes and parses one chunk of INS loops; the worker side of iter_ins_file_parallel and ins_pipeline.
+
+    Members are returned as ins_class.member_to_values tuples, which pickle much faster
+    than the models; the parent rebuilds them without re-validating.
+    """
+    split_segment=EdiTokenizer(delimiters).split_segment
+    # Chunks are cut inside the envelopes, which are only whole in the parent's segment stream
+    state=InsParseState(trusted, log_summary=False, verify_envelopes=False)
+    return [member_to_values(ins) for ins in iter_ins_fields(map(split_segment, segments), state=state)]
+
+
+def _iter_segment_chunks(segments:Iterable[str], ins_prefix:str, chunk_members:int)->Iterator[List[str]]:
+    """Groups segments into chunks of chunk_members INS loops, always cut right before an INS.
+
+    The parser state at an INS is the same whatever came before it (the previous member is
+    completed, the new one starts empty), so each chunk parses identically in isolation.
+    """
+    chunk=[]
+    members=0
+    for segment in segments:
+        if segment.startswith(ins_prefix):
+            if members==chunk_members:
+                yield chunk
+                chunk=[]
+                members=0
+            members+=1
+        chunk.append(segment)
+    if chunk:
+        yield chunk
+
+
+def _iter_verified_segments(envelopes:SegmentEnvelopeVerifier, segments:Iterable[str])->Iterator[str]:
+    yield from envelopes.verify(segments)
+    # Raised before the last chunk is cut, so truncated input never hands out its last members
+    envelopes.finish()
+
+
+def iter_ins_file_parallel(input_filepath, workers:Optional[int]=None, chunk_members:int=DEFAULT_PARALLEL_CHUNK_MEMBERS,
+                           chunk_size:int=DEFAULT_CHUNK_SIZE, trusted:bool=False)->Iterator[INS]:
+    """Parses an 834 file in a process pool, yielding the same members in the same order as iter_ins_file.
+
+    The main process only splits the file into segments, verifies the envelopes (raising
+    edi_utils.EnvelopeError like iter_ins_file) and cuts the segments into chunks at INS
+    boundaries; workers split fields and build the models. At most 2 * workers chunks are
+    in flight, so memory stays bounded for any file size.
+
+    Args:
+        input_filepath: Path to the input EDI file.
+        workers: Number of worker processes (default: os.cpu_count()).
+        chunk_members: INS loops per chunk sent to a worker.
+        chunk_size: Number of characters read per file read.
+        trusted: Build the models without validation (see ins_class).
+    Note:
+        Workers use the default SEGMENT_HANDLERS registry as it is after importing ins_834;
+        handlers registered at runtime in the parent only reach workers on fork start.
+    """
+    workers=workers or os.cpu_count() or 1
+    if chunk_members<=0:
+        raise ValueError(f"chunk_members must be positive, got {chunk_members}")
+
+    with open(input_filepath, 'r', newline=None) as infile:
+        tokenizer, head=tokenizer_from_stream(infile, chunk_size)
+        delimiters=tokenizer.delimiters
+        # Workers get chunks cut inside the envelopes, so the envelopes are verified here
+        envelopes=SegmentEnvelopeVerifier(tokenizer)
+        chunks=_iter_segment_chunks(_iter_verified_segments(envelopes, tokenizer.iter_segments(infile, chunk_size, head)),
+                                    "INS"+delimiters.element_separator, chunk_members)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending=deque()
+            members=0
+            for chunk in chunks:
+                pending.append(executor.submit(parse_segment_chunk, delimiters, chunk, trusted))
+                if len(pending)>=2*workers:
+                    for values in pending.popleft().result():
+                        members+=1
+                        yield member_from_values(values)
+            while pending:
+                for values in pending.popleft().result():
+                    members+=1
+                    yield member_from_values(values)
+    logger.info(f"Parsed {members} INS members with {workers} workers")
+
+
+def parse_ins_segment(edi_segments:Iterable[str], report:Optional[ValidationReport]=None)->List[INS]:
+    return list(iter_ins_segments(edi_segments, report))
+
+
+if __name__=="__main__":
+    # Single file: python ins_834.py [file]; for a directory of files see ins_batch.py
+    input_file=sys.argv[1] if len(sys.argv)>1 else input_file
+    edi_segments=split_edi_file_to_segments(input_file)
     logger.info(f"total count of segments: {len(edi_segments)}")
     ins_segments=parse_ins_segment(edi_segments)
     logger.info(f"total count of segments: {len(ins_segments)}")
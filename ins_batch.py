@@ -0,0 +1,204 @@
+import argparse
+import glob
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from loguru import logger
+from typing import Iterable, List, NamedTuple, Optional
+
+import ins_metrics
+from ins_834 import iter_ins_file
+from ins_excel import create_excel_streaming
+
+# Batch driver for a night's worth of 834 files (one per group/carrier).
+#
+# Each file is parsed and exported in its own worker process; at most `jobs` files are
+# processed at once. Files whose output is newer than the input are skipped, so a rerun
+# after a failure only redoes what is missing or out of date.
+
+FORMATS = ("xlsx", "parquet")
+_MB = 1024 * 1024
+# ins_parquet.TABLE_SCHEMAS, without importing pyarrow
+_PARQUET_TABLES = ("members", "ref", "dtp", "coverage", "coverage_dtp", "coverage_amt", "coverage_ref")
+
+
+class BatchResult(NamedTuple):
+    """Outcome of one input file."""
+    input_path: str
+    output_path: str
+    status: str  # "done", "skipped" or "failed"
+    members: int = 0
+    seconds: float = 0.0
+    input_bytes: int = 0
+    error: Optional[str] = None
+
+
+def find_input_files(inputs: Iterable[str]) -> List[str]:
+    """Expands directories (all regular files in them) and glob patterns, without duplicates."""
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            matches = sorted(glob.glob(pattern))
+        files.extend(path for path in matches if os.path.isfile(path) and not path.endswith(".insidx"))
+    return list(dict.fromkeys(files))
+
+
+def output_path_for(input_path: str, output_dir: str, output_format: str) -> str:
+    """<output_dir>/<input name without extension>.xlsx, or a directory of that name for parquet."""
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(input_path))[0])
+    return base + ".xlsx" if output_format == "xlsx" else base
+
+
+def _output_mtime(output_path: str, output_format: str) -> Optional[float]:
+    # A parquet output is only complete once all of its tables are written
+    paths = [output_path] if output_format == "xlsx" else \
+        [os.path.join(output_path, f"{name}.parquet") for name in _PARQUET_TABLES]
+    if not all(os.path.isfile(path) for path in paths):
+        return None
+    return min(os.path.getmtime(path) for path in paths)
+
+
+def partial_path_for(output_path: str) -> str:
+    """Where an export is written until it is complete: <output>.partial<ext>."""
+    base, ext = os.path.splitext(output_path)
+    return f"{base}.partial{ext}"
+
+
+def remove_output(path: str) -> None:
+    """Removes an exported file or parquet directory, if present."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def replace_output(partial_path: str, output_path: str) -> None:
+    """Moves a completed export from partial_path to output_path, replacing an older output."""
+    if os.path.isdir(partial_path):
+        remove_output(output_path)  # os.replace cannot replace a non-empty directory
+    os.replace(partial_path, output_path)
+
+
+def is_up_to_date(input_path: str, output_path: str, output_format: str) -> bool:
+    output_mtime = _output_mtime(output_path, output_format)
+    return output_mtime is not None and output_mtime > os.path.getmtime(input_path)
+
+
+def process_file(input_path: str, output_path: str, output_format: str = "xlsx", trusted: bool = False,
+                 metrics: bool = False) -> BatchResult:
+    """Parses one 834 file and exports it. Runs in a worker process; errors are returned, not raised.
+
+    The export is written to <output>.partial and only renamed to output_path once it is
+    complete, so a failed run never leaves an output that is_up_to_date would accept.
+    With metrics=True the run's ins_metrics are written to <output>.metrics.json and <output>.prom.
+    """
+    input_bytes = os.path.getsize(input_path)
+    partial_path = partial_path_for(output_path)
+    started = time.perf_counter()
+    try:
+        remove_output(partial_path)
+        with ins_metrics.collect_metrics(output_path + ".metrics.json", output_path + ".prom",
+                                         file=os.path.basename(input_path)) if metrics else nullcontext():
+            members = iter_ins_file(input_path, trusted=trusted)
+            if output_format == "xlsx":
+                count = create_excel_streaming(members, partial_path)
+            else:
+                from ins_parquet import write_parquet  # pyarrow is only needed for parquet output
+                count = write_parquet(members, partial_path)["members"]
+        replace_output(partial_path, output_path)
+    except Exception as e:
+        logger.exception(f"Failed to process {input_path}")
+        remove_output(partial_path)
+        return BatchResult(input_path, output_path, "failed", 0, time.perf_counter() - started, input_bytes, repr(e))
+    return BatchResult(input_path, output_path, "done", count, time.perf_counter() - started, input_bytes)
+
+
+def run_batch(input_files: Iterable[str], output_dir: str, jobs: Optional[int] = None, output_format: str = "xlsx",
+              trusted: bool = False, force: bool = False, metrics: bool = False) -> List[BatchResult]:
+    """
+    Parses and exports files concurrently in a process pool.
+
+    Args:
+        input_files: 834 files to process.
+        output_dir: Directory for the outputs; created if missing.
+        jobs: Maximum number of files processed at once (default: os.cpu_count()).
+        output_format: "xlsx" (one workbook per file) or "parquet" (one directory per file).
+        trusted: Build the models without validation (see ins_class).
+        force: Reprocess files whose output is newer than the input.
+        metrics: Write per-file ins_metrics next to each output.
+    Returns:
+        One BatchResult per input file, in completion order (skipped files first).
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"output_format must be one of {FORMATS}, got {output_format!r}")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+
+    results: List[BatchResult] = []
+    todo = []
+    for input_path in input_files:
+        output_path = output_path_for(input_path, output_dir, output_format)
+        if not force and is_up_to_date(input_path, output_path, output_format):
+            results.append(BatchResult(input_path, output_path, "skipped", input_bytes=os.path.getsize(input_path)))
+        else:
+            todo.append((input_path, output_path))
+    # Largest files first, so one big file does not start last and hold up the whole batch
+    todo.sort(key=lambda paths: os.path.getsize(paths[0]), reverse=True)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(process_file, input_path, output_path, output_format, trusted, metrics)
+                   for input_path, output_path in todo]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            logger.info(f"{result.status} {result.input_path}: {result.members} members in {result.seconds:.2f}s")
+    return results
+
+
+def print_summary(results: List[BatchResult], wall_seconds: float) -> None:
+    """Prints one line per file and the aggregate throughput of the batch."""
+    for result in results:
+        line = f"{result.status:8} {result.input_path}"
+        if result.status == "done":
+            line += (f": {result.members:,} members, {result.input_bytes / _MB:,.1f} MB in {result.seconds:.2f}s"
+                     f" ({result.members / result.seconds:,.0f} members/s, {result.input_bytes / _MB / result.seconds:,.1f} MB/s)")
+        elif result.status == "failed":
+            line += f": {result.error}"
+        print(line)
+
+    done = [result for result in results if result.status == "done"]
+    members = sum(result.members for result in done)
+    input_mb = sum(result.input_bytes for result in done) / _MB
+    counts = {status: sum(1 for result in results if result.status == status) for status in ("done", "skipped", "failed")}
+    print(f"total: {counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed; "
+          f"{members:,} members, {input_mb:,.1f} MB in {wall_seconds:.2f}s wall "
+          f"({members / wall_seconds if wall_seconds else 0:,.0f} members/s, {input_mb / wall_seconds if wall_seconds else 0:,.1f} MB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and export a batch of 834 files in parallel")
+    parser.add_argument("inputs", nargs="+", help="input files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="out", help="directory for the exported files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="files processed at once")
+    parser.add_argument("--format", choices=FORMATS, default="xlsx", help="export format")
+    parser.add_argument("--trusted", action="store_true", help="build models without validation")
+    parser.add_argument("--force", action="store_true", help="reprocess files whose output is up to date")
+    parser.add_argument("--metrics", action="store_true", help="write <output>.metrics.json and <output>.prom per file")
+    args = parser.parse_args()
+
+    input_files = find_input_files(args.inputs)
+    if not input_files:
+        parser.error(f"no input files found in {args.inputs}")
+    started = time.perf_counter()
+    results = run_batch(input_files, args.output_dir, args.jobs, args.format, args.trusted, args.force, args.metrics)
+    print_summary(results, time.perf_counter() - started)
+    if any(result.status == "failed" for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
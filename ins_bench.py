@@ -0,0 +1,369 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from loguru import logger
+
+try:
+    import resource  # peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+import edi_utils
+import ins_834
+import ins_class
+import ins_excel
+from ins_synthetic import synthetic_member_segments, write_synthetic_834
+
+# Metrics compared against a baseline: higher is better for throughput, lower for the rest
+_HIGHER_IS_BETTER_SUFFIX = "_per_sec"
+_LOWER_IS_BETTER = ("peak_rss_mb", "traced_peak_mb", "live_blocks")  # seconds mirrors _per_sec
+# Linux only: writing 5 to clear_refs resets the VmHWM (peak RSS) reported in status
+_CLEAR_REFS = "/proc/self/clear_refs"
+_STATUS = "/proc/self/status"
+
+
+def route_startswith_chain(segment: str) -> int:
+    """Routing as done by the original if/elif chain: one str.startswith per branch."""
+    if segment.startswith("INS*"):
+        return 0
+    elif segment.startswith("REF*"):
+        return 1
+    elif segment.startswith("DTP*"):
+        return 2
+    elif segment.startswith("NM1*"):
+        return 3
+    elif segment.startswith("PER*"):
+        return 4
+    elif segment.startswith("N3*"):
+        return 5
+    elif segment.startswith("N4*"):
+        return 6
+    elif segment.startswith("DMG*"):
+        return 7
+    elif segment.startswith("HD*"):
+        return 8
+    elif segment.startswith("ISA*"):
+        return 9
+    elif segment.startswith("GS*"):
+        return 10
+    elif segment.startswith("ST*"):
+        return 11
+    elif segment.startswith("SE*"):
+        return 12
+    elif segment.startswith("GE*"):
+        return 13
+    elif segment.startswith("IEA*"):
+        return 14
+    elif segment.startswith("BGN*"):
+        return 15
+    return -1
+
+
+def bench_routing(filename: str, batch_segments: int = 100_000) -> Dict[str, float]:
+    """Segments/second spent only on routing the file's segments, old startswith chain vs. dict dispatch.
+
+    The file (e.g. a synthetic 834) is tokenized batch_segments at a time and only the routing
+    of each batch is timed; the handlers are no-ops, so the numbers isolate the routing cost
+    over the file's own mix of segment types while memory stays bounded by one batch.
+    route_startswith_chain expects the "*" element separator.
+    """
+    noop: Callable[[object, Sequence[str]], None] = lambda state, fields: None
+    handlers = dict.fromkeys(ins_834.SEGMENT_HANDLERS, noop)
+    get_handler = handlers.get
+    total = 0
+    chain_seconds = dispatch_seconds = 0.0
+    with open(filename) as infile:
+        tokenizer, head = edi_utils.tokenizer_from_stream(infile)
+        segments = tokenizer.iter_segments(infile, head=head)
+        while batch := list(itertools.islice(segments, batch_segments)):
+            fields = [tokenizer.split_segment(segment) for segment in batch]
+            total += len(batch)
+
+            started = time.perf_counter()
+            for segment in batch:
+                route_startswith_chain(segment)
+            chain_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            for segment_fields in fields:
+                get_handler(segment_fields[0], noop)(None, segment_fields)
+            dispatch_seconds += time.perf_counter() - started
+
+    return {
+        "segments": total,
+        "startswith_chain_segments_per_sec": total / chain_seconds,
+        "dispatch_table_segments_per_sec": total / dispatch_seconds,
+    }
+
+
+def bench_parse(filename: str) -> Dict[str, float]:
+    """Segments/second and members/second for a full parse of the file."""
+    with open(filename) as infile:
+        segments = sum(1 for _ in infile)
+    ins_class.clear_validation_caches()
+    started = time.perf_counter()
+    members = sum(1 for _ in ins_834.iter_ins_file(filename))
+    seconds = time.perf_counter() - started
+    return {
+        "segments": segments,
+        "members": members,
+        "segments_per_sec": segments / seconds,
+        "members_per_sec": members / seconds,
+    }
+
+
+def bench_tokenize(filename: str) -> Dict[str, float]:
+    """Segments/second of the chunked stream tokenizer vs. the memory-mapped scanner, and full
+    parses through each (the mapped parse skips decoding envelope/unknown segments)."""
+    results = {}
+    started = time.perf_counter()
+    segments = sum(1 for _ in edi_utils.iter_edi_fields(filename))
+    results["stream_segments_per_sec"] = segments / (time.perf_counter() - started)
+    started = time.perf_counter()
+    with edi_utils.MappedEdiFile(filename) as edi:
+        segments = sum(1 for _ in edi.iter_fields())
+    results["mmap_segments_per_sec"] = segments / (time.perf_counter() - started)
+    for name, parse in (("stream", ins_834.iter_ins_file), ("mmap", ins_834.iter_ins_mapped)):
+        ins_class.clear_validation_caches()
+        started = time.perf_counter()
+        members = sum(1 for _ in parse(filename))
+        results[f"{name}_parse_members_per_sec"] = members / (time.perf_counter() - started)
+    return results
+
+
+def bench_members(filename: str) -> Dict[str, float]:
+    """Members/second with validated construction vs. trusted construction (no validation).
+
+    The validated run starts with empty code-list validation caches (see ins_class._validate_elements),
+    as a fresh process would, so earlier benchmarks on the same file do not warm them.
+    """
+    results = {}
+    for mode, trusted in (("validated", False), ("trusted", True)):
+        ins_class.clear_validation_caches()
+        started = time.perf_counter()
+        members = sum(1 for _ in ins_834.iter_ins_file(filename, trusted=trusted))
+        results[f"{mode}_members_per_sec"] = members / (time.perf_counter() - started)
+    return results
+
+
+def bench_parallel(filename: str, max_workers: int) -> Dict[str, float]:
+    """Members/second of iter_ins_file_parallel for 1..max_workers worker processes."""
+    results = {}
+    for workers in range(1, max_workers + 1):
+        ins_class.clear_validation_caches()  # forked workers inherit the parent's caches
+        started = time.perf_counter()
+        members = sum(1 for _ in ins_834.iter_ins_file_parallel(filename, workers=workers))
+        results[f"{workers}_workers_members_per_sec"] = members / (time.perf_counter() - started)
+    return results
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the process peak RSS so the next _peak_rss_mb() covers only what follows."""
+    try:
+        with open(_CLEAR_REFS, "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_mb() -> Optional[float]:
+    with open(_STATUS) as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024  # kB
+    return None
+
+
+def measure(func: Callable[[], Any], items: int, unit: str, allocations: bool = True) -> Dict[str, float]:
+    """
+    Times one call of func and reports items/second and memory.
+
+    Where the peak RSS can be reset (Linux), peak_rss_mb is the process high-water mark
+    during the timed call; it includes what the process held before the call. With
+    allocations=True func is called a second time under tracemalloc (several times slower,
+    so not timed) for the peak memory traced during that call and the number of blocks
+    allocated during it that are still live once it returns and its result is dropped.
+    CPython keeps no count of the allocations themselves. Both calls start with empty
+    validation caches.
+    """
+    gc.collect()
+    ins_class.clear_validation_caches()
+    rss_reset = _reset_peak_rss()
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    metrics = {"seconds": seconds, f"{unit}_per_sec": items / seconds}
+    peak_rss = _peak_rss_mb() if rss_reset else None
+    if peak_rss is not None:
+        metrics["peak_rss_mb"] = peak_rss
+    if allocations:
+        gc.collect()
+        ins_class.clear_validation_caches()
+        tracemalloc.start()
+        try:
+            func()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        metrics["traced_peak_mb"] = traced_peak / (1024 * 1024)
+        metrics["live_blocks"] = sum(stat.count for stat in snapshot.statistics("filename"))
+    return metrics
+
+
+def bench_stages(filename: str, excel_members: int, allocations: bool = True) -> Dict[str, Dict[str, float]]:
+    """The list-based stages, one at a time: split_edi_to_segments, parse_ins_segment and the
+    Excel export of the first excel_members members. The export is create_excel_streaming:
+    create_excel expects an N3 on every member, and synthetic dependents have none."""
+    with open(filename) as infile:
+        content = infile.read()
+    segments = edi_utils.split_edi_to_segments(content)
+    members = ins_834.parse_ins_segment(segments)
+    results = {
+        "split_edi_to_segments": measure(lambda: edi_utils.split_edi_to_segments(content), len(segments), "segments", allocations),
+        "parse_ins_segment": measure(lambda: ins_834.parse_ins_segment(segments), len(members), "members", allocations),
+    }
+    excel_members = members[:excel_members]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        excel_filename = os.path.join(tmpdir, "ins.xlsx")
+        results["create_excel_streaming"] = measure(
+            lambda: ins_excel.create_excel_streaming(excel_members, excel_filename), len(excel_members), "members",
+            allocations)
+    return results
+
+
+_CONSTRUCTORS = {
+    "INS": ins_class.INS.from_line_ins_segment,
+    "REF": ins_class.REF.from_line_ins_ref_segment,
+    "DTP": ins_class.DTP.from_line_ins_dtp_segment,
+    "NM1": ins_class.NM1.from_line_ins_nm1_segment,
+    "PER": ins_class.PER.from_line_ins_per_segment,
+    "N3": ins_class.N3.from_line_ins_n3_segment,
+    "N4": ins_class.N4.from_line_ins_n4_segment,
+    "DMG": ins_class.DMG.from_line_ins_dmg_segment,
+    "HD": ins_class.HD.from_line_ins_hd_segment,
+}
+
+
+def bench_constructors(segments_per_type: int, allocations: bool = True) -> Dict[str, Dict[str, float]]:
+    """Segments/second of each from_line_* constructor on a synthetic segment of its type.
+
+    The same line is built over and over. Only its code-list elements are memoized (see
+    ins_class._validate_elements), and those repeat across real members too, so after the
+    first segment the numbers are the cost of validating the other elements plus cache hits.
+    """
+    lines = {}
+    for segment in synthetic_member_segments(1):
+        lines.setdefault(segment.split("*", 1)[0], segment)
+    results = {}
+    for segment_id, constructor in _CONSTRUCTORS.items():
+        line = lines[segment_id]
+
+        def build(constructor=constructor, line=line) -> list:
+            return [constructor(line) for _ in range(segments_per_type)]
+
+        results[segment_id] = measure(build, segments_per_type, "segments", allocations)
+    return results
+
+
+def compare_metric(name: str, value: float, baseline: Optional[float]) -> Optional[float]:
+    """Relative change vs. the baseline, positive when better; None when not comparable."""
+    if not baseline:
+        return None
+    if name.endswith(_HIGHER_IS_BETTER_SUFFIX):
+        return value / baseline - 1
+    if name in _LOWER_IS_BETTER:
+        return baseline / value - 1 if value else None
+    return None
+
+
+def _format(value: float) -> str:
+    return f"{value:,.0f}" if abs(value) >= 100 else f"{value:,.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the 834 parser")
+    parser.add_argument("--members", type=int, default=1_000_000, help="subscribers in the synthetic file for the routing benchmark")
+    parser.add_argument("--parse-members", type=int, default=20_000, help="subscribers in the synthetic file for the full parse")
+    parser.add_argument("--dependents", type=int, default=0, help="dependents per subscriber in the synthetic file")
+    parser.add_argument("--refs", type=int, default=2, help="REF segments per INS loop in the synthetic file")
+    parser.add_argument("--dtps", type=int, default=1, help="member level DTP segments per INS loop in the synthetic file")
+    parser.add_argument("--coverages", type=int, default=1, help="HD loops per INS loop in the synthetic file")
+    parser.add_argument("--excel-members", type=int, default=2_000, help="members written by the Excel export benchmark")
+    parser.add_argument("--constructor-segments", type=int, default=20_000, help="segments built per from_line_* constructor")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="highest worker count for the parallel benchmark")
+    parser.add_argument("--no-allocations", action="store_true", help="skip the (slow) tracemalloc runs")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="with --baseline, exit with status 1 when a metric is worse by more than this fraction")
+    args = parser.parse_args()
+
+    logger.remove()  # Benchmarks measure parsing, not log sinks
+    allocations = not args.no_allocations
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        routing_filename = write_synthetic_834(os.path.join(tmpdir, "routing_834.edi"), args.members, args.dependents,
+                                               args.refs, args.dtps, coverages=args.coverages)
+        results["routing"] = bench_routing(routing_filename)
+        os.remove(routing_filename)
+        filename = write_synthetic_834(os.path.join(tmpdir, "synthetic_834.edi"), args.parse_members,
+                                       args.dependents, args.refs, args.dtps, coverages=args.coverages)
+        results["parse"] = bench_parse(filename)
+        results["tokenize"] = bench_tokenize(filename)
+        results["members"] = bench_members(filename)
+        results["parallel"] = bench_parallel(filename, args.workers)
+        for stage, metrics in bench_stages(filename, args.excel_members, allocations).items():
+            results[f"stage.{stage}"] = metrics
+    for segment_id, metrics in bench_constructors(args.constructor_segments, allocations).items():
+        results[f"constructor.{segment_id}"] = metrics
+
+    baseline_results = {}
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline_results = json.load(infile)["results"]
+    regressions: List[str] = []
+    for group, metrics in results.items():
+        for name, value in metrics.items():
+            line = f"{group} {name}: {_format(value)}"
+            change = compare_metric(name, value, baseline_results.get(group, {}).get(name))
+            if change is not None:
+                line += f" ({change:+.1%} vs baseline)"
+                if change < -args.max_regression:
+                    regressions.append(f"{group} {name}")
+            print(line)
+
+    if args.output:
+        run = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                # Process high-water mark of the whole run; not compared (see the per-stage peak_rss_mb)
+                "peak_rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                                / (1024 * 1024 if sys.platform == "darwin" else 1024)) if resource is not None else None,
+                "options": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as outfile:
+            json.dump(run, outfile, indent=2)
+    if regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.max_regression:.0%}: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
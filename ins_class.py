@@ -1,10 +1,123 @@
+import functools
 import re
-from typing import Optional,List,Literal
-from pydantic import BaseModel, Field, validator, ValidationError
+import sys
+from dataclasses import dataclass
+from typing import Annotated,Dict,Optional,List,Literal,Sequence,ClassVar,FrozenSet,Iterable,Iterator,Tuple
+from typing_extensions import TypedDict  # pydantic needs it over typing.TypedDict before Python 3.12
+from pydantic import BaseModel, Field, TypeAdapter, validator, ValidationError
 from loguru import logger
+import edi_utils
 from edi_utils import split_edi_line
 
 
+# Each from_fields_* constructor builds its model in a single construction and validates
+# once. trusted=True skips validation entirely; only use it for files that already passed
+# upstream compliance checks.
+
+def _construct_trusted(cls, data: dict):
+    """Same result as cls.model_construct(**data) for data holding every field, without its
+    per-field default and alias handling, which makes model_construct slower than validating."""
+    model = cls.__new__(cls)
+    object.__setattr__(model, "__dict__", data)
+    object.__setattr__(model, "__pydantic_fields_set__", set(data))
+    object.__setattr__(model, "__pydantic_extra__", None)
+    object.__setattr__(model, "__pydantic_private__", None)
+    return model
+
+
+# Code-list elements (qualifiers, type and status codes) repeat heavily across members and
+# their rules depend only on the value, so each distinct value of such an element is
+# checked once and the outcome memoized (see _CODE_LIST_FIELDS). The other elements (names,
+# IDs, dates, amounts) are validated on every segment. A segment that fails raises a new
+# ValidationError each time, with the same errors as validating the model itself.
+VALIDATION_CACHE_SIZE = 4096
+_VALIDATION_CACHES: List = []
+
+
+def clear_validation_caches() -> None:
+    """Forgets every memoized validation outcome, e.g. so a benchmark run starts cold."""
+    for cache in _VALIDATION_CACHES:
+        cache.cache_clear()
+
+
+def _value_check(field_info):
+    """Memoized value -> ((error type, loc, ctx), ...) of one field's rules; empty when valid."""
+    adapter = TypeAdapter(Annotated[field_info.annotation, field_info])
+
+    @functools.lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+    def check(value: Optional[str]) -> tuple:
+        try:
+            adapter.validate_python(value)
+        except ValidationError as e:
+            return tuple((detail["type"], detail["loc"], detail.get("ctx")) for detail in e.errors(include_url=False))
+        return ()
+    _VALIDATION_CACHES.append(check)
+    return check
+
+
+def _line_error(error_type: str, loc: tuple, value, ctx: Optional[dict]) -> dict:
+    line_error = {"type": error_type, "loc": loc, "input": value}
+    if ctx:
+        line_error["ctx"] = dict(ctx)
+    return line_error
+
+
+class _ElementValidator:
+    """Validates the data of one from_fields_* constructor: code-list fields against the
+    memoized per-value outcomes, the other fields in one pass of a TypedDict holding only them."""
+    def __init__(self, model: type, data_fields: Iterable[str], code_fields: Iterable[str]):
+        model_fields = model.model_fields
+        self.title = model.__name__
+        self.field_order = {name: position for position, name in enumerate(model_fields)}
+        self.code_checks = tuple((name, _value_check(model_fields[name])) for name in data_fields if name in code_fields)
+        other_fields = {name: Annotated[model_fields[name].annotation, model_fields[name]]
+                        for name in data_fields if name not in code_fields}
+        self.other_validator = TypeAdapter(TypedDict(f"{self.title}Elements", other_fields)).validator \
+            if other_fields else None
+
+    def validate(self, data: dict) -> None:
+        for name, check in self.code_checks:
+            if check(data[name]):
+                self._raise(data)
+        if self.other_validator is not None:
+            try:
+                self.other_validator.validate_python(data)  # code-list fields are ignored as extra keys
+            except ValidationError as e:
+                self._raise(data, e)
+
+    def _raise(self, data: dict, other_error: Optional[ValidationError] = None):
+        errors = [_line_error(error_type, (name, *loc), data[name], ctx)
+                  for name, check in self.code_checks for error_type, loc, ctx in check(data[name])]
+        if other_error is None and self.other_validator is not None:
+            try:
+                self.other_validator.validate_python(data)
+            except ValidationError as e:
+                other_error = e
+        if other_error is not None:
+            errors.extend(_line_error(detail["type"], detail["loc"], detail["input"], detail.get("ctx"))
+                          for detail in other_error.errors(include_url=False))
+        errors.sort(key=lambda error: self.field_order[error["loc"][0]])
+        raise ValidationError.from_exception_data(self.title, errors)
+
+
+_ELEMENT_VALIDATORS: Dict[type, _ElementValidator] = {}
+
+
+def _validate_elements(model: type, data: dict) -> None:
+    """Raises the ValidationError model(**data) would raise, memoizing the code-list checks."""
+    element_validator = _ELEMENT_VALIDATORS.get(model)
+    if element_validator is None:
+        element_validator = _ELEMENT_VALIDATORS[model] = _ElementValidator(model, data, _CODE_LIST_FIELDS[model])
+    element_validator.validate(data)
+
+
+def _element(fields: Sequence[str], position: int) -> Optional[str]:
+    """Returns the element at position, or None when it is absent or empty."""
+    if position < len(fields):
+        return fields[position] or None
+    return None
+
+
 class DTP(BaseModel):
     """Date/Time/Period"""
     date_time_qualifier: str = Field(..., description="Date/Time Qualifier", min_length=3, max_length=3)
@@ -12,18 +125,21 @@ class DTP(BaseModel):
     date_time_period: str = Field(..., description="Date Time Period (CCYYMMDD)", min_length=8, max_length=8)
     @staticmethod
     def from_line_ins_dtp_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_DTP fields length: {len(fields)}")
-        logger.debug(f"INS_DTP fields: {fields}")
+        return DTP.from_fields_ins_dtp_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_dtp_segment(fields: Sequence[str], trusted: bool = False):
         ins_dtp_data = {
             "date_time_qualifier": fields[1],
             "date_time_format_qualifier": fields[2],
             "date_time_period":  fields[3]}
-        logger.debug(f"INS_DTP fields data: {ins_dtp_data}")
-        ins_dtp_data_cls=DTP(**ins_dtp_data)
-        return ins_dtp_data_cls
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_DTP fields: {fields} data: {ins_dtp_data}")
+        if not trusted:
+            _validate_elements(DTP, ins_dtp_data)
+        return _construct_trusted(DTP, ins_dtp_data)
+
 
-                              
 class REF(BaseModel):
     """Reference Identification"""
     reference_identification_qualifier: str = Field(...,description="Reference Identification Qualifier",min_length=2,max_length=3, optional=False, pos=1)
@@ -31,22 +147,26 @@ class REF(BaseModel):
     description: Optional[str] = Field(None,description="Description",max_length=80, optional=False, pos=3)
     @staticmethod
     def from_line_ins_ref_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_REF fields length: {len(fields)}")
-        logger.debug(f"INS_REF fields: {fields}")
+        return REF.from_fields_ins_ref_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_ref_segment(fields: Sequence[str], trusted: bool = False):
         ins_ref_data = {
             "reference_identification_qualifier": fields[1],
             "reference_identification": fields[2],
-            "description": None}
-        logger.debug(f"INS_REF fields data: {ins_ref_data}")
-        ins_ref_data_cls=REF(**ins_ref_data)
-        return ins_ref_data_cls
+            "description": _element(fields, 3)}
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_REF fields: {fields} data: {ins_ref_data}")
+        if not trusted:
+            _validate_elements(REF, ins_ref_data)
+        return _construct_trusted(REF, ins_ref_data)
+
 
 class NM1(BaseModel):
     """Individual or Organizational Name"""
     entity_identifier_code: str = Field(..., description="Entity Identifier Code", min_length=2, max_length=2)
     entity_type_qualifier: str = Field(..., description="Entity Type Qualifier", min_length=1, max_length=1)
-    name_last_or_organization_name: str = Field(..., description="Name Last or Organization Name", min_length=1, max_length=60)
+    name_last_or_organization_name: Optional[str] = Field(None, description="Name Last or Organization Name (not used in the 2100C/2100E address loops)", min_length=1, max_length=60)
     name_first: Optional[str] = Field(None, description="Name First", max_length=35)
     name_middle: Optional[str] = Field(None, description="Name Middle", max_length=35)
     identification_code_qualifier: Optional[str] = Field(None, description="Identification Code Qualifier", max_length=2)
@@ -56,31 +176,28 @@ class NM1(BaseModel):
 
     @staticmethod
     def from_line_ins_nm1_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_NM1 fields length: {len(fields)}")
-        logger.debug(f"INS_NM1 fields: {fields}")
+        return NM1.from_fields_ins_nm1_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_nm1_segment(fields: Sequence[str], trusted: bool = False):
+        # NM106/NM107 (prefix/suffix) are not modeled; ID code qualifier and code are NM108/NM109
         ins_nm1_data = {
             "entity_identifier_code": fields[1],
             "entity_type_qualifier": fields[2],
-            "name_last_or_organization_name": fields[3],
-            "name_first": fields[4]
+            "name_last_or_organization_name": _element(fields, 3),
+            "name_first": _element(fields, 4),
+            "name_middle": _element(fields, 5),
+            "identification_code_qualifier": _element(fields, 8),
+            "identification_code": _element(fields, 9),
+            "entity_relationship_code": _element(fields, 10),
+            "entity_identifier_code_2": _element(fields, 11),
             }
-        ins_nm1_data_cls=NM1(**ins_nm1_data)
-        try:
-            if len(fields) >= 6:
-                ins_nm1_data = ins_nm1_data_cls.model_copy(update={"name_middle": fields[5]})
-            if len(fields) >= 7:
-                ins_nm1_data = ins_nm1_data_cls.model_copy(update={"identification_code_qualifier": fields[6]}) #This will raise error because name is too short
-            if len(fields) >= 8:
-                ins_nm1_data = ins_nm1_data_cls.model_copy(update={"identification_code": fields[7]}) #This will raise error because name is too short
-            if len(fields) >= 9:
-                ins_nm1_data = ins_nm1_data_cls.model_copy(update={"entity_relationship_code": fields[8]}) #This will raise error because name is too short
-            if len(fields) >= 10:
-                ins_nm1_data = ins_nm1_data_cls.model_copy(update={"entity_identifier_code_2": fields[9]}) #This will raise error because name is too short
-        except ValidationError as e:
-            print("Validation Error: {e}")
-        logger.debug(f"INS_NM1 fields data: {ins_nm1_data}")
-        return ins_nm1_data_cls
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_NM1 fields: {fields} data: {ins_nm1_data}")
+        if not trusted:
+            _validate_elements(NM1, ins_nm1_data)
+        return _construct_trusted(NM1, ins_nm1_data)
+
 
 class PER(BaseModel):
     """Individual Name or Organizational Contact"""
@@ -91,18 +208,22 @@ class PER(BaseModel):
     # Additional optional fields are omitted for brevity
     @staticmethod
     def from_line_ins_per_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_PER fields length: {len(fields)}")
-        logger.debug(f"INS_PER fields: {fields}")
+        return PER.from_fields_ins_per_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_per_segment(fields: Sequence[str], trusted: bool = False):
         ins_per_data = {
             "contact_function_code": fields[1],
-            "contact_enumeration_code": fields[2],
+            "contact_enumeration_code": _element(fields, 2),
             "contact_communication_number_qualifier": fields[3],
             "contact_communication_number": fields[4]
             }
-        logger.debug(f"INS_PER fields data: {ins_per_data}")
-        ins_per_data_cls=PER(**ins_per_data)
-        return ins_per_data_cls
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_PER fields: {fields} data: {ins_per_data}")
+        if not trusted:
+            _validate_elements(PER, ins_per_data)
+        return _construct_trusted(PER, ins_per_data)
+
 
 class N3(BaseModel):
     """Party Location"""
@@ -110,21 +231,20 @@ class N3(BaseModel):
     address_information_2: Optional[str] = Field(None, description="Address Information 2", max_length=55)
     @staticmethod
     def from_line_ins_n3_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_N3 fields length: {len(fields)}")
-        logger.debug(f"INS_N3 fields: {fields}")
+        return N3.from_fields_ins_n3_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_n3_segment(fields: Sequence[str], trusted: bool = False):
         ins_n3_data = {
-            "address_information_1": fields[1]
+            "address_information_1": fields[1],
+            "address_information_2": _element(fields, 2),
             }
-        logger.debug(f"INS_N3 fields data: {ins_n3_data}")
-        ins_n3_data_cls=N3(**ins_n3_data)
-        try:
-            if len(fields) >= 3:
-                ins_n3_data_cls = ins_n3_data_cls.model_copy(update={"address_information_2": fields[2]}) #This will raise error because name is too short
-        except ValidationError as e:
-            print("Validation Error: {e}")
-        return ins_n3_data_cls
-    
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_N3 fields: {fields} data: {ins_n3_data}")
+        if trusted:
+            return _construct_trusted(N3, ins_n3_data)
+        return N3(**ins_n3_data)
+
 
 class N4(BaseModel):
     """Geographic Location"""
@@ -135,26 +255,23 @@ class N4(BaseModel):
     location_identifier: Optional[str] = Field(None, description="Location Identifier", max_length=30)
     @staticmethod
     def from_line_ins_n4_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_N4 fields length: {len(fields)}")
-        logger.debug(f"INS_N4 fields: {fields}")
+        return N4.from_fields_ins_n4_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_n4_segment(fields: Sequence[str], trusted: bool = False):
         ins_n4_data = {
             "city_name": fields[1],
             "state_or_province_code": fields[2],
             "postal_code": fields[3],
-            "country_code": None,
-            "location_identifier": None
+            "country_code": _element(fields, 4),
+            "location_identifier": _element(fields, 5),
             }
-        logger.debug(f"INS_N4 fields data: {ins_n4_data}")
-        ins_n4_data_cls=N4(**ins_n4_data)
-        try:
-            if len(fields) >= 5:
-                ins_n4_data_cls = ins_n4_data_cls.model_copy(update={"country_code": fields[4]}) #This will raise error because name is too short
-            if len(fields) >= 6:
-                ins_n4_data_cls = ins_n4_data_cls.model_copy(update={"location_identifier": fields[5]}) #This will raise error because name is too short
-        except ValidationError as e:
-            print("Validation Error: {e}")
-        return ins_n4_data_cls
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_N4 fields: {fields} data: {ins_n4_data}")
+        if not trusted:
+            _validate_elements(N4, ins_n4_data)
+        return _construct_trusted(N4, ins_n4_data)
+
 
 class DMG(BaseModel):
     """Demographic Information"""
@@ -164,22 +281,22 @@ class DMG(BaseModel):
     race_or_ethnicity_code: Optional[str] = Field(None, description="Race or Ethnicity Code", max_length=1)
     @staticmethod
     def from_line_ins_dmg_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_DMG fields length: {len(fields)}")
-        logger.debug(f"INS_DMG fields: {fields}")
+        return DMG.from_fields_ins_dmg_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_dmg_segment(fields: Sequence[str], trusted: bool = False):
         ins_dmg_data = {
+            "date_time_format_qualifier": "D8",
             "date_time_period": fields[2],
             "gender_code": fields[3],
+            "race_or_ethnicity_code": _element(fields, 4),
         }
-        logger.debug(f"INS_DMG fields data: {ins_dmg_data}")
-        ins_dmg_data_cls=DMG(**ins_dmg_data)
-        try:
-            if len(fields) >= 5:
-                ins_dmg_data_cls = ins_dmg_data_cls.model_copy(update={"race_or_ethnicity_code": fields[4]})
-        except ValidationError as e:
-            print("Validation Error: {e}")
-        logger.debug(f"INS_DMG fields data: {ins_dmg_data_cls}")
-        return ins_dmg_data_cls
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_DMG fields: {fields} data: {ins_dmg_data}")
+        if not trusted:
+            _validate_elements(DMG, ins_dmg_data)
+        return _construct_trusted(DMG, ins_dmg_data)
+
 
 class HD(BaseModel):
     """Health Coverage Dates"""
@@ -190,26 +307,119 @@ class HD(BaseModel):
     employee_status_code: Optional[str] = Field(None, description="Employee Status Code")
     @staticmethod
     def from_line_ins_hd_segment(line: str):
-        fields=split_edi_line(line)
-        logger.debug(f"INS_HD fields length: {len(fields)}")
-        logger.debug(f"INS_HD fields: {fields}")
+        return HD.from_fields_ins_hd_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_hd_segment(fields: Sequence[str], trusted: bool = False):
         ins_hd_data = {
             "maintenance_reason_code": fields[1],
-            "maintenance_type_code": None,
+            "maintenance_type_code": _element(fields, 6),
             "source_of_submission_code": fields[3],
-            "plan_coverage_description": fields[4]
+            "plan_coverage_description": fields[4],
+            "employee_status_code": _element(fields, 5),
         }
-        logger.debug(f"INS_HD fields data: {ins_hd_data}")
-        ins_hd_data_cls=HD(**ins_hd_data)
-        try:
-            if len(fields) >= 6:
-                ins_hd_data_cls = ins_hd_data_cls.model_copy(update={"employee_status_code": fields[5]})
-            if len(fields) >= 7:
-                ins_hd_data_cls = ins_hd_data_cls.model_copy(update={"maintenance_type_code": fields[6]})
-        except ValidationError as e:
-            print("Validation Error: {e}")
-        logger.debug(f"INS_HD fields data: {ins_hd_data_cls}")
-        return ins_hd_data_cls
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_HD fields: {fields} data: {ins_hd_data}")
+        if not trusted:
+            _validate_elements(HD, ins_hd_data)
+        return _construct_trusted(HD, ins_hd_data)
+
+
+class AMT(BaseModel):
+    """Monetary Amount"""
+    amount_qualifier_code: str = Field(..., description="Amount Qualifier Code (e.g. P3 premium, D2 deductible)", min_length=1, max_length=3)
+    monetary_amount: str = Field(..., description="Monetary Amount", min_length=1, max_length=18)
+
+    @staticmethod
+    def from_line_ins_amt_segment(line: str):
+        return AMT.from_fields_ins_amt_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_amt_segment(fields: Sequence[str], trusted: bool = False):
+        ins_amt_data = {
+            "amount_qualifier_code": fields[1],
+            "monetary_amount": fields[2],
+        }
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS_AMT fields: {fields} data: {ins_amt_data}")
+        if not trusted:
+            _validate_elements(AMT, ins_amt_data)
+        return _construct_trusted(AMT, ins_amt_data)
+
+
+class Coverage(BaseModel):
+    """Health Coverage loop (2300): an HD segment and the DTP/AMT/REF segments that follow it"""
+    hd_segment: HD = Field(..., description="HD Segment")
+    dtp_segments: List[DTP] = Field([], description="Coverage dates (348 begin, 349 end, 303 maintenance effective, ...)")
+    amt_segments: List[AMT] = Field([], description="Coverage amounts")
+    ref_segments: List[REF] = Field([], description="Coverage references (1L group or policy number, 17 client reporting category, ...)")
+
+    @staticmethod
+    def from_hd(hd: HD, trusted: bool = False):
+        coverage_data = {"hd_segment": hd, "dtp_segments": [], "amt_segments": [], "ref_segments": []}
+        if trusted:
+            return _construct_trusted(Coverage, coverage_data)
+        return Coverage(**coverage_data)
+
+    def date(self, date_time_qualifier: str) -> Optional[str]:
+        """date_time_period of the first DTP with the given qualifier (e.g. "348"), if any."""
+        for dtp in self.dtp_segments:
+            if dtp.date_time_qualifier == date_time_qualifier:
+                return dtp.date_time_period
+        return None
+
+
+class N1(BaseModel):
+    """Party Identification (1000A sponsor, 1000B payer, 1000C broker/TPA)"""
+    entity_identifier_code: str = Field(..., description="Entity Identifier Code (P5, IN, BO, TV)", min_length=2, max_length=3)
+    name: Optional[str] = Field(None, description="Name", max_length=60)
+    identification_code_qualifier: Optional[str] = Field(None, description="Identification Code Qualifier", max_length=2)
+    identification_code: Optional[str] = Field(None, description="Identification Code", max_length=80)
+
+    @staticmethod
+    def from_fields_n1_segment(fields: Sequence[str], trusted: bool = False):
+        n1_data = {
+            "entity_identifier_code": fields[1],
+            "name": _element(fields, 2),
+            "identification_code_qualifier": _element(fields, 3),
+            "identification_code": _element(fields, 4),
+        }
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"N1 fields: {fields} data: {n1_data}")
+        if not trusted:
+            _validate_elements(N1, n1_data)
+        return _construct_trusted(N1, n1_data)
+
+
+# NM1 entity identifier code -> member loop it opens. The member's own name (2100A, NM1*IL
+# or NM1*74) is INS.nm1_segment; every other NM1 of the member starts an NM1Loop.
+NM1_LOOP_IDS = {"IL": "2100A", "74": "2100A", "70": "2100B", "31": "2100C", "36": "2100D", "M8": "2100E",
+                "S3": "2100F", "45": "2100H", "P3": "2310"}
+NM1_DEFAULT_LOOP_ID = "2100G"  # responsible person (QD, E1, GD, ...)
+
+
+class NM1Loop(BaseModel):
+    """An NM1 sub-loop of a member other than its name loop (incorrect name, mailing address, responsible person, provider ...)"""
+    loop_id: str = Field(..., description="Loop ID, e.g. 2100C")
+    nm1_segment: NM1 = Field(..., description="NM1 Segment")
+    per_segment: Optional[PER] = Field(None, description="PER Segment")
+    n3_segment: Optional[N3] = Field(None, description="N3 Segment")
+    n4_segment: Optional[N4] = Field(None, description="N4 Segment")
+    dmg_segment: Optional[DMG] = Field(None, description="DMG Segment")
+
+    @staticmethod
+    def from_nm1(nm1: NM1, trusted: bool = False):
+        nm1_loop_data = {
+            "loop_id": NM1_LOOP_IDS.get(nm1.entity_identifier_code, NM1_DEFAULT_LOOP_ID),
+            "nm1_segment": nm1,
+            "per_segment": None,
+            "n3_segment": None,
+            "n4_segment": None,
+            "dmg_segment": None,
+        }
+        if trusted:
+            return _construct_trusted(NM1Loop, nm1_loop_data)
+        return NM1Loop(**nm1_loop_data)
 
 
 class INS(BaseModel):
@@ -232,7 +442,9 @@ class INS(BaseModel):
     n3_segment: N3 = Field(None, description="N3 Segment") #N3 as a list inside INS
     n4_segment: N4 = Field(None, description="N4 Segment") #N4 as a list inside INS
     dmg_segment: DMG = Field(None, description="DMG Segment") #DMG as a list inside INS
-    hd_segment: HD = Field(None, description="HD Segment") #HD as a list inside INS
+    hd_segment: HD = Field(None, description="HD Segment of the first coverage (all of them are in coverages)")
+    coverages: List[Coverage] = Field([], description="Health Coverage loops (2300), one per HD")
+    nm1_loops: List[NM1Loop] = Field([], description="NM1 sub-loops besides the member name (2100B-2100H, 2310)")
 
 
     def init_INS_HD(self):
@@ -244,30 +456,484 @@ class INS(BaseModel):
         self.n4_segment=None
         self.dmg_segment=None
         self.hd_segment=None
+        self.coverages=[]
+        self.nm1_loops=[]
 
     @staticmethod
     def from_line_ins_segment(line: str):
-        fields=split_edi_line(line)
+        return INS.from_fields_ins_segment(split_edi_line(line))
+
+    @staticmethod
+    def from_fields_ins_segment(fields: Sequence[str], trusted: bool = False):
         ins_data = {
             "yes_no_response_code": fields[1],
             "dependent_code": fields[2],
             "maintenance_type_code": fields[3],
-            "maintenance_reason_code": fields[4] or None,
-            "benefit_status_code": fields[5] or None,
-            "medicare_status_code": fields[6] or None,
-            "occ_length_code": None,     
-            "handicap_ind": None,   
+            "maintenance_reason_code": _element(fields, 4),
+            "benefit_status_code": _element(fields, 5),
+            "medicare_status_code": _element(fields, 6),
+            "occ_length_code": _element(fields, 8),
+            "handicap_ind": _element(fields, 9),
         }
-        logger.debug(f"Fields length: {len(fields)}")
-        logger.debug(f"INS fields: {ins_data}")
-        ins_data_cls=INS(**ins_data)
-        try:
-            if len(fields) >= 9:
-                ins_data_cls = ins_data_cls.model_copy(update={"occ_length_code": fields[8]}) #This will raise error because name is too short
-            if len(fields) >= 10:
-                ins_data_cls = ins_data_cls.model_copy(update={"handicap_ind": fields[9]}) #This will raise error because name is too short
-        except ValidationError as e:
-            print("Validation Error: {e}")
-
+        if edi_utils.SEGMENT_LOGGING:
+            logger.debug(f"INS fields: {fields} data: {ins_data}")
+        if not trusted:
+            _validate_elements(INS, ins_data)
+        ins_data_cls = _construct_trusted(INS, ins_data)
+        ins_data_cls.init_INS_HD()  # child segment fields are not part of ins_data
         return ins_data_cls
 
+
+# Fields validated once per distinct value (see _validate_elements): the code-list elements
+# of each segment. N3 has none, so it is validated as a whole every time.
+_CODE_LIST_FIELDS = {
+    INS: frozenset({"yes_no_response_code", "dependent_code", "maintenance_type_code", "maintenance_reason_code",
+                    "benefit_status_code", "medicare_status_code", "occ_length_code", "handicap_ind"}),
+    DTP: frozenset({"date_time_qualifier", "date_time_format_qualifier"}),
+    REF: frozenset({"reference_identification_qualifier"}),
+    NM1: frozenset({"entity_identifier_code", "entity_type_qualifier", "identification_code_qualifier",
+                    "entity_relationship_code", "entity_identifier_code_2"}),
+    PER: frozenset({"contact_function_code", "contact_enumeration_code", "contact_communication_number_qualifier"}),
+    N4: frozenset({"state_or_province_code", "country_code"}),
+    DMG: frozenset({"date_time_format_qualifier", "gender_code", "race_or_ethnicity_code"}),
+    HD: frozenset({"maintenance_reason_code", "maintenance_type_code", "source_of_submission_code",
+                   "employee_status_code"}),
+    AMT: frozenset({"amount_qualifier_code"}),
+    N1: frozenset({"entity_identifier_code", "identification_code_qualifier"}),
+}
+
+
+# Flat member columns
+#
+# The tabular exports and analytics (ins_parquet, ins_frames) and the member diff (ins_diff)
+# flatten a member the same way: the INS fields, then the fields of the member level
+# segments with a segment prefix (nm1_name_first, hd_maintenance_type_code, ...; hd_* is the
+# first coverage). Repeatable child segments get a table of their own with these fields.
+
+# (prefix, INS attribute, model) of the segments of the member name loop, which the NM1
+# sub-loops (NM1Loop) have too
+NAME_LOOP_SEGMENTS = (("nm1", "nm1_segment", NM1), ("per", "per_segment", PER), ("n3", "n3_segment", N3),
+                      ("n4", "n4_segment", N4), ("dmg", "dmg_segment", DMG))
+MEMBER_SEGMENTS = NAME_LOOP_SEGMENTS + (("hd", "hd_segment", HD),)
+INS_FIELDS = [name for name in INS.model_fields
+              if name not in ("ref_segments", "dtp_segments", "coverages", "nm1_loops") and not name.endswith("_segment")]
+REF_FIELDS = list(REF.model_fields)
+DTP_FIELDS = list(DTP.model_fields)
+HD_FIELDS = list(HD.model_fields)
+AMT_FIELDS = list(AMT.model_fields)
+MEMBER_COLUMNS = INS_FIELDS + [f"{prefix}_{name}" for prefix, _, model in MEMBER_SEGMENTS for name in model.model_fields]
+
+# Low-cardinality code columns (dictionary encoded in Parquet, categoricals in pandas)
+CODE_COLUMNS = frozenset({
+    "yes_no_response_code", "dependent_code", "maintenance_type_code", "maintenance_reason_code",
+    "benefit_status_code", "medicare_status_code", "occ_length_code", "handicap_ind",
+    "nm1_entity_identifier_code", "nm1_entity_type_qualifier", "nm1_identification_code_qualifier",
+    "nm1_entity_relationship_code", "per_contact_function_code", "per_contact_communication_number_qualifier",
+    "n4_state_or_province_code", "n4_country_code", "dmg_date_time_format_qualifier", "dmg_gender_code",
+    "dmg_race_or_ethnicity_code", "hd_maintenance_reason_code", "hd_maintenance_type_code",
+    "hd_source_of_submission_code", "hd_plan_coverage_description", "hd_employee_status_code",
+    "reference_identification_qualifier", "date_time_qualifier", "date_time_format_qualifier",
+    "source_of_submission_code", "plan_coverage_description", "employee_status_code", "amount_qualifier_code",
+})
+
+_MEMBER_SEGMENT_FIELDS = [(attr, tuple(model.model_fields)) for _, attr, model in MEMBER_SEGMENTS]
+
+
+def member_values(ins: INS) -> list:
+    """The member's values in MEMBER_COLUMNS order; None for the fields of absent segments."""
+    data = ins.__dict__
+    values = [data[name] for name in INS_FIELDS]
+    for attr, names in _MEMBER_SEGMENT_FIELDS:
+        segment = data[attr]
+        if segment is None:
+            values.extend([None] * len(names))
+        else:
+            segment_data = segment.__dict__
+            values.extend([segment_data[name] for name in names])
+    return values
+
+
+# Envelope and header loops
+#
+# The hierarchical view of a file built by ins_834.parse_interchanges: interchange (ISA/IEA)
+# -> functional group (GS/GE) -> transaction set (ST/SE) with its BGN header, the header
+# REF/DTP segments, the 1000A/1000B/1000C parties and the 2000 member loops.
+
+class TransactionSet(BaseModel):
+    """ST/SE transaction set with its header (BGN, REF, DTP), 1000 party loops and members"""
+    control_number: Optional[str] = Field(None, description="ST02 Transaction Set Control Number")
+    implementation_convention_reference: Optional[str] = Field(None, description="ST03 e.g. 005010X220A1")
+    transaction_set_purpose_code: Optional[str] = Field(None, description="BGN01 00 original, 15 re-submission, 22 information copy")
+    reference_identification: Optional[str] = Field(None, description="BGN02 Reference Identification")
+    date: Optional[str] = Field(None, description="BGN03 Date (CCYYMMDD)")
+    time: Optional[str] = Field(None, description="BGN04 Time")
+    action_code: Optional[str] = Field(None, description="BGN08 2 change (update), 4 verify, RX replace")
+    ref_segments: List[REF] = Field([], description="Header REF Segments (e.g. REF*38 master policy)")
+    dtp_segments: List[DTP] = Field([], description="Header DTP Segments (e.g. DTP*007 effective date)")
+    sponsor: Optional[N1] = Field(None, description="1000A Sponsor (N1*P5)")
+    payer: Optional[N1] = Field(None, description="1000B Payer (N1*IN)")
+    brokers: List[N1] = Field([], description="1000C Brokers / TPAs (N1*BO, N1*TV)")
+    members: List[INS] = Field([], description="2000 Member loops")
+
+    @staticmethod
+    def from_fields_st_segment(fields: Sequence[str]):
+        return TransactionSet(control_number=_element(fields, 2), implementation_convention_reference=_element(fields, 3))
+
+    def set_bgn(self, fields: Sequence[str]) -> None:
+        self.transaction_set_purpose_code = _element(fields, 1)
+        self.reference_identification = _element(fields, 2)
+        self.date = _element(fields, 3)
+        self.time = _element(fields, 4)
+        self.action_code = _element(fields, 8)
+
+
+class FunctionalGroup(BaseModel):
+    """GS/GE functional group"""
+    functional_identifier_code: Optional[str] = Field(None, description="GS01 BE for 834")
+    application_sender_code: Optional[str] = Field(None, description="GS02")
+    application_receiver_code: Optional[str] = Field(None, description="GS03")
+    date: Optional[str] = Field(None, description="GS04 Date (CCYYMMDD)")
+    time: Optional[str] = Field(None, description="GS05 Time")
+    control_number: Optional[str] = Field(None, description="GS06 Group Control Number")
+    version: Optional[str] = Field(None, description="GS08 Version / Release / Industry Identifier Code")
+    transaction_sets: List[TransactionSet] = Field([], description="Transaction sets of the group")
+
+    @staticmethod
+    def from_fields_gs_segment(fields: Sequence[str]):
+        return FunctionalGroup(functional_identifier_code=_element(fields, 1), application_sender_code=_element(fields, 2),
+                               application_receiver_code=_element(fields, 3), date=_element(fields, 4),
+                               time=_element(fields, 5), control_number=_element(fields, 6), version=_element(fields, 8))
+
+
+def _isa_element(fields: Sequence[str], position: int) -> Optional[str]:
+    # ISA elements are fixed width, padded with spaces
+    value = _element(fields, position)
+    return (value.strip() or None) if value is not None else None
+
+
+class Interchange(BaseModel):
+    """ISA/IEA interchange"""
+    sender_id_qualifier: Optional[str] = Field(None, description="ISA05")
+    sender_id: Optional[str] = Field(None, description="ISA06")
+    receiver_id_qualifier: Optional[str] = Field(None, description="ISA07")
+    receiver_id: Optional[str] = Field(None, description="ISA08")
+    date: Optional[str] = Field(None, description="ISA09 Date (YYMMDD)")
+    time: Optional[str] = Field(None, description="ISA10 Time")
+    control_number: Optional[str] = Field(None, description="ISA13 Interchange Control Number")
+    usage_indicator: Optional[str] = Field(None, description="ISA15 P production, T test")
+    functional_groups: List[FunctionalGroup] = Field([], description="Functional groups of the interchange")
+
+    @staticmethod
+    def from_fields_isa_segment(fields: Sequence[str]):
+        return Interchange(sender_id_qualifier=_isa_element(fields, 5), sender_id=_isa_element(fields, 6),
+                           receiver_id_qualifier=_isa_element(fields, 7), receiver_id=_isa_element(fields, 8),
+                           date=_isa_element(fields, 9), time=_isa_element(fields, 10),
+                           control_number=_isa_element(fields, 13), usage_indicator=_isa_element(fields, 15))
+
+
+# Compact member records
+#
+# Slotted dataclasses holding the same fields as the pydantic segment models, for jobs that
+# keep millions of members in memory. Code values are interned so that every member shares
+# one string object per distinct code. Convert with <Record>.from_model(model) and
+# record.to_model(); to_model does not re-validate.
+
+def _intern_code(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+class _SegmentRecord:
+    __slots__ = ()
+    _model: ClassVar[type]
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset()
+
+    @classmethod
+    def from_model(cls, model: BaseModel):
+        data = model.__dict__
+        code_fields = cls._code_fields
+        return cls(*[_intern_code(data[name]) if name in code_fields else data[name] for name in cls.__slots__])
+
+    def to_model(self):
+        return _construct_trusted(self._model, {name: getattr(self, name) for name in self.__slots__})
+
+
+@dataclass(slots=True)
+class DTPRecord(_SegmentRecord):
+    date_time_qualifier: str
+    date_time_format_qualifier: str
+    date_time_period: str
+    _model: ClassVar[type] = DTP
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({"date_time_qualifier", "date_time_format_qualifier"})
+
+
+@dataclass(slots=True)
+class REFRecord(_SegmentRecord):
+    reference_identification_qualifier: str
+    reference_identification: str
+    description: Optional[str]
+    _model: ClassVar[type] = REF
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({"reference_identification_qualifier"})
+
+
+@dataclass(slots=True)
+class NM1Record(_SegmentRecord):
+    entity_identifier_code: str
+    entity_type_qualifier: str
+    name_last_or_organization_name: Optional[str]
+    name_first: Optional[str]
+    name_middle: Optional[str]
+    identification_code_qualifier: Optional[str]
+    identification_code: Optional[str]
+    entity_relationship_code: Optional[str]
+    entity_identifier_code_2: Optional[str]
+    _model: ClassVar[type] = NM1
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({
+        "entity_identifier_code", "entity_type_qualifier", "identification_code_qualifier",
+        "entity_relationship_code", "entity_identifier_code_2"})
+
+
+@dataclass(slots=True)
+class PERRecord(_SegmentRecord):
+    contact_function_code: str
+    contact_enumeration_code: Optional[str]
+    contact_communication_number_qualifier: str
+    contact_communication_number: str
+    _model: ClassVar[type] = PER
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({
+        "contact_function_code", "contact_enumeration_code", "contact_communication_number_qualifier"})
+
+
+@dataclass(slots=True)
+class N3Record(_SegmentRecord):
+    address_information_1: str
+    address_information_2: Optional[str]
+    _model: ClassVar[type] = N3
+
+
+@dataclass(slots=True)
+class N4Record(_SegmentRecord):
+    city_name: str
+    state_or_province_code: str
+    postal_code: str
+    country_code: Optional[str]
+    location_identifier: Optional[str]
+    _model: ClassVar[type] = N4
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({"city_name", "state_or_province_code", "country_code"})
+
+
+@dataclass(slots=True)
+class DMGRecord(_SegmentRecord):
+    date_time_format_qualifier: str
+    date_time_period: str
+    gender_code: str
+    race_or_ethnicity_code: Optional[str]
+    _model: ClassVar[type] = DMG
+    # Birth dates repeat heavily across a book of business, so they are interned too
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({
+        "date_time_format_qualifier", "date_time_period", "gender_code", "race_or_ethnicity_code"})
+
+
+@dataclass(slots=True)
+class HDRecord(_SegmentRecord):
+    maintenance_reason_code: str
+    maintenance_type_code: Optional[str]
+    source_of_submission_code: str
+    plan_coverage_description: str
+    employee_status_code: Optional[str]
+    _model: ClassVar[type] = HD
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({
+        "maintenance_reason_code", "maintenance_type_code", "source_of_submission_code",
+        "plan_coverage_description", "employee_status_code"})
+
+
+@dataclass(slots=True)
+class AMTRecord(_SegmentRecord):
+    amount_qualifier_code: str
+    monetary_amount: str
+    _model: ClassVar[type] = AMT
+    _code_fields: ClassVar[FrozenSet[str]] = frozenset({"amount_qualifier_code"})
+
+
+@dataclass(slots=True)
+class CoverageRecord:
+    hd_segment: HDRecord
+    dtp_segments: Tuple[DTPRecord, ...] = ()
+    amt_segments: Tuple[AMTRecord, ...] = ()
+    ref_segments: Tuple[REFRecord, ...] = ()
+
+    @staticmethod
+    def from_model(coverage: Coverage) -> "CoverageRecord":
+        return CoverageRecord(HDRecord.from_model(coverage.hd_segment),
+                              tuple(DTPRecord.from_model(dtp) for dtp in coverage.dtp_segments),
+                              tuple(AMTRecord.from_model(amt) for amt in coverage.amt_segments),
+                              tuple(REFRecord.from_model(ref) for ref in coverage.ref_segments))
+
+    def to_model(self) -> Coverage:
+        return _construct_trusted(Coverage, {
+            "hd_segment": self.hd_segment.to_model(),
+            "dtp_segments": [dtp.to_model() for dtp in self.dtp_segments],
+            "amt_segments": [amt.to_model() for amt in self.amt_segments],
+            "ref_segments": [ref.to_model() for ref in self.ref_segments],
+        })
+
+
+_SEGMENT_RECORDS = {"nm1_segment": NM1Record, "per_segment": PERRecord, "n3_segment": N3Record,
+                    "n4_segment": N4Record, "dmg_segment": DMGRecord, "hd_segment": HDRecord}
+
+
+@dataclass(slots=True)
+class NM1LoopRecord:
+    loop_id: str
+    nm1_segment: NM1Record
+    per_segment: Optional[PERRecord] = None
+    n3_segment: Optional[N3Record] = None
+    n4_segment: Optional[N4Record] = None
+    dmg_segment: Optional[DMGRecord] = None
+
+    @staticmethod
+    def from_model(nm1_loop: NM1Loop) -> "NM1LoopRecord":
+        data = nm1_loop.__dict__
+        return NM1LoopRecord(sys.intern(nm1_loop.loop_id), *[
+            _SEGMENT_RECORDS[name].from_model(data[name]) if data[name] is not None else None
+            for name in NM1LoopRecord.__slots__[1:]])
+
+    def to_model(self) -> NM1Loop:
+        nm1_loop_data = {"loop_id": self.loop_id}
+        for name in NM1LoopRecord.__slots__[1:]:
+            segment = getattr(self, name)
+            nm1_loop_data[name] = segment.to_model() if segment is not None else None
+        return _construct_trusted(NM1Loop, nm1_loop_data)
+
+
+@dataclass(slots=True)
+class INSRecord:
+    yes_no_response_code: str
+    dependent_code: str
+    maintenance_type_code: str
+    maintenance_reason_code: Optional[str]
+    benefit_status_code: Optional[str]
+    medicare_status_code: Optional[str]
+    occ_length_code: Optional[str]
+    handicap_ind: Optional[str]
+    ref_segments: Tuple[REFRecord, ...] = ()
+    dtp_segments: Tuple[DTPRecord, ...] = ()
+    nm1_segment: Optional[NM1Record] = None
+    per_segment: Optional[PERRecord] = None
+    n3_segment: Optional[N3Record] = None
+    n4_segment: Optional[N4Record] = None
+    dmg_segment: Optional[DMGRecord] = None
+    hd_segment: Optional[HDRecord] = None
+    coverages: Tuple[CoverageRecord, ...] = ()
+    nm1_loops: Tuple[NM1LoopRecord, ...] = ()
+
+    @staticmethod
+    def from_model(ins: INS) -> "INSRecord":
+        data = ins.__dict__
+        record = INSRecord(*[_intern_code(data[name]) for name in _INS_CODE_FIELDS])
+        record.ref_segments = tuple(REFRecord.from_model(ref) for ref in ins.ref_segments)
+        record.dtp_segments = tuple(DTPRecord.from_model(dtp) for dtp in ins.dtp_segments)
+        for name, record_cls in _SEGMENT_RECORDS.items():
+            segment = data[name]
+            if segment is not None:
+                setattr(record, name, record_cls.from_model(segment))
+        if ins.coverages:
+            record.coverages = tuple(CoverageRecord.from_model(coverage) for coverage in ins.coverages)
+            record.hd_segment = record.coverages[0].hd_segment
+        if ins.nm1_loops:
+            record.nm1_loops = tuple(NM1LoopRecord.from_model(nm1_loop) for nm1_loop in ins.nm1_loops)
+        return record
+
+    def to_model(self) -> INS:
+        ins_data = {name: getattr(self, name) for name in _INS_CODE_FIELDS}
+        ins_data["ref_segments"] = [ref.to_model() for ref in self.ref_segments]
+        ins_data["dtp_segments"] = [dtp.to_model() for dtp in self.dtp_segments]
+        for name in _SEGMENT_RECORDS:
+            segment = getattr(self, name)
+            ins_data[name] = segment.to_model() if segment is not None else None
+        ins_data["coverages"] = [coverage.to_model() for coverage in self.coverages]
+        if ins_data["coverages"]:
+            ins_data["hd_segment"] = ins_data["coverages"][0].hd_segment
+        ins_data["nm1_loops"] = [nm1_loop.to_model() for nm1_loop in self.nm1_loops]
+        return _construct_trusted(INS, ins_data)
+
+
+_INS_CODE_FIELDS = INSRecord.__slots__[:8]
+
+
+def compact_members(members: Iterable[INS]) -> Iterator[INSRecord]:
+    """Converts parsed members (e.g. ins_834.iter_ins_file) to INSRecord one at a time."""
+    for ins in members:
+        yield INSRecord.from_model(ins)
+
+
+# Flat value tuples
+#
+# Plain nested tuples of strings pickle far faster than pydantic models, so process pools
+# ship members as member_to_values(ins) and rebuild them with member_from_values(values),
+# which does not re-validate.
+
+_MEMBER_CHILD_MODELS = (("nm1_segment", NM1), ("per_segment", PER), ("n3_segment", N3),
+                        ("n4_segment", N4), ("dmg_segment", DMG), ("hd_segment", HD))
+_MODEL_FIELD_NAMES = {model: tuple(model.model_fields) for model in (REF, DTP, NM1, PER, N3, N4, DMG, HD, AMT)}
+_INS_VALUE_FIELDS = tuple(name for name in INS.model_fields
+                          if name not in ("ref_segments", "dtp_segments", "coverages", "nm1_loops") and not name.endswith("_segment"))
+_NM1_LOOP_CHILD_MODELS = _MEMBER_CHILD_MODELS[:5]  # NM1 loops have no HD
+
+
+def _segment_values(model: Optional[BaseModel]) -> Optional[tuple]:
+    if model is None:
+        return None
+    data = model.__dict__
+    return tuple([data[name] for name in _MODEL_FIELD_NAMES[type(model)]])
+
+
+def _segment_from_values(model_cls, values: Optional[tuple]):
+    if values is None:
+        return None
+    return _construct_trusted(model_cls, dict(zip(_MODEL_FIELD_NAMES[model_cls], values)))
+
+
+def member_to_values(ins: INS) -> tuple:
+    data = ins.__dict__
+    return (tuple([data[name] for name in _INS_VALUE_FIELDS]),
+            tuple([_segment_values(ref) for ref in ins.ref_segments]),
+            tuple([_segment_values(dtp) for dtp in ins.dtp_segments]),
+            tuple([_segment_values(data[name]) for name, _ in _MEMBER_CHILD_MODELS]),
+            tuple([(nm1_loop.loop_id, *[_segment_values(getattr(nm1_loop, name)) for name, _ in _NM1_LOOP_CHILD_MODELS])
+                   for nm1_loop in ins.nm1_loops]),
+            tuple([(_segment_values(coverage.hd_segment),
+                    tuple([_segment_values(dtp) for dtp in coverage.dtp_segments]),
+                    tuple([_segment_values(amt) for amt in coverage.amt_segments]),
+                    tuple([_segment_values(ref) for ref in coverage.ref_segments]))
+                   for coverage in ins.coverages]))
+
+
+def _nm1_loop_from_values(values: tuple) -> NM1Loop:
+    nm1_loop_data = {"loop_id": values[0]}
+    for (name, model_cls), segment_values in zip(_NM1_LOOP_CHILD_MODELS, values[1:]):
+        nm1_loop_data[name] = _segment_from_values(model_cls, segment_values)
+    return _construct_trusted(NM1Loop, nm1_loop_data)
+
+
+def _coverage_from_values(values: tuple) -> Coverage:
+    hd_values, dtp_values, amt_values, ref_values = values
+    return _construct_trusted(Coverage, {
+        "hd_segment": _segment_from_values(HD, hd_values),
+        "dtp_segments": [_segment_from_values(DTP, dtp) for dtp in dtp_values],
+        "amt_segments": [_segment_from_values(AMT, amt) for amt in amt_values],
+        "ref_segments": [_segment_from_values(REF, ref) for ref in ref_values],
+    })
+
+
+def member_from_values(values: tuple) -> INS:
+    ins_values, ref_values, dtp_values, child_values, nm1_loop_values, coverage_values = values
+    ins_data = dict(zip(_INS_VALUE_FIELDS, ins_values))
+    ins_data["ref_segments"] = [_segment_from_values(REF, ref) for ref in ref_values]
+    ins_data["dtp_segments"] = [_segment_from_values(DTP, dtp) for dtp in dtp_values]
+    for (name, model_cls), segment_values in zip(_MEMBER_CHILD_MODELS, child_values):
+        ins_data[name] = _segment_from_values(model_cls, segment_values)
+    ins_data["nm1_loops"] = [_nm1_loop_from_values(nm1_loop) for nm1_loop in nm1_loop_values]
+    ins_data["coverages"] = [_coverage_from_values(coverage) for coverage in coverage_values]
+    if ins_data["coverages"]:
+        ins_data["hd_segment"] = ins_data["coverages"][0].hd_segment  # same object, as after parsing
+    return _construct_trusted(INS, ins_data)
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+from loguru import logger
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from openpyxl import Workbook
+
+from edi_utils import DEFAULT_CHUNK_SIZE, EdiTokenizer
+from ins_834 import iter_ins_fields
+from ins_class import INS, INS_FIELDS, NAME_LOOP_SEGMENTS
+from ins_excel import EXCEL_MAX_ROWS, SheetFamily, discard_workbook
+from ins_incremental import iter_ins_blocks
+
+# Member-level diff of two 834 files, e.g. a carrier's corrected resend against the original.
+#
+# Members are matched by the ins_incremental member key (subscriber ID REF*0F | NM109, with
+# an occurrence suffix for repeats) and compared by the hash of their raw INS loop first:
+# identical loops are never parsed. The old file's keys, hashes and raw loops go to a
+# scratch SQLite database, which also holds the key counts iter_ins_blocks numbers repeated
+# keys with, so memory stays bounded by one member and each file is read once. Only loops
+# whose hash differs are parsed on both sides and compared field by field.
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+_INSERT_BATCH_ROWS = 10000
+
+
+class FieldChange(NamedTuple):
+    """One differing field; old or new is None when the field (or its segment) is absent on that side."""
+    field: str
+    old: Optional[str]
+    new: Optional[str]
+
+
+class MemberDiff(NamedTuple):
+    status: str  # ADDED, REMOVED or MODIFIED
+    member_key: str
+    changes: Tuple[FieldChange, ...] = ()
+
+
+def _flatten_segment(flat: Dict[str, str], prefix: str, segment) -> None:
+    if segment is None:
+        return
+    for name, value in segment.__dict__.items():
+        if value is not None:
+            flat[f"{prefix}.{name}"] = value
+
+
+def _flatten_repeats(flat: Dict[str, str], prefix: str, segments: Iterable, qualifier: str) -> None:
+    # Repeatable segments are keyed by their qualifier (ref[0F], dtp[348]); repeats get #2, #3 ...
+    occurrences: Dict[str, int] = {}
+    for segment in segments:
+        code = getattr(segment, qualifier)
+        occurrence = occurrences[code] = occurrences.get(code, 0) + 1
+        _flatten_segment(flat, f"{prefix}[{code}]" if occurrence == 1 else f"{prefix}[{code}#{occurrence}]", segment)
+
+
+def flatten_member(ins: INS) -> Dict[str, str]:
+    """The member's values as field path -> value, e.g. "nm1.name_first", "ref[0F].reference_identification",
+    "hd[2].dtp[348].date_time_period" (coverages are numbered in file order). Absent values are left out."""
+    data = ins.__dict__
+    flat = {f"ins.{name}": data[name] for name in INS_FIELDS if data[name] is not None}
+    for prefix, attr, _ in NAME_LOOP_SEGMENTS:
+        _flatten_segment(flat, prefix, getattr(ins, attr))
+    _flatten_repeats(flat, "ref", ins.ref_segments, "reference_identification_qualifier")
+    _flatten_repeats(flat, "dtp", ins.dtp_segments, "date_time_qualifier")
+    for coverage_seq, coverage in enumerate(ins.coverages, 1):
+        prefix = f"hd[{coverage_seq}]"
+        _flatten_segment(flat, prefix, coverage.hd_segment)
+        _flatten_repeats(flat, f"{prefix}.dtp", coverage.dtp_segments, "date_time_qualifier")
+        _flatten_repeats(flat, f"{prefix}.amt", coverage.amt_segments, "amount_qualifier_code")
+        _flatten_repeats(flat, f"{prefix}.ref", coverage.ref_segments, "reference_identification_qualifier")
+    for loop_seq, nm1_loop in enumerate(ins.nm1_loops, 1):
+        prefix = f"nm1_loop[{loop_seq}]"
+        flat[f"{prefix}.loop_id"] = nm1_loop.loop_id
+        for segment_prefix, attr, _ in NAME_LOOP_SEGMENTS:
+            _flatten_segment(flat, f"{prefix}.{segment_prefix}", getattr(nm1_loop, attr))
+    return flat
+
+
+def diff_members(old: INS, new: INS) -> List[FieldChange]:
+    """Field-level differences between two versions of a member, in field path order."""
+    old_flat = flatten_member(old)
+    new_flat = flatten_member(new)
+    return [FieldChange(field, old_flat.get(field), new_flat.get(field))
+            for field in sorted(old_flat.keys() | new_flat.keys())
+            if old_flat.get(field) != new_flat.get(field)]
+
+
+def _parse_block(tokenizer: EdiTokenizer, segments: List[str], trusted: bool) -> INS:
+    members = list(iter_ins_fields(map(tokenizer.split_segment, segments), trusted=trusted, log_summary=False))
+    return members[0]
+
+
+def iter_member_diffs(old_filepath, new_filepath, work_dir: Optional[str] = None, trusted: bool = False,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[MemberDiff]:
+    """
+    Compares the members of two 834 files.
+
+    Yields added and modified members in the new file's order, then removed members in the
+    old file's order. Members whose loops differ only in formatting (e.g. other delimiters)
+    are not reported.
+
+    Args:
+        old_filepath: The earlier file.
+        new_filepath: The file compared against it.
+        work_dir: Directory for the scratch database (default: the system temp directory).
+        trusted: Build the models without validation (see ins_class).
+        chunk_size: Number of characters read per file read.
+    Raises:
+        edi_utils.EnvelopeError: If either file's envelopes do not match, e.g. a truncated
+            resend, before any removed member is reported.
+    """
+    handle, work_path = tempfile.mkstemp(suffix=".insdiff", dir=work_dir)
+    os.close(handle)
+    connection = sqlite3.connect(work_path)
+    counts = {ADDED: 0, MODIFIED: 0, REMOVED: 0, "unchanged": 0}
+    try:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("CREATE TABLE old_member (seq INTEGER PRIMARY KEY, member_key TEXT NOT NULL UNIQUE,"
+                           " block_hash TEXT NOT NULL, segments TEXT NOT NULL, seen INTEGER NOT NULL DEFAULT 0)")
+        old_tokenizer = None
+        rows = []
+        for old_tokenizer, block in iter_ins_blocks(old_filepath, connection, chunk_size):
+            rows.append((block.member_key, block.block_hash, json.dumps(block.segments)))
+            if len(rows) >= _INSERT_BATCH_ROWS:
+                connection.executemany("INSERT INTO old_member (member_key, block_hash, segments) VALUES (?, ?, ?)", rows)
+                rows.clear()
+        connection.executemany("INSERT INTO old_member (member_key, block_hash, segments) VALUES (?, ?, ?)", rows)
+
+        for new_tokenizer, block in iter_ins_blocks(new_filepath, connection, chunk_size):
+            row = connection.execute("SELECT seq, block_hash FROM old_member WHERE member_key=?",
+                                     (block.member_key,)).fetchone()
+            if row is None:
+                counts[ADDED] += 1
+                yield MemberDiff(ADDED, block.member_key)
+                continue
+            seq, old_hash = row
+            connection.execute("UPDATE old_member SET seen=1 WHERE seq=?", (seq,))
+            if old_hash == block.block_hash:
+                counts["unchanged"] += 1
+                continue
+            (old_segments,) = connection.execute("SELECT segments FROM old_member WHERE seq=?", (seq,)).fetchone()
+            changes = diff_members(_parse_block(old_tokenizer, json.loads(old_segments), trusted),
+                                   _parse_block(new_tokenizer, block.segments, trusted))
+            if not changes:
+                counts["unchanged"] += 1
+                continue
+            counts[MODIFIED] += 1
+            yield MemberDiff(MODIFIED, block.member_key, tuple(changes))
+
+        for (member_key,) in connection.execute("SELECT member_key FROM old_member WHERE seen=0 ORDER BY seq"):
+            counts[REMOVED] += 1
+            yield MemberDiff(REMOVED, member_key)
+        logger.info(f"Diff of {old_filepath} -> {new_filepath}: {counts}")
+    finally:
+        connection.close()
+        os.remove(work_path)
+
+
+def write_diff_json(diffs: Iterable[MemberDiff], filename: str) -> Dict[str, int]:
+    """
+    Streams diffs to a JSON report:
+    {"members": [{"status": ..., "member_key": ..., "changes": [[field, old, new], ...]}, ...],
+     "summary": {"added": n, "modified": n, "removed": n}}
+
+    Returns:
+        The summary counts.
+    """
+    counts = {ADDED: 0, MODIFIED: 0, REMOVED: 0}
+    with open(filename, "w") as outfile:
+        outfile.write('{"members": [')
+        separator = "\n"
+        for diff in diffs:
+            counts[diff.status] += 1
+            entry = {"status": diff.status, "member_key": diff.member_key}
+            if diff.changes:
+                entry["changes"] = [list(change) for change in diff.changes]
+            outfile.write(separator + json.dumps(entry, separators=(",", ":")))
+            separator = ",\n"
+        outfile.write(f'\n], "summary": {json.dumps(counts)}}}\n')
+    return counts
+
+
+DIFF_HEADER = ["Status", "MemberKey", "Field", "Old", "New"]
+
+
+def write_diff_excel(diffs: Iterable[MemberDiff], filename: str, max_rows: int = EXCEL_MAX_ROWS) -> Dict[str, int]:
+    """
+    Streams diffs to a write-only workbook: a DIFF sheet with one row per changed field (one
+    row per added / removed member), rolling over to "DIFF (2)", ... at max_rows, and a
+    SUMMARY sheet.
+
+    Returns:
+        The summary counts.
+    """
+    counts = {ADDED: 0, MODIFIED: 0, REMOVED: 0}
+    wb = Workbook(write_only=True)
+    summary_ws = wb.create_sheet("SUMMARY")
+    diff_sheets = SheetFamily(wb, "DIFF", DIFF_HEADER, max_rows, filename)
+    member = 0
+    try:
+        for diff in diffs:
+            member += 1
+            counts[diff.status] += 1
+            if diff.changes:
+                rows = [[diff.status, diff.member_key, *change] for change in diff.changes]
+            else:
+                rows = [[diff.status, diff.member_key, None, None, None]]
+            diff_sheets.append(rows, member)
+    except BaseException:
+        discard_workbook(wb)
+        raise
+    summary_ws.append(["Status", "Members"])
+    for status, count in counts.items():
+        summary_ws.append([status, count])
+    wb.save(filename)
+    logger.info(f"Diff report written: {filename} {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report added, removed and modified members between two 834 files")
+    parser.add_argument("old", help="earlier 834 file")
+    parser.add_argument("new", help="834 file compared against it")
+    parser.add_argument("-o", "--output", default="ins_diff.json", help="report file, .json or .xlsx")
+    parser.add_argument("--work-dir", help="directory for the scratch database")
+    parser.add_argument("--trusted", action="store_true", help="build models without validation")
+    args = parser.parse_args()
+
+    diffs = iter_member_diffs(args.old, args.new, args.work_dir, args.trusted)
+    if args.output.endswith(".xlsx"):
+        counts = write_diff_excel(diffs, args.output)
+    else:
+        counts = write_diff_json(diffs, args.output)
+    print(f"{args.output}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
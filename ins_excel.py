@@ -1,6 +1,13 @@
+import contextlib
+import json
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
-from typing import List
+from typing import Iterable, List, Optional
+
+import ins_metrics
 
 from openpyxl import Workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
@@ -8,8 +15,9 @@ from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.comments import Comment
 from openpyxl.cell import Cell
 from openpyxl.styles import Color, PatternFill, Font
+from openpyxl.cell import WriteOnlyCell
 
-from ins_class import INS
+from ins_class import INS, member_to_values, member_from_values
 
 def create_excel_spreadsheet_openpyxl(data: List[INS], filename: str = "output.xlsx"):
     """Creates an Excel spreadsheet from a list of dictionaries using openpyxl.
@@ -300,6 +308,7 @@ def add_sheetdata_INS_DTP(ws:Worksheet, list:List[INS], rowstart:int, refrow:int
 
 
 def create_excel(list:List[INS]):
+    started=time.perf_counter()
     filename="ins.xlsx"
     wb=create_workbook(filename)
     # Delete the default sheet
@@ -315,5 +324,338 @@ def create_excel(list:List[INS]):
     ws3=create_worksheet(wb, "INS-DTP")
     add_sheetdata_INS_DTP(ws3, list, 0, 0)
 
+    ws4=create_worksheet(wb, "INS-HD")
+    add_sheetdata_INS_HD(ws4, list, 0)
+
     wb.save(filename)
+    metrics=ins_metrics.ACTIVE
+    if metrics is not None:
+        metrics.inc("edi_stage_seconds_total", "excel", time.perf_counter()-started)
+        metrics.inc("edi_stage_items_total", "excel", len(list))
+        for ws in (ws1, ws2, ws3, ws4):
+            metrics.inc("edi_excel_rows_total", ws.title, ws.max_row)
+            metrics.inc("edi_excel_cells_total", ws.title, ws.max_row*ws.max_column)
     logger.info(f"Excel spreadsheet created successfully: {filename}")
+
+
+# Streaming (write-only) export
+#
+# Same sheets and column layout as create_excel, but written with an openpyxl write-only
+# workbook: rows are appended whole and flushed to temporary files as they go, so memory
+# stays bounded regardless of member count and the members can come from a generator
+# (e.g. ins_834.iter_ins_file). None entries are the empty spacer columns.
+
+INS_HEADER = ["RelID", "Yes/No", "Reltn", "MaintType", "MaintReason", "BenStatus", "Medicare", "OccLength",
+              "Handicap", "", "IdCode", "IdCodeQual", "LastNameOrOrg", "FirstName", "MiddleName", "NMCdQual",
+              "NMCd", "EntRelCd", "EntIdCd", "ContFnCd", "ContEnuCd", "ContCommQual", "ContCommDetail", None,
+              "Addr1", "Addr2", "City", "State", "Zip", "Country", "LocId", None,
+              "DOB", "M/F", "Race", None, "MtRsnCd", "SrcCd", "CvrgCd", "EmpStCd"]
+INS_REF_HEADER = ["RefRow", "LastOrOrg", "FirstName", "Mid", "DOB", "ID", None, "IDQual", "ID", "Desc"]
+INS_DTP_HEADER = INS_REF_HEADER
+# One row per coverage (2300 HD loop); Dates, Amounts and Refs list the coverage's other
+# DTPs, its AMTs and REFs as "qualifier=value" pairs joined with ";"
+INS_HD_HEADER = INS_REF_HEADER[:7]+["CvgSeq", "MtRsnCd", "MtTypeCd", "SrcCd", "PlanCvgDesc", "EmpStCd",
+                                    "BeginDt", "EndDt", "Dates", "Amounts", "Refs"]
+
+
+def _values(segment, names):
+    if segment is None:
+        return [None] * len(names)
+    return [getattr(segment, name) for name in names]
+
+
+def ins_row(ins:INS, relid:int)->list:
+    """One INS sheet row, laid out as in add_sheetdata_INS."""
+    return ([relid, ins.yes_no_response_code, ins.dependent_code, ins.maintenance_type_code,
+             ins.maintenance_reason_code, ins.benefit_status_code, ins.medicare_status_code,
+             ins.occ_length_code, ins.handicap_ind, ""]
+            + _values(ins.nm1_segment, ("entity_identifier_code", "entity_type_qualifier",
+                                        "name_last_or_organization_name", "name_first", "name_middle",
+                                        "identification_code_qualifier", "identification_code",
+                                        "entity_relationship_code", "entity_identifier_code_2"))
+            + _values(ins.per_segment, ("contact_function_code", "contact_enumeration_code",
+                                        "contact_communication_number_qualifier", "contact_communication_number"))
+            + [None]
+            + _values(ins.n3_segment, ("address_information_1", "address_information_2"))
+            + _values(ins.n4_segment, ("city_name", "state_or_province_code", "postal_code",
+                                       "country_code", "location_identifier"))
+            + [None]
+            + _values(ins.dmg_segment, ("date_time_period", "gender_code", "race_or_ethnicity_code"))
+            + [None]
+            + _values(ins.hd_segment, ("maintenance_reason_code", "maintenance_type_code",
+                                       "plan_coverage_description", "employee_status_code")))
+
+
+def _member_columns(ins:INS, refrow:int)->list:
+    """RefRow plus the member identification columns shared by the INS-REF, INS-DTP and INS-HD sheets."""
+    nm1=ins.nm1_segment
+    dob=ins.dmg_segment.date_time_period if ins.dmg_segment else None
+    if nm1 is None:
+        return [refrow, None, None, None, dob, None, None]
+    return [refrow, nm1.name_last_or_organization_name, nm1.name_first, nm1.name_middle, dob,
+            nm1.identification_code, None]
+
+
+def ins_ref_rows(ins:INS, refrow:int)->Iterable[list]:
+    """INS-REF sheet rows for one member, laid out as in add_sheetdata_INS_REF."""
+    member=_member_columns(ins, refrow)
+    for ref in ins.ref_segments:
+        yield member+[ref.reference_identification_qualifier, ref.reference_identification, ref.description]
+
+
+def ins_dtp_rows(ins:INS, refrow:int)->Iterable[list]:
+    """INS-DTP sheet rows for one member, laid out as in add_sheetdata_INS_DTP."""
+    member=_member_columns(ins, refrow)
+    for dtp in ins.dtp_segments:
+        yield member+[dtp.date_time_qualifier, dtp.date_time_format_qualifier, dtp.date_time_period]
+
+
+def _pairs(pairs:Iterable[tuple])->Optional[str]:
+    return ";".join(f"{qualifier}={value}" for qualifier, value in pairs) or None
+
+
+def ins_hd_rows(ins:INS, refrow:int)->Iterable[list]:
+    """INS-HD sheet rows for one member, one per coverage (see INS_HD_HEADER)."""
+    member=_member_columns(ins, refrow)
+    for coverage_seq, coverage in enumerate(ins.coverages, 1):
+        hd=coverage.hd_segment
+        begin=end=None
+        other_dates=[]
+        for dtp in coverage.dtp_segments:
+            if dtp.date_time_qualifier=="348" and begin is None:
+                begin=dtp.date_time_period
+            elif dtp.date_time_qualifier=="349" and end is None:
+                end=dtp.date_time_period
+            else:
+                other_dates.append((dtp.date_time_qualifier, dtp.date_time_period))
+        yield member+[coverage_seq, hd.maintenance_reason_code, hd.maintenance_type_code, hd.source_of_submission_code,
+                      hd.plan_coverage_description, hd.employee_status_code, begin, end, _pairs(other_dates),
+                      _pairs((amt.amount_qualifier_code, amt.monetary_amount) for amt in coverage.amt_segments),
+                      _pairs((ref.reference_identification_qualifier, ref.reference_identification)
+                             for ref in coverage.ref_segments)]
+
+
+def add_sheetdata_INS_HD(ws:Worksheet, list:List[INS], refrow:int)->int:
+    for col, value in enumerate(INS_HD_HEADER, 1):
+        if value is not None:
+            setcellhead(ws.cell(row=1, column=col, value=value))
+    for ins in list:
+        refrow+=1
+        for row in ins_hd_rows(ins, refrow):
+            ws.append(row)
+    return refrow
+
+
+def header_row(ws:Worksheet, header:List[Optional[str]])->list:
+    """Styled WriteOnlyCell header row; None spacer columns stay unstyled and empty."""
+    row=[]
+    for value in header:
+        if value is None:
+            row.append(None)
+            continue
+        cell=WriteOnlyCell(ws, value=value)
+        setcellhead(cell)
+        row.append(cell)
+    return row
+
+
+def create_excel_streaming(members:Iterable[INS], filename:str="ins.xlsx")->int:
+    """Writes the INS, INS-REF, INS-DTP and INS-HD sheets in a single pass over members.
+
+    Args:
+        members: Parsed members; may be a generator, each member is visited once.
+        filename: The name of the Excel file to create (default: "ins.xlsx").
+    Returns:
+        The number of members written.
+    """
+    if os.path.isfile(filename):
+        logger.info(f"Existing workbook filename:{filename}.. will be overwritten")
+    # Sheets past Excel's row limit roll over to "INS-REF (2)" etc. (see create_excel_sharded)
+    return _write_sheet_families(members, filename, 1, EXCEL_MAX_ROWS)[0]
+
+
+# Sharded export
+#
+# Excel caps a sheet at 1,048,576 rows. create_excel_sharded rolls over to "INS-REF (2)",
+# ... sheets (or, with per_workbook=True, to ins_001.xlsx, ins_002.xlsx, ... files) once a row budget is
+# reached, and writes a JSON manifest of which members went to which shard. A member's
+# rows are never split across shards. RelID stays the member's sequence number + 1 and
+# RefRow the sequence number, so rows still join across shards.
+
+EXCEL_MAX_ROWS = 1_048_576
+
+
+class SheetFamily:
+    """One logical sheet (e.g. INS-REF) spread over "INS-REF", "INS-REF (2)", ... sheets.
+
+    append() takes all rows of one member at a time, so a member's rows never straddle two
+    sheets. Each sheet gets a manifest entry (file, sheet, first/last member, rows) in shards.
+    """
+    def __init__(self, wb:Workbook, title:str, header:List[Optional[str]], max_rows:int=EXCEL_MAX_ROWS,
+                 filename:str="", shards:Optional[list]=None):
+        self.wb=wb
+        self.title=title
+        self.header=header
+        self.max_rows=max_rows
+        self.filename=os.path.basename(filename)
+        self.shards=[] if shards is None else shards
+        self.metrics=ins_metrics.ACTIVE
+        self.sheet_count=0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheet_count+=1
+        title=self.title if self.sheet_count==1 else f"{self.title} ({self.sheet_count})"
+        self.ws=self.wb.create_sheet(title)
+        self.ws.append(header_row(self.ws, self.header))
+        self.rows=1
+        self.entry={"file": self.filename, "sheet": title, "first_member": None, "last_member": None, "rows": 1}
+        self.shards.append(self.entry)
+
+    def append(self, rows:List[list], member:int):
+        if not rows:
+            return
+        if self.rows+len(rows)>self.max_rows and self.entry["first_member"] is not None:
+            self._new_sheet()
+        for row in rows:
+            self.ws.append(row)
+        if self.metrics is not None:
+            self.metrics.inc("edi_excel_rows_total", self.title, len(rows))
+            self.metrics.inc("edi_excel_cells_total", self.title, sum(map(len, rows)))
+        self.rows+=len(rows)
+        self.entry["rows"]=self.rows
+        if self.entry["first_member"] is None:
+            self.entry["first_member"]=member
+        self.entry["last_member"]=member
+
+
+def discard_workbook(wb:Workbook):
+    """Closes the sheets of an unsaved write-only workbook and removes their temporary files.
+
+    Without it the sheets' row writers are finalized after their files are closed, which
+    openpyxl reports as "I/O operation on closed file" when an export fails.
+    """
+    for ws in wb.worksheets:
+        if ws.closed:
+            continue
+        try:
+            with contextlib.suppress(Exception):  # keep the error that aborted the export
+                ws.close()
+        finally:
+            if ws._writer is not None:
+                ws._writer.cleanup()
+
+
+def _write_sheet_families(members:Iterable[INS], filename:str, first_member:int, max_rows:int)->tuple:
+    """Writes members to one write-only workbook, rolling sheets over at max_rows.
+
+    Returns (member count, manifest shard entries).
+    """
+    started=time.perf_counter()
+    shards=[]
+    wb=Workbook(write_only=True)
+    ins_sheets=SheetFamily(wb, "INS", INS_HEADER, max_rows, filename, shards)
+    ref_sheets=SheetFamily(wb, "INS-REF", INS_REF_HEADER, max_rows, filename, shards)
+    dtp_sheets=SheetFamily(wb, "INS-DTP", INS_DTP_HEADER, max_rows, filename, shards)
+    hd_sheets=SheetFamily(wb, "INS-HD", INS_HD_HEADER, max_rows, filename, shards)
+    member=first_member-1
+    try:
+        for ins in members:
+            member+=1
+            ins_sheets.append([ins_row(ins, member+1)], member)
+            ref_sheets.append(list(ins_ref_rows(ins, member)), member)
+            dtp_sheets.append(list(ins_dtp_rows(ins, member)), member)
+            hd_sheets.append(list(ins_hd_rows(ins, member)), member)
+    except BaseException:
+        discard_workbook(wb)
+        raise
+    wb.save(filename)
+    metrics=ins_metrics.ACTIVE
+    if metrics is not None:
+        # Includes the time spent producing members when they come from a parsing generator
+        metrics.inc("edi_stage_seconds_total", "excel", time.perf_counter()-started)
+        metrics.inc("edi_stage_items_total", "excel", member-first_member+1)
+    logger.info(f"Excel spreadsheet created successfully: {filename} members: {first_member}-{member}")
+    return member-first_member+1, shards
+
+
+def _write_workbook_shard(filename:str, first_member:int, member_values:List[tuple], max_rows:int)->list:
+    """Process pool side of create_excel_sharded(per_workbook=True)."""
+    return _write_sheet_families(map(member_from_values, member_values), filename, first_member, max_rows)[1]
+
+
+def _shard_filename(filename:str, shard:int)->str:
+    base, ext=os.path.splitext(filename)
+    return f"{base}_{shard:03d}{ext or '.xlsx'}"
+
+
+def _write_workbook_shards(members:Iterable[INS], filename:str, max_rows:int, workers:int)->tuple:
+    """Cuts members into workbooks that fit max_rows on every sheet and writes them,
+    in a process pool when workers > 1. Returns (member count, manifest shard entries)."""
+    shards=[]
+    pending=deque()
+    executor=ProcessPoolExecutor(max_workers=workers) if workers>1 else None
+
+    def write_shard(shard_number:int, first_member:int, shard_values:List[tuple]):
+        args=(_shard_filename(filename, shard_number), first_member, shard_values, max_rows)
+        if executor is None:
+            shards.extend(_write_workbook_shard(*args))
+            return
+        pending.append(executor.submit(_write_workbook_shard, *args))
+        while len(pending)>workers:  # bound the members held for shards in flight
+            shards.extend(pending.popleft().result())
+
+    total=0
+    shard_number=0
+    shard_values=[]
+    shard_rows=[1, 1, 1, 1]  # headers of the INS, INS-REF, INS-DTP and INS-HD sheets
+    try:
+        for ins in members:
+            needed=(1, len(ins.ref_segments), len(ins.dtp_segments), len(ins.coverages))
+            if shard_values and any(rows+more>max_rows for rows, more in zip(shard_rows, needed)):
+                shard_number+=1
+                write_shard(shard_number, total-len(shard_values)+1, shard_values)
+                shard_values=[]
+                shard_rows=[1, 1, 1, 1]
+            total+=1
+            shard_values.append(member_to_values(ins))
+            shard_rows=[rows+more for rows, more in zip(shard_rows, needed)]
+        if shard_values or not shard_number:
+            shard_number+=1
+            write_shard(shard_number, total-len(shard_values)+1, shard_values)
+        while pending:
+            shards.extend(pending.popleft().result())
+    finally:
+        if executor:
+            executor.shutdown()
+    return total, shards
+
+
+def create_excel_sharded(members:Iterable[INS], filename:str="ins.xlsx", max_rows:int=EXCEL_MAX_ROWS,
+                         per_workbook:bool=False, workers:int=1, manifest_filename:Optional[str]=None)->dict:
+    """Streams members to Excel, rolling over to new sheets or workbooks at max_rows rows.
+
+    Args:
+        members: Parsed members; may be a generator, each member is visited once.
+        filename: Workbook name; with per_workbook=True shards are named <base>_001.xlsx, ...
+        max_rows: Row budget per sheet, header included (default: Excel's limit).
+        per_workbook: Roll over to a new workbook file instead of a new sheet.
+        workers: With per_workbook=True, number of processes writing shards in parallel.
+        manifest_filename: Where to write the JSON manifest (default: <base>.manifest.json).
+    Returns:
+        The manifest: total members and, per shard, file, sheet, first/last member and rows.
+    """
+    if max_rows<2:
+        raise ValueError(f"max_rows must leave room for the header and one row, got {max_rows}")
+
+    if per_workbook:
+        total, shards=_write_workbook_shards(members, filename, max_rows, workers)
+    else:
+        total, shards=_write_sheet_families(members, filename, 1, max_rows)
+
+    manifest={"filename": filename, "max_rows": max_rows, "members": total, "shards": shards}
+    manifest_filename=manifest_filename or os.path.splitext(filename)[0]+".manifest.json"
+    with open(manifest_filename, "w") as outfile:
+        json.dump(manifest, outfile, indent=2)
+    logger.info(f"Excel export manifest written: {manifest_filename} shards: {len(shards)}")
+    return manifest
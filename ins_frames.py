@@ -0,0 +1,185 @@
+import argparse
+import datetime
+from loguru import logger
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+import ins_class
+from ins_class import CODE_COLUMNS as CATEGORY_COLUMNS, DTP_FIELDS, HD_FIELDS, INS, REF_FIELDS, member_values
+
+# pandas frames of parsed members, for analytics and dashboards.
+#
+# members_to_frames() visits each member once, collecting plain value lists (no dict per
+# row), and builds four frames keyed like the Parquet export (see ins_parquet): "members"
+# (INS fields plus the NM1/PER/N3/N4/DMG/HD fields with a segment prefix), "ref" and "dtp"
+# (member level child segments) and "coverage" (one row per 2300 HD loop); the columns and
+# the code columns stored as categoricals are ins_class's, shared with ins_parquet. CCYYMMDD dates are parsed
+# column-wise into datetime64 columns. The aggregates below work on whole columns only.
+
+# Maintenance type codes (INS03, HD01)
+MAINTENANCE_TYPES = {"001": "change", "021": "addition", "024": "termination", "025": "reinstatement",
+                     "030": "audit or compare"}
+
+DEFAULT_AGE_BANDS = (0, 18, 26, 35, 45, 55, 65, 200)
+
+MEMBER_COLUMNS = ["member_seq"] + ins_class.MEMBER_COLUMNS
+REF_COLUMNS = ["member_seq"] + REF_FIELDS
+DTP_COLUMNS = ["member_seq"] + DTP_FIELDS
+COVERAGE_COLUMNS = ["member_seq", "coverage_seq"] + HD_FIELDS + ["benefit_begin", "benefit_end"]
+
+
+class EnrollmentFrames(NamedTuple):
+    """The frames built by members_to_frames, joined on member_seq (and coverage_seq)."""
+    members: pd.DataFrame
+    ref: pd.DataFrame
+    dtp: pd.DataFrame
+    coverage: pd.DataFrame
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """CCYYMMDD strings to datetime64; missing or malformed values become NaT."""
+    return pd.to_datetime(values, format="%Y%m%d", errors="coerce")
+
+
+def _frame(rows: List[list], columns: List[str]) -> pd.DataFrame:
+    frame = pd.DataFrame(rows, columns=columns) if rows else pd.DataFrame({name: [] for name in columns})
+    for name in columns:
+        if name.endswith("_seq"):
+            frame[name] = frame[name].astype(np.int64)
+        elif name in CATEGORY_COLUMNS:
+            frame[name] = frame[name].astype("category")
+    return frame
+
+
+def members_to_frames(members: Iterable[INS]) -> EnrollmentFrames:
+    """
+    Builds the member, REF, DTP and coverage frames in one pass over members.
+
+    Added columns: members.subscriber_seq (member_seq of the subscriber a dependent
+    follows), members.birth_date, dtp.date and coverage.benefit_begin/benefit_end
+    (from the coverage's DTP*348 / DTP*349), all parsed column-wise.
+
+    Args:
+        members: Parsed members; may be a generator (e.g. ins_834.iter_ins_file).
+    """
+    member_rows: List[list] = []
+    ref_rows: List[list] = []
+    dtp_rows: List[list] = []
+    coverage_rows: List[list] = []
+    member_seq = 0
+    for ins in members:
+        member_seq += 1
+        member_rows.append([member_seq] + member_values(ins))
+        for ref in ins.ref_segments:
+            ref_data = ref.__dict__
+            ref_rows.append([member_seq] + [ref_data[name] for name in REF_FIELDS])
+        for dtp in ins.dtp_segments:
+            dtp_data = dtp.__dict__
+            dtp_rows.append([member_seq] + [dtp_data[name] for name in DTP_FIELDS])
+        for coverage_seq, coverage in enumerate(ins.coverages, 1):
+            hd_data = coverage.hd_segment.__dict__
+            coverage_rows.append([member_seq, coverage_seq] + [hd_data[name] for name in HD_FIELDS]
+                                 + [coverage.date("348"), coverage.date("349")])
+
+    members_frame = _frame(member_rows, MEMBER_COLUMNS)
+    # Dependents follow their subscriber's INS loop
+    is_subscriber = members_frame["yes_no_response_code"].eq("Y").to_numpy()
+    subscriber_positions = np.maximum.accumulate(np.where(is_subscriber, np.arange(len(members_frame)), 0))
+    members_frame["subscriber_seq"] = members_frame["member_seq"].to_numpy()[subscriber_positions] \
+        if len(members_frame) else np.array([], dtype=np.int64)
+    members_frame["birth_date"] = parse_dates(members_frame["dmg_date_time_period"])
+    dtp_frame = _frame(dtp_rows, DTP_COLUMNS)
+    dtp_frame["date"] = parse_dates(dtp_frame["date_time_period"])
+    coverage_frame = _frame(coverage_rows, COVERAGE_COLUMNS)
+    coverage_frame["benefit_begin"] = parse_dates(coverage_frame["benefit_begin"])
+    coverage_frame["benefit_end"] = parse_dates(coverage_frame["benefit_end"])
+    logger.info(f"Built frames for {member_seq} members: {len(ref_rows)} REF, {len(dtp_rows)} DTP, "
+                f"{len(coverage_rows)} coverage rows")
+    return EnrollmentFrames(members_frame, _frame(ref_rows, REF_COLUMNS), dtp_frame, coverage_frame)
+
+
+# Aggregates
+
+def maintenance_summary(members: pd.DataFrame) -> pd.DataFrame:
+    """Adds, terms, changes, ... : members per INS03 maintenance type code."""
+    counts = members["maintenance_type_code"].value_counts(sort=False)
+    summary = counts.rename("members").to_frame()
+    summary.index = summary.index.astype(str)
+    summary.insert(0, "maintenance_type", summary.index.map(MAINTENANCE_TYPES).fillna("other"))
+    return summary.sort_index()
+
+
+def member_states(members: pd.DataFrame) -> pd.Series:
+    """Each member's state (N403), dependents without an N4 taking their subscriber's."""
+    states = members["n4_state_or_province_code"].astype(object)
+    return states.fillna(states.groupby(members["subscriber_seq"]).transform("first")).fillna("unknown")
+
+
+def members_by_state_and_coverage(frames: EnrollmentFrames) -> pd.DataFrame:
+    """Member counts per state (rows) and plan coverage description, HD04 (columns)."""
+    states = pd.Series(member_states(frames.members).to_numpy(), index=frames.members["member_seq"].to_numpy())
+    coverage = frames.coverage
+    coverage_states = states.reindex(coverage["member_seq"].to_numpy()).to_numpy()
+    table = pd.crosstab(pd.Series(coverage_states, name="state"),
+                        pd.Series(coverage["plan_coverage_description"].astype(object).to_numpy(), name="coverage"))
+    return table
+
+
+def age_bands(members: pd.DataFrame, as_of: Optional[Union[str, datetime.date]] = None,
+              bands: Sequence[int] = DEFAULT_AGE_BANDS) -> pd.DataFrame:
+    """
+    Members per age band.
+
+    Args:
+        members: The members frame.
+        as_of: Date the ages are computed at (default: today).
+        bands: Band edges in years; band [a, b) is labeled "a-(b-1)", the last one "a+".
+    """
+    as_of = pd.Timestamp(as_of or datetime.date.today())
+    as_of_number = as_of.year * 10000 + as_of.month * 100 + as_of.day
+    birth = members["birth_date"]
+    birth_number = birth.dt.year * 10000 + birth.dt.month * 100 + birth.dt.day
+    # CCYYMMDD arithmetic gives completed years without per-row date math
+    ages = (as_of_number - birth_number) // 10000
+    labels = [f"{low}-{high - 1}" for low, high in zip(bands[:-2], bands[1:-1])] + [f"{bands[-2]}+"]
+    banded = pd.cut(ages, bins=list(bands), right=False, labels=labels)
+    counts = banded.value_counts(sort=False).rename("members").to_frame()
+    counts.index = counts.index.astype(str)
+    counts.index.name = "age_band"
+    unknown = int(ages.isna().sum())
+    if unknown:
+        counts.loc["unknown"] = unknown
+    return counts
+
+
+def enrollment_aggregates(frames: EnrollmentFrames, as_of: Optional[Union[str, datetime.date]] = None) -> Dict[str, pd.DataFrame]:
+    """The dashboard aggregates: maintenance types, members by state and coverage, age bands."""
+    return {
+        "maintenance": maintenance_summary(frames.members),
+        "state_coverage": members_by_state_and_coverage(frames),
+        "age_bands": age_bands(frames.members, as_of),
+    }
+
+
+def main():
+    from ins_834 import iter_ins_file
+    from ins_excel import create_excel_spreadsheet_openpyxl_df
+
+    parser = argparse.ArgumentParser(description="Print (and export) enrollment aggregates of an 834 file")
+    parser.add_argument("input", help="834 file")
+    parser.add_argument("--as-of", help="date ages are computed at (default: today)")
+    parser.add_argument("--trusted", action="store_true", help="build models without validation")
+    parser.add_argument("--excel-prefix", help="write each aggregate to <prefix>_<name>.xlsx")
+    args = parser.parse_args()
+
+    frames = members_to_frames(iter_ins_file(args.input, trusted=args.trusted))
+    for name, table in enrollment_aggregates(frames, args.as_of).items():
+        print(f"{name}:\n{table}\n")
+        if args.excel_prefix:
+            create_excel_spreadsheet_openpyxl_df(table.reset_index(), f"{args.excel_prefix}_{name}.xlsx")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import sqlite3
+from loguru import logger
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from edi_utils import DEFAULT_CHUNK_SIZE, EdiTokenizer, SegmentEnvelopeVerifier, tokenizer_from_stream
+from ins_834 import iter_ins_fields
+from ins_class import INS
+from ins_excel import create_excel_streaming
+
+# Incremental processing of full-replacement 834 files.
+#
+# Each INS loop is keyed by the subscriber ID (REF*0F) plus the member's NM1 ID code, and
+# its raw segment block is hashed. The key -> hash map of the previous run lives in a SQLite
+# index, so only loops whose hash changed, new keys and keys that disappeared are reported;
+# unchanged loops are never turned into models. Several members can share a key (e.g.
+# dependents with no NM1 ID code), so repeats within a file get an occurrence suffix (#2, ...).
+# The envelopes are verified while the blocks stream by (edi_utils.SegmentEnvelopeVerifier):
+# a truncated or miscounted file raises EnvelopeError instead of reporting its missing
+# members as dropped, and leaves the index untouched.
+
+ADDED = "added"
+CHANGED = "changed"
+DROPPED = "dropped"
+
+# Segment IDs that end an INS loop besides the next INS
+_LOOP_END_SEGMENTS = ("SE", "GE", "IEA")
+# INS loops whose member keys are numbered with one query and one executemany
+OCCURRENCE_BATCH_BLOCKS = 500
+
+
+class MemberChange(NamedTuple):
+    """One added, changed or dropped member. ins is None for dropped members."""
+    status: str
+    member_key: str
+    ins: Optional[INS]
+
+
+class InsBlock(NamedTuple):
+    """The raw segments of one INS loop, with its member key and content hash."""
+    member_key: str
+    block_hash: str
+    segments: List[str]
+
+
+def iter_ins_blocks(input_filepath, connection: sqlite3.Connection,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[EdiTokenizer, InsBlock]]:
+    """Streams the INS loops of a file as raw segment blocks without building any model.
+
+    Args:
+        input_filepath: Path to the input EDI file.
+        connection: SQLite connection for the occurrence count of each member key (temporary
+            table key_occurrence, emptied first), so memory does not grow with the member count.
+            Keys are looked up and counted OCCURRENCE_BATCH_BLOCKS blocks at a time.
+        chunk_size: Number of characters read per file read.
+    Yields:
+        (tokenizer for the file's delimiters, InsBlock) per INS loop, in file order.
+    Raises:
+        edi_utils.EnvelopeError: On the first envelope mismatch, or at the end of truncated
+            input before its last blocks are yielded.
+    """
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS key_occurrence ("
+                       " member_key TEXT PRIMARY KEY, occurrences INTEGER NOT NULL) WITHOUT ROWID")
+    connection.execute("DELETE FROM temp.key_occurrence")
+    pending: List[Tuple[str, List[str]]] = []  # (key without occurrence suffix, segments)
+
+    def number_pending() -> List[InsBlock]:
+        keys = list(dict.fromkeys(key for key, _ in pending))
+        placeholders = ",".join("?" * len(keys))
+        occurrences = dict(connection.execute(
+            "SELECT member_key, occurrences FROM temp.key_occurrence"
+            f" WHERE member_key IN ({placeholders})", keys))
+        blocks = []
+        for key, block in pending:
+            occurrence = occurrences[key] = occurrences.get(key, 0) + 1
+            block_hash = hashlib.blake2b("\n".join(block).encode("utf-8"), digest_size=16).hexdigest()
+            blocks.append(InsBlock(key if occurrence == 1 else f"{key}#{occurrence}", block_hash, block))
+        connection.executemany("INSERT OR REPLACE INTO temp.key_occurrence VALUES (?, ?)", occurrences.items())
+        pending.clear()
+        return blocks
+
+    with open(input_filepath, 'r', newline=None) as infile:
+        tokenizer, head = tokenizer_from_stream(infile, chunk_size)
+        separator = tokenizer.element_separator
+        ins_prefix = "INS" + separator
+        subscriber_prefix = "REF" + separator + "0F" + separator
+        nm1_prefix = "NM1" + separator
+        end_prefixes = tuple(segment_id + separator for segment_id in _LOOP_END_SEGMENTS)
+
+        block: List[str] = []
+        subscriber_id = nm1_id = ""
+        nm1_seen = False
+        envelopes = SegmentEnvelopeVerifier(tokenizer)
+        for segment in envelopes.verify(tokenizer.iter_segments(infile, chunk_size, head)):
+            ins = segment.startswith(ins_prefix)
+            if ins or (block and segment.startswith(end_prefixes)):
+                if block:
+                    pending.append((f"{subscriber_id}|{nm1_id}", block))
+                    if len(pending) >= OCCURRENCE_BATCH_BLOCKS:
+                        for ins_block in number_pending():
+                            yield tokenizer, ins_block
+                block = [segment] if ins else []
+                subscriber_id = nm1_id = ""
+                nm1_seen = False
+            elif not block:
+                continue  # envelope and header segments between loops
+            else:
+                block.append(segment)
+                if not subscriber_id and segment.startswith(subscriber_prefix):
+                    subscriber_id = segment.split(separator)[2]
+                elif not nm1_seen and segment.startswith(nm1_prefix):
+                    nm1_seen = True  # only the member's own (first) NM1 carries its ID
+                    nm1_fields = segment.split(separator)
+                    nm1_id = nm1_fields[9] if len(nm1_fields) > 9 else ""
+        envelopes.finish()
+        if block:
+            pending.append((f"{subscriber_id}|{nm1_id}", block))
+        if pending:
+            for ins_block in number_pending():
+                yield tokenizer, ins_block
+
+
+def open_member_index(index_path: str) -> sqlite3.Connection:
+    """Opens (creating if needed) the SQLite member state index."""
+    connection = sqlite3.connect(index_path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS member_state ("
+        " scope TEXT NOT NULL, member_key TEXT NOT NULL, block_hash TEXT NOT NULL,"
+        " PRIMARY KEY (scope, member_key)) WITHOUT ROWID")
+    return connection
+
+
+def iter_member_changes(input_filepath, index_path: str, scope: str = "", trusted: bool = False,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[MemberChange]:
+    """Compares a full-replacement 834 with the previous run and yields only the differences.
+
+    Added and changed loops are parsed into INS models; unchanged loops are only hashed.
+    Dropped members are reported after the whole file has been read and its envelopes
+    verified. The index is updated in one transaction that is committed only once the
+    iterator is exhausted, so an interrupted run, or one that raises EnvelopeError, leaves
+    the previous state untouched.
+
+    Args:
+        input_filepath: Path to today's full 834 file.
+        index_path: Path to the SQLite index file.
+        scope: Separates the state of independent feeds (e.g. one scope per group/carrier).
+        trusted: Build the models without validation (see ins_class).
+        chunk_size: Number of characters read per file read.
+    """
+    connection = open_member_index(index_path)
+    counts = {ADDED: 0, CHANGED: 0, DROPPED: 0, "unchanged": 0}
+    try:
+        connection.execute("CREATE TEMP TABLE seen_member (member_key TEXT PRIMARY KEY) WITHOUT ROWID")
+        for tokenizer, block in iter_ins_blocks(input_filepath, connection, chunk_size):
+            connection.execute("INSERT OR IGNORE INTO seen_member VALUES (?)", (block.member_key,))
+            row = connection.execute("SELECT block_hash FROM member_state WHERE scope=? AND member_key=?",
+                                     (scope, block.member_key)).fetchone()
+            if row is not None and row[0] == block.block_hash:
+                counts["unchanged"] += 1
+                continue
+            status = ADDED if row is None else CHANGED
+            counts[status] += 1
+            connection.execute("INSERT OR REPLACE INTO member_state VALUES (?, ?, ?)",
+                               (scope, block.member_key, block.block_hash))
+            fields = map(tokenizer.split_segment, block.segments)
+            for ins in iter_ins_fields(fields, trusted=trusted, log_summary=False):
+                yield MemberChange(status, block.member_key, ins)
+
+        dropped = connection.execute(
+            "SELECT member_key FROM member_state WHERE scope=? AND member_key NOT IN (SELECT member_key FROM seen_member)",
+            (scope,))
+        for (member_key,) in dropped.fetchall():
+            counts[DROPPED] += 1
+            yield MemberChange(DROPPED, member_key, None)
+        connection.execute(
+            "DELETE FROM member_state WHERE scope=? AND member_key NOT IN (SELECT member_key FROM seen_member)",
+            (scope,))
+        connection.commit()
+        logger.info(f"Incremental run for {input_filepath} scope:{scope!r}: {counts}")
+    finally:
+        connection.rollback()  # no-op after a successful commit
+        connection.close()
+
+
+def export_member_changes(input_filepath, index_path: str, filename: str = "ins_changes.xlsx",
+                          scope: str = "", trusted: bool = False) -> dict:
+    """Writes added/changed members to an Excel workbook and dropped member keys to <base>.dropped.json.
+
+    Returns:
+        Count of added, changed and dropped members.
+    """
+    counts = {ADDED: 0, CHANGED: 0, DROPPED: 0}
+    dropped: List[str] = []
+
+    def changed_members() -> Iterator[INS]:
+        for change in iter_member_changes(input_filepath, index_path, scope, trusted):
+            counts[change.status] += 1
+            if change.ins is None:
+                dropped.append(change.member_key)
+            else:
+                yield change.ins
+
+    create_excel_streaming(changed_members(), filename)
+    with open(os.path.splitext(filename)[0] + ".dropped.json", "w") as outfile:
+        json.dump(dropped, outfile)
+    return counts
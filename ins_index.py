@@ -0,0 +1,173 @@
+import io
+import json
+import os
+import sqlite3
+from loguru import logger
+from typing import List, Optional
+
+from edi_utils import EdiDelimiters, EdiTokenizer, MappedEdiFile
+from ins_834 import iter_ins_fields
+from ins_class import INS
+
+# Byte-offset index of an 834 file for random access to single members.
+#
+# One pass over the memory-mapped file records the byte offset and length of every ISA, GS
+# and ST envelope (up to the end of its IEA, GE, SE) and of every INS loop (from INS to the
+# last segment before the next INS or trailer). Only REF and NM1 segments inside a loop are
+# decoded, to key the loop by subscriber ID (REF*0F) and member ID (NM1 ID code, NM109).
+# The index is a SQLite sidecar next to the file; lookup_member() reads just the matching
+# loops' bytes and parses them.
+
+INDEX_SUFFIX = ".insidx"
+_INSERT_BATCH_ROWS = 10000
+
+_ENVELOPE_TRAILERS = {b"IEA": b"ISA", b"GE": b"GS", b"SE": b"ST"}
+# Segment IDs that end an INS loop besides the next INS
+_LOOP_END_SEGMENTS = frozenset({b"ISA", b"GS", b"ST", b"SE", b"GE", b"IEA"})
+
+
+def default_index_path(input_filepath) -> str:
+    return os.fspath(input_filepath) + INDEX_SUFFIX
+
+
+def _source_stamp(input_filepath) -> dict:
+    stat = os.stat(input_filepath)
+    return {"source_size": str(stat.st_size), "source_mtime_ns": str(stat.st_mtime_ns)}
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.executescript(
+        "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        "CREATE TABLE envelope (offset INTEGER PRIMARY KEY, length INTEGER NOT NULL,"
+        " segment_id TEXT NOT NULL, control_number TEXT);"
+        "CREATE TABLE member (member_seq INTEGER PRIMARY KEY, transaction_offset INTEGER,"
+        " offset INTEGER NOT NULL, length INTEGER NOT NULL, subscriber_id TEXT, member_id TEXT);")
+
+
+def build_member_index(input_filepath, index_path: Optional[str] = None) -> str:
+    """
+    Indexes the envelopes and INS loops of an 834 file in one pass.
+
+    The index is written to a temporary file and moved into place, so readers never see a
+    half-built index.
+
+    Args:
+        input_filepath: Path to the 834 file.
+        index_path: Sidecar path; defaults to <input_filepath>.insidx.
+    Returns:
+        The index path.
+    """
+    index_path = index_path or default_index_path(input_filepath)
+    building_path = index_path + ".tmp"
+    if os.path.exists(building_path):
+        os.remove(building_path)
+    stamp = _source_stamp(input_filepath)
+    connection = sqlite3.connect(building_path)
+    members = 0
+    try:
+        _create_tables(connection)
+        with MappedEdiFile(input_filepath) as edi:
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+                *stamp.items(), ("delimiters", json.dumps(edi.delimiters))])
+            envelope_rows, member_rows = [], []
+            open_envelopes = {}  # envelope segment ID -> (offset, control number)
+            loop = None  # [offset, end, subscriber_id, member_id, nm1_seen] of the open INS loop
+            transaction_offset = None
+
+            def close_loop():
+                nonlocal members
+                members += 1
+                member_rows.append((members, transaction_offset, loop[0], loop[1] - loop[0], loop[2], loop[3]))
+
+            for segment_id, start, end in edi.iter_segment_spans():
+                if loop is not None:
+                    if segment_id == b"INS" or segment_id in _LOOP_END_SEGMENTS:
+                        close_loop()
+                        loop = None
+                    else:
+                        loop[1] = end
+                        if segment_id == b"REF" and loop[2] is None:
+                            fields = edi.fields(start, end)
+                            if len(fields) > 2 and fields[1] == "0F":
+                                loop[2] = fields[2]
+                        elif segment_id == b"NM1" and not loop[4]:
+                            loop[4] = True  # only the member's own (first) NM1 carries its ID
+                            fields = edi.fields(start, end)
+                            loop[3] = fields[9] if len(fields) > 9 and fields[9] else None
+                        continue
+                if segment_id == b"INS":
+                    loop = [start, end, None, None, False]
+                elif segment_id in (b"ISA", b"GS", b"ST"):
+                    fields = edi.fields(start, end)
+                    control_number = {b"ISA": 13, b"GS": 6, b"ST": 2}[segment_id]
+                    control_number = fields[control_number].strip() if len(fields) > control_number else None
+                    open_envelopes[segment_id] = (start, control_number)
+                    if segment_id == b"ST":
+                        transaction_offset = start
+                elif segment_id in _ENVELOPE_TRAILERS:
+                    opened = open_envelopes.pop(_ENVELOPE_TRAILERS[segment_id], None)
+                    if opened is None:
+                        logger.warning(f"{segment_id.decode()} at byte {start} without a matching header in {input_filepath}")
+                    else:
+                        envelope_rows.append((opened[0], end - opened[0], _ENVELOPE_TRAILERS[segment_id].decode(), opened[1]))
+                if len(member_rows) >= _INSERT_BATCH_ROWS:
+                    connection.executemany("INSERT INTO member VALUES (?, ?, ?, ?, ?, ?)", member_rows)
+                    member_rows.clear()
+            if loop is not None:
+                close_loop()
+            for header_id, (offset, control_number) in open_envelopes.items():
+                logger.warning(f"{header_id.decode()} {control_number} at byte {offset} is never closed in {input_filepath}")
+            connection.executemany("INSERT INTO member VALUES (?, ?, ?, ?, ?, ?)", member_rows)
+            connection.executemany("INSERT INTO envelope VALUES (?, ?, ?, ?)", envelope_rows)
+        connection.execute("CREATE INDEX member_subscriber_id ON member (subscriber_id)")
+        connection.execute("CREATE INDEX member_member_id ON member (member_id)")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(building_path, index_path)
+    logger.info(f"Indexed {members} INS loops of {input_filepath} into {index_path}")
+    return index_path
+
+
+def open_member_index(input_filepath, index_path: Optional[str] = None) -> sqlite3.Connection:
+    """Opens the sidecar index of a file, (re)building it when missing or older than the file."""
+    index_path = index_path or default_index_path(input_filepath)
+    if os.path.exists(index_path):
+        connection = sqlite3.connect(index_path)
+        stamp = dict(connection.execute("SELECT key, value FROM meta WHERE key LIKE 'source_%'"))
+        if stamp == _source_stamp(input_filepath):
+            return connection
+        connection.close()
+        logger.info(f"Index {index_path} is stale, rebuilding")
+    return sqlite3.connect(build_member_index(input_filepath, index_path))
+
+
+def lookup_member(input_filepath, member_id: str, index_path: Optional[str] = None, trusted: bool = False) -> List[INS]:
+    """
+    Parses only the INS loops of one subscriber or member.
+
+    Args:
+        input_filepath: Path to the 834 file.
+        member_id: Subscriber ID (REF*0F, matches the subscriber and all dependents) or
+            member ID (NM109 of the member's NM1).
+        index_path: Sidecar path; defaults to <input_filepath>.insidx, built on first use.
+        trusted: Build the models without validation (see ins_class).
+    Returns:
+        The matching members in file order; empty if none match.
+    """
+    connection = open_member_index(input_filepath, index_path)
+    try:
+        (delimiters,) = connection.execute("SELECT value FROM meta WHERE key='delimiters'").fetchone()
+        loops = connection.execute(
+            "SELECT offset, length FROM member WHERE subscriber_id=? OR member_id=? ORDER BY member_seq",
+            (member_id, member_id)).fetchall()
+    finally:
+        connection.close()
+    tokenizer = EdiTokenizer(EdiDelimiters(*json.loads(delimiters)))
+    members: List[INS] = []
+    with open(input_filepath, "rb") as infile:
+        for offset, length in loops:
+            infile.seek(offset)
+            block = infile.read(length).decode("utf-8")
+            members.extend(iter_ins_fields(tokenizer.iter_fields(io.StringIO(block)), trusted=trusted, log_summary=False))
+    return members
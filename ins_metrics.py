@@ -0,0 +1,179 @@
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Per-run parse metrics.
+#
+# When a ParseMetrics collector is active (see collect_metrics), the tokenizer
+# (edi_utils.EdiTokenizer.iter_segments), the parser loop (ins_834.iter_ins_fields, used by
+# parse_ins_segment and iter_ins_file) and the Excel writers record into it: segments seen,
+# per segment type parse-time histograms, validation errors, stage times and Excel
+# rows/cells. With no active collector each hook costs one None check per generator or
+# workbook, so the hooks can stay in place; with one active the parser adds two clock
+# reads per segment. Generators pick up the collector that is active when they start.
+# Results are written as a JSON summary and/or in the Prometheus text format.
+
+# name -> (Prometheus type, label name, help)
+METRICS = {
+    "edi_segments_total": ("counter", "segment", "Segments routed by the parser, per segment ID"),
+    "edi_segment_parse_seconds": ("histogram", "segment", "Time spent building each segment, per segment ID"),
+    "edi_validation_errors_total": ("counter", "segment", "Segments that failed model validation, per segment ID"),
+    "edi_stage_seconds_total": ("counter", "stage", "Time spent per pipeline stage"),
+    "edi_stage_items_total": ("counter", "stage", "Items (segments, members) produced per pipeline stage"),
+    "edi_excel_rows_total": ("counter", "sheet", "Rows written per Excel sheet"),
+    "edi_excel_cells_total": ("counter", "sheet", "Cells written per Excel sheet"),
+}
+
+# Histogram bucket i counts observations of i-bit nanosecond values, i.e. [2**(i-1), 2**i) ns,
+# so recording is an int.bit_length() and a list increment (ins_834 inlines observe()).
+_HISTOGRAM_BUCKETS = 64
+_FIRST_EXPORTED_BUCKET = 10  # Prometheus buckets start at 1.024us; faster observations fall into it
+
+
+class Histogram:
+    """Log2-bucketed nanosecond timings."""
+    __slots__ = ("buckets", "sum_ns")
+
+    def __init__(self):
+        self.buckets = [0] * _HISTOGRAM_BUCKETS
+        self.sum_ns = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets)
+
+    def observe(self, ns: int) -> None:
+        self.buckets[ns.bit_length()] += 1
+        self.sum_ns += ns
+
+    def quantile_ns(self, quantile: float) -> int:
+        """Upper bound of the bucket holding the given quantile."""
+        rank = quantile * sum(self.buckets)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return 1 << index
+        return 0
+
+    def summary(self) -> dict:
+        count = self.count
+        return {
+            "count": count,
+            "sum_seconds": self.sum_ns / 1e9,
+            "mean_ns": self.sum_ns / count if count else 0,
+            "p50_ns": self.quantile_ns(0.5),
+            "p99_ns": self.quantile_ns(0.99),
+        }
+
+
+class ParseMetrics:
+    """Counters and histograms of one run (typically one input file)."""
+
+    def __init__(self, labels: Optional[Dict[str, str]] = None):
+        self.labels = dict(labels or {})
+        self.counters: Dict[str, Dict[str, float]] = {name: defaultdict(int) for name, (kind, _, _) in METRICS.items()
+                                                      if kind == "counter"}
+        self.histograms: Dict[str, Dict[str, Histogram]] = {name: defaultdict(Histogram) for name, (kind, _, _) in METRICS.items()
+                                                            if kind == "histogram"}
+
+    def inc(self, name: str, label: str, value: float = 1) -> None:
+        self.counters[name][label] += value
+
+    def histogram(self, name: str, label: str) -> Histogram:
+        return self.histograms[name][label]
+
+    def to_dict(self) -> dict:
+        """JSON summary: counters as {name: {label: value}}, histograms as count/sum/mean/p50/p99."""
+        return {
+            "labels": self.labels,
+            "counters": {name: dict(values) for name, values in self.counters.items() if values},
+            "histograms": {name: {label: histogram.summary() for label, histogram in values.items()}
+                           for name, values in self.histograms.items() if values},
+        }
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for name, (kind, label_name, help_text) in METRICS.items():
+            values = self.counters.get(name) or self.histograms.get(name)
+            if not values:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                # One bucket layout for all series of the metric, so they can be aggregated
+                last_bucket = max((index for value in values.values() for index, bucket in enumerate(value.buckets) if bucket),
+                                  default=_FIRST_EXPORTED_BUCKET)
+                bounds = [f"{(1 << index) / 1e9:.10g}" for index in range(_FIRST_EXPORTED_BUCKET, max(last_bucket, _FIRST_EXPORTED_BUCKET) + 1)]
+            for label, value in sorted(values.items()):
+                labels = self._label_pairs((label_name, label))
+                if kind == "counter":
+                    lines.append(f"{name}{{{labels}}} {value:g}")
+                    continue
+                count = value.count
+                cumulative = sum(value.buckets[:_FIRST_EXPORTED_BUCKET])
+                for index, bound in enumerate(bounds, _FIRST_EXPORTED_BUCKET):
+                    cumulative += value.buckets[index]
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {value.sum_ns / 1e9:g}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _label_pairs(self, *extra: Tuple[str, str]) -> str:
+        pairs = list(self.labels.items()) + list(extra)
+        return ",".join(f'{key}="{_escape_label(str(value))}"' for key, value in pairs)
+
+    def write_json(self, path: str) -> None:
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        _write_atomic(path, self.to_prometheus())
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _write_atomic(path: str, text: str) -> None:
+    # Prometheus' textfile collector may read the file at any time
+    with open(path + ".tmp", "w") as outfile:
+        outfile.write(text)
+    os.replace(path + ".tmp", path)
+
+
+ACTIVE: Optional[ParseMetrics] = None
+
+
+def set_active_metrics(metrics: Optional[ParseMetrics]) -> Optional[ParseMetrics]:
+    """Makes metrics the collector the hooks record into (None turns them off); returns the previous one."""
+    global ACTIVE
+    previous, ACTIVE = ACTIVE, metrics
+    return previous
+
+
+@contextmanager
+def collect_metrics(json_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                    **labels: str) -> Iterator[ParseMetrics]:
+    """
+    Activates a new collector for the duration of the block and writes it out at the end.
+
+    Args:
+        json_path: Where to write the JSON summary, if anywhere.
+        prometheus_path: Where to write the Prometheus text format (e.g. a node_exporter
+            textfile collector directory), if anywhere.
+        labels: Labels attached to every metric, e.g. file="carrier_a.edi".
+    """
+    metrics = ParseMetrics(labels)
+    previous = set_active_metrics(metrics)
+    try:
+        yield metrics
+    finally:
+        set_active_metrics(previous)
+        if json_path:
+            metrics.write_json(json_path)
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
@@ -0,0 +1,140 @@
+import os
+from loguru import logger
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ins_class import (AMT_FIELDS, CODE_COLUMNS, DTP_FIELDS, HD_FIELDS, INS, MEMBER_COLUMNS, REF_FIELDS,
+                       member_values)
+
+# Columnar export of parsed members for the eligibility warehouse.
+#
+# Tables keyed by member_seq (1-based member order in the file, same as RefRow in the Excel
+# export): "members" holds the INS fields plus the NM1/PER/N3/N4/DMG/HD fields flattened
+# with a segment prefix (nm1_name_first, hd_maintenance_type_code, ...; hd_* is the first
+# coverage); "ref" and "dtp" hold one row per member level REF / DTP segment. "coverage"
+# holds one row per 2300 HD loop, keyed by member_seq and coverage_seq (1-based within the
+# member), and "coverage_dtp", "coverage_amt", "coverage_ref" that coverage's child segments.
+
+DEFAULT_BATCH_SIZE = 65536
+
+# Low-cardinality code columns, dictionary encoded in Arrow and Parquet
+DICTIONARY_COLUMNS = CODE_COLUMNS
+
+
+def _schema(columns: List[str], keys: Tuple[str, ...] = ("member_seq",)) -> pa.Schema:
+    fields = [pa.field(key, pa.int64(), nullable=False) for key in keys]
+    for name in columns:
+        column_type = pa.dictionary(pa.int32(), pa.string()) if name in DICTIONARY_COLUMNS else pa.string()
+        fields.append(pa.field(name, column_type))
+    return pa.schema(fields)
+
+
+MEMBER_SCHEMA = _schema(MEMBER_COLUMNS)
+REF_SCHEMA = _schema(REF_FIELDS)
+DTP_SCHEMA = _schema(DTP_FIELDS)
+_COVERAGE_KEYS = ("member_seq", "coverage_seq")
+COVERAGE_SCHEMA = _schema(HD_FIELDS, _COVERAGE_KEYS)
+COVERAGE_DTP_SCHEMA = _schema(DTP_FIELDS, _COVERAGE_KEYS)
+COVERAGE_AMT_SCHEMA = _schema(AMT_FIELDS, _COVERAGE_KEYS)
+COVERAGE_REF_SCHEMA = _schema(REF_FIELDS, _COVERAGE_KEYS)
+TABLE_SCHEMAS = {"members": MEMBER_SCHEMA, "ref": REF_SCHEMA, "dtp": DTP_SCHEMA, "coverage": COVERAGE_SCHEMA,
+                 "coverage_dtp": COVERAGE_DTP_SCHEMA, "coverage_amt": COVERAGE_AMT_SCHEMA,
+                 "coverage_ref": COVERAGE_REF_SCHEMA}
+
+
+class _BatchBuilder:
+    """Accumulates rows column by column and turns them into record batches."""
+    def __init__(self, schema: pa.Schema):
+        self.schema = schema
+        self.columns: List[list] = [[] for _ in schema]
+
+    def __len__(self) -> int:
+        return len(self.columns[0])
+
+    def append(self, row: Iterable) -> None:
+        for column, value in zip(self.columns, row):
+            column.append(value)
+
+    def flush(self) -> pa.RecordBatch:
+        arrays = [pa.array(column, type=field.type) for column, field in zip(self.columns, self.schema)]
+        self.columns = [[] for _ in self.schema]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def iter_record_batches(members: Iterable[INS], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Tuple[str, pa.RecordBatch]]:
+    """Turns parsed members into Arrow record batches.
+
+    Args:
+        members: Parsed members; may be a generator, each member is visited once.
+        batch_size: Rows per record batch, per table.
+    Yields:
+        (table name, record batch) with table name one of TABLE_SCHEMAS.
+    """
+    builders = {name: _BatchBuilder(schema) for name, schema in TABLE_SCHEMAS.items()}
+    member_builder, ref_builder, dtp_builder = builders["members"], builders["ref"], builders["dtp"]
+    coverage_builder, coverage_dtp_builder = builders["coverage"], builders["coverage_dtp"]
+    coverage_amt_builder, coverage_ref_builder = builders["coverage_amt"], builders["coverage_ref"]
+    member_seq = 0
+    for ins in members:
+        member_seq += 1
+        member_builder.append([member_seq] + member_values(ins))
+        for ref in ins.ref_segments:
+            ref_data = ref.__dict__
+            ref_builder.append([member_seq] + [ref_data[name] for name in REF_FIELDS])
+        for dtp in ins.dtp_segments:
+            dtp_data = dtp.__dict__
+            dtp_builder.append([member_seq] + [dtp_data[name] for name in DTP_FIELDS])
+        for coverage_seq, coverage in enumerate(ins.coverages, 1):
+            hd_data = coverage.hd_segment.__dict__
+            coverage_builder.append([member_seq, coverage_seq] + [hd_data[name] for name in HD_FIELDS])
+            for dtp in coverage.dtp_segments:
+                dtp_data = dtp.__dict__
+                coverage_dtp_builder.append([member_seq, coverage_seq] + [dtp_data[name] for name in DTP_FIELDS])
+            for amt in coverage.amt_segments:
+                amt_data = amt.__dict__
+                coverage_amt_builder.append([member_seq, coverage_seq] + [amt_data[name] for name in AMT_FIELDS])
+            for ref in coverage.ref_segments:
+                ref_data = ref.__dict__
+                coverage_ref_builder.append([member_seq, coverage_seq] + [ref_data[name] for name in REF_FIELDS])
+        for name, builder in builders.items():
+            if len(builder) >= batch_size:
+                yield name, builder.flush()
+    for name, builder in builders.items():
+        if len(builder):
+            yield name, builder.flush()
+
+
+def write_parquet(members: Iterable[INS], output_dir: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                  compression: str = "zstd") -> Dict[str, int]:
+    """Writes one Parquet file per table (members.parquet, ref.parquet, ..., coverage_ref.parquet)
+    to output_dir, one batch at a time.
+
+    Args:
+        members: Parsed members; may be a generator (e.g. ins_834.iter_ins_file).
+        output_dir: Directory for the Parquet files; created if missing.
+        batch_size: Rows per record batch / row group flush.
+        compression: Parquet compression codec.
+    Returns:
+        Row count per table.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f"{name}.parquet") for name in TABLE_SCHEMAS}
+    writers = {name: pq.ParquetWriter(paths[name], schema, compression=compression)
+               for name, schema in TABLE_SCHEMAS.items()}
+    rows = dict.fromkeys(TABLE_SCHEMAS, 0)
+    try:
+        for name, batch in iter_record_batches(members, batch_size):
+            writers[name].write_batch(batch)
+            rows[name] += batch.num_rows
+    except BaseException:
+        # A closed writer leaves a readable file, so a failed parse would look like a short, complete export
+        for name, writer in writers.items():
+            writer.close()
+            os.remove(paths[name])
+        raise
+    for writer in writers.values():
+        writer.close()
+    logger.info(f"Parquet export written to {output_dir}: {rows}")
+    return rows
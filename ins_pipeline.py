@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from loguru import logger
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from edi_utils import DEFAULT_CHUNK_SIZE, EdiTokenizer, SegmentEnvelopeVerifier, tokenizer_from_stream
+from ins_834 import DEFAULT_PARALLEL_CHUNK_MEMBERS, parse_segment_chunk
+from ins_batch import (FORMATS, BatchResult, find_input_files, output_path_for, partial_path_for, print_summary,
+                       remove_output, replace_output)
+from ins_class import INS, member_from_values
+from ins_excel import create_excel_streaming
+
+# asyncio ingestion pipeline.
+#
+#   read -> tokenize -> build -> export
+#
+# Each stage is a task joined to the next by a bounded asyncio.Queue, so a slow stage
+# blocks the ones before it (backpressure). The text and members in flight per file are
+# capped at about queue_size * (chunk_size characters + 2 * chunk_members INS loops).
+# Reads and tokenizing run in threads, model building in a process pool (members come back
+# as ins_class.member_to_values tuples), and the sink consumes a plain iterator of INS in a
+# thread of its own. Disk reads and output writes therefore overlap with parsing.
+
+Sink = Callable[[Iterable[INS]], object]
+DEFAULT_QUEUE_SIZE = 4
+_DONE = object()  # end of stream marker, passed down from stage to stage
+
+
+async def _stage(coroutine, out_queue: asyncio.Queue) -> None:
+    """Runs a stage and ends its output with _DONE, also when it fails (the error is re-raised
+    and surfaced once the sink has drained). A cancelled stage puts nothing."""
+    try:
+        await coroutine
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        await out_queue.put(_DONE)
+        raise
+    await out_queue.put(_DONE)
+
+
+async def _read(infile, head: str, chunk_size: int, out_queue: asyncio.Queue) -> None:
+    loop = asyncio.get_running_loop()
+    chunk = head
+    while chunk:
+        await out_queue.put(chunk)
+        chunk = await loop.run_in_executor(None, infile.read, chunk_size)
+
+
+async def _tokenize(tokenizer: EdiTokenizer, chunk_members: int, in_queue: asyncio.Queue, out_queue: asyncio.Queue) -> None:
+    """Splits text chunks into segments and regroups them into chunks of chunk_members INS
+    loops, cut right before an INS (see ins_834.iter_ins_file_parallel). The envelopes are
+    verified here, since the build stage only sees chunks cut inside them."""
+    loop = asyncio.get_running_loop()
+    envelopes = SegmentEnvelopeVerifier(tokenizer)
+    ins_prefix = "INS" + tokenizer.element_separator
+    carry = ""
+    chunk: List[str] = []
+    members = 0
+    final = False
+    while not final:
+        text = await in_queue.get()
+        final = text is _DONE
+        segments, carry = await loop.run_in_executor(None, tokenizer.split_chunk, carry, "" if final else text, final)
+        for segment in envelopes.verify(segments):
+            if segment.startswith(ins_prefix):
+                if members == chunk_members:
+                    await out_queue.put(chunk)
+                    chunk = []
+                    members = 0
+                members += 1
+            chunk.append(segment)
+    envelopes.finish()  # truncated input: the last chunk is never built
+    if chunk:
+        await out_queue.put(chunk)
+
+
+async def _build(tokenizer: EdiTokenizer, trusted: bool, executor: Executor, in_queue: asyncio.Queue,
+                 out_queue: asyncio.Queue) -> None:
+    """Submits each segment chunk to the executor and passes the pending result on, so chunks
+    are built in parallel while the export keeps file order."""
+    loop = asyncio.get_running_loop()
+    while (segments := await in_queue.get()) is not _DONE:
+        await out_queue.put(loop.run_in_executor(executor, parse_segment_chunk, tokenizer.delimiters, segments, trusted))
+
+
+async def _next_members(in_queue: asyncio.Queue) -> Optional[List[tuple]]:
+    pending = await in_queue.get()
+    return None if pending is _DONE else await pending
+
+
+class _QueueMembers:
+    """Iterator over the members of the build stage's output, for a sink running in a thread."""
+    def __init__(self, loop: asyncio.AbstractEventLoop, in_queue: asyncio.Queue):
+        self.loop = loop
+        self.in_queue = in_queue
+        self.count = 0
+        self.exhausted = False
+
+    def __iter__(self) -> Iterator[INS]:
+        while True:
+            values_list = asyncio.run_coroutine_threadsafe(_next_members(self.in_queue), self.loop).result()
+            if values_list is None:
+                self.exhausted = True
+                return
+            for values in values_list:
+                self.count += 1
+                yield member_from_values(values)
+
+
+async def run_file_pipeline(input_filepath, sink: Sink, build_executor: Optional[Executor] = None,
+                            sink_executor: Optional[Executor] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            chunk_members: int = DEFAULT_PARALLEL_CHUNK_MEMBERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                            trusted: bool = False) -> int:
+    """
+    Runs one 834 file through the read -> tokenize -> build -> export pipeline.
+
+    Args:
+        input_filepath: Path to the input EDI file.
+        sink: Called once, in a thread, with an iterator of the file's members in file
+            order (e.g. create_excel_streaming or functools.partial(write_parquet, output_dir=...)).
+        build_executor: Executor for model building (default: a process pool for this file).
+        sink_executor: Executor running the sink; needs a free thread for the whole run
+            (default: a single thread for this file).
+        chunk_size: Number of characters per read.
+        chunk_members: INS loops per build task.
+        queue_size: Capacity of each queue between stages.
+        trusted: Build the models without validation (see ins_class).
+    Returns:
+        The number of members handed to the sink.
+    """
+    if chunk_members <= 0:
+        raise ValueError(f"chunk_members must be positive, got {chunk_members}")
+    loop = asyncio.get_running_loop()
+    own_build_executor = build_executor is None
+    own_sink_executor = sink_executor is None
+    build_executor = build_executor or ProcessPoolExecutor()
+    sink_executor = sink_executor or ThreadPoolExecutor(max_workers=1)
+    text_queue, segment_queue, member_queue = (asyncio.Queue(queue_size) for _ in range(3))
+    tasks = []
+    try:
+        with open(input_filepath, 'r', newline=None) as infile:
+            tokenizer, head = await loop.run_in_executor(None, tokenizer_from_stream, infile, chunk_size)
+            tasks = [
+                asyncio.create_task(_stage(_read(infile, head, chunk_size, text_queue), text_queue)),
+                asyncio.create_task(_stage(_tokenize(tokenizer, chunk_members, text_queue, segment_queue), segment_queue)),
+                asyncio.create_task(_stage(_build(tokenizer, trusted, build_executor, segment_queue, member_queue), member_queue)),
+            ]
+            members = _QueueMembers(loop, member_queue)
+            await loop.run_in_executor(sink_executor, sink, members)
+            if members.exhausted:
+                await asyncio.gather(*tasks)  # raises the error of a failed stage
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_build_executor:
+            build_executor.shutdown(cancel_futures=True)
+        if own_sink_executor:
+            sink_executor.shutdown()
+    logger.info(f"Pipeline parsed {members.count} INS members from {input_filepath}")
+    return members.count
+
+
+async def run_pipelines(input_files: Iterable[str], sink_for: Callable[[str], Sink], max_files: int = 2,
+                        workers: Optional[int] = None, **pipeline_options) -> List[BatchResult]:
+    """
+    Runs several files through the pipeline, at most max_files at a time, sharing one
+    process pool of `workers` processes for model building.
+
+    Args:
+        input_files: 834 files to process.
+        sink_for: Returns the sink for an input file. A sink with commit() and discard() methods
+            (ExportSink) is committed once the file's whole pipeline, envelope checks
+            included, has succeeded, and discarded when it fails.
+        max_files: Files in flight at once; with the per-file queue bound this caps memory.
+        workers: Build processes (default: os.cpu_count()).
+        pipeline_options: Passed on to run_file_pipeline (chunk_size, queue_size, trusted, ...).
+    Returns:
+        One BatchResult per file, with the sink's output_path if it has one.
+    """
+    limit = asyncio.Semaphore(max_files)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as build_executor, \
+            ThreadPoolExecutor(max_workers=max_files) as sink_executor:
+
+        async def run_one(input_path: str) -> BatchResult:
+            async with limit:
+                input_bytes = os.path.getsize(input_path)
+                started = time.perf_counter()
+                sink = sink_for(input_path)
+                output_path = getattr(sink, "output_path", "")
+                try:
+                    count = await run_file_pipeline(input_path, sink, build_executor, sink_executor, **pipeline_options)
+                    if hasattr(sink, "commit"):
+                        sink.commit()
+                except Exception as e:
+                    logger.exception(f"Pipeline failed for {input_path}")
+                    if hasattr(sink, "discard"):
+                        sink.discard()
+                    return BatchResult(input_path, output_path, "failed", 0, time.perf_counter() - started, input_bytes,
+                                       repr(e))
+                return BatchResult(input_path, output_path, "done", count, time.perf_counter() - started, input_bytes)
+
+        return list(await asyncio.gather(*(run_one(input_path) for input_path in input_files)))
+
+
+class ExportSink:
+    """Sink exporting a file's members to <output>.partial (see ins_batch.process_file).
+
+    The sink returns once the members are written, but the tokenize stage may still fail the
+    file afterwards (e.g. a truncated envelope), so run_pipelines renames the export to
+    output_path with commit() only after the whole pipeline has succeeded, and removes it
+    with discard() otherwise.
+    """
+    def __init__(self, output_path: str, output_format: str = "xlsx"):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.partial_path = partial_path_for(output_path)
+
+    def __call__(self, members: Iterable[INS]) -> int:
+        remove_output(self.partial_path)
+        if self.output_format == "xlsx":
+            return create_excel_streaming(members, self.partial_path)
+        from ins_parquet import write_parquet  # pyarrow is only needed for parquet output
+        return write_parquet(members, self.partial_path)["members"]
+
+    def commit(self) -> None:
+        replace_output(self.partial_path, self.output_path)
+
+    def discard(self) -> None:
+        remove_output(self.partial_path)
+
+
+def export_sink_for(output_dir: str, output_format: str = "xlsx") -> Callable[[str], Sink]:
+    """Sink factory exporting each file to ins_batch.output_path_for(...) in the given format."""
+    def sink_for(input_path: str) -> Sink:
+        return ExportSink(output_path_for(input_path, output_dir, output_format), output_format)
+    return sink_for
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and export 834 files through the asyncio pipeline")
+    parser.add_argument("inputs", nargs="+", help="input files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="out", help="directory for the exported files")
+    parser.add_argument("--format", choices=FORMATS, default="xlsx", help="export format")
+    parser.add_argument("--max-files", type=int, default=2, help="files in flight at once")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="model building processes")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="capacity of each stage queue")
+    parser.add_argument("--trusted", action="store_true", help="build models without validation")
+    args = parser.parse_args()
+
+    input_files = find_input_files(args.inputs)
+    if not input_files:
+        parser.error(f"no input files found in {args.inputs}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    started = time.perf_counter()
+    results = asyncio.run(run_pipelines(input_files, export_sink_for(args.output_dir, args.format), args.max_files,
+                                        args.workers, queue_size=args.queue_size, trusted=args.trusted))
+    print_summary(results, time.perf_counter() - started)
+    if any(result.status == "failed" for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
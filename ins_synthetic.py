@@ -0,0 +1,163 @@
+import argparse
+from typing import Iterator, List, Tuple
+
+from edi_utils import EdiDelimiters
+
+# Synthetic 834 interchanges for benchmarks and load tests.
+#
+# One interchange / functional group / transaction set with sponsor (N1*P5) and payer
+# (N1*IN) loops, then per subscriber an INS loop followed by its dependents' INS loops.
+# Every INS loop has REF*0F plus `refs - 1` further REFs, `dtps` member level DTPs,
+# NM1/PER/N3/N4/DMG and `coverages` HD loops, each with its DTP*348 (349 for terms) and,
+# past the first, a REF*1L group number. Elements never contain a delimiter,
+# so any delimiter set can be used. SE01/GE01/IEA01 counts and control numbers match.
+
+# Qualifiers cycled through for the extra REF and member level DTP segments
+_REF_QUALIFIERS = ("1L", "17", "23", "3H", "6O", "DX", "ZZ")
+_DTP_QUALIFIERS = ("356", "336", "337", "338", "339", "340", "341")
+_RELATIONSHIPS = ("01", "19", "19", "19", "19")  # spouse, then children
+_COVERAGES = ("FAM", "ESP", "ECH", "EMP")
+_PLANS = ("PPO", "DENTAL", "VISION", "LIFE")
+
+
+def _join(separator: str, elements: Tuple[str, ...]) -> str:
+    # Trailing empty elements are omitted, as X12 requires
+    return separator.join(elements).rstrip(separator)
+
+
+def synthetic_member_elements(member_number: int, dependent_number: int = 0, refs: int = 2,
+                              dtps: int = 1, coverages: int = 1) -> List[Tuple[str, ...]]:
+    """
+    Returns the segments of one INS loop (2000/2100A/2300) as element tuples.
+
+    Args:
+        member_number: Subscriber number; also drives the maintenance type (every 7th is a term).
+        dependent_number: 0 for the subscriber, n > 0 for its n-th dependent.
+        refs: REF segments in the loop (at least the REF*0F subscriber ID).
+        dtps: Member level DTP segments, in addition to the coverages' DTP*348.
+        coverages: HD loops (2300) in the member.
+    """
+    subscriber = dependent_number == 0
+    maintenance_type = "024" if member_number % 7 == 0 else "030"
+    member_id = f"{100000000 + member_number}{'' if subscriber else f'{dependent_number:02d}'}"
+    segments = [
+        ("INS", "Y" if subscriber else "N", "18" if subscriber else _RELATIONSHIPS[(dependent_number - 1) % len(_RELATIONSHIPS)],
+         maintenance_type, "XN", "A", "", "", "FT" if subscriber else ""),
+        ("REF", "0F", f"SUB{member_number:09d}"),
+    ]
+    segments.extend(("REF", _REF_QUALIFIERS[i % len(_REF_QUALIFIERS)], f"R{member_number:06d}{i:02d}") for i in range(refs - 1))
+    segments.extend(("DTP", _DTP_QUALIFIERS[i % len(_DTP_QUALIFIERS)], "D8", "20240101") for i in range(dtps))
+    segments.append(("NM1", "IL", "1", f"DOE{member_number}", "JOHN" if subscriber else f"CHILD{dependent_number}",
+                     "Q", "", "", "34", member_id))
+    if subscriber:
+        segments.append(("PER", "IP", "", "HP", "5555551234"))
+        segments.append(("N3", "123 MAIN ST", "APT 4"))
+        segments.append(("N4", "SPRINGFIELD", "IL", "62701"))
+    segments.append(("DMG", "D8", "19800101" if subscriber else "20100101", "M" if member_number % 2 else "F"))
+    for coverage_number in range(coverages):
+        segments.append(("HD", maintenance_type, "", "HLT", _PLANS[coverage_number % len(_PLANS)],
+                         _COVERAGES[member_number % len(_COVERAGES)]))
+        segments.append(("DTP", "349" if maintenance_type == "024" else "348", "D8", "20240101"))
+        if coverage_number:
+            segments.append(("REF", "1L", f"GRP{coverage_number:03d}"))
+    return segments
+
+
+def synthetic_member_segments(member_number: int, dependent_number: int = 0, refs: int = 2, dtps: int = 1,
+                              coverages: int = 1) -> List[str]:
+    """Same as synthetic_member_elements, as segments joined with the default "*" separator."""
+    return [_join("*", elements)
+            for elements in synthetic_member_elements(member_number, dependent_number, refs, dtps, coverages)]
+
+
+def iter_synthetic_834(members: int, dependents: int = 0, refs: int = 2, dtps: int = 1,
+                       delimiters: EdiDelimiters = EdiDelimiters(), coverages: int = 1) -> Iterator[str]:
+    """
+    Yields the segments (without terminator) of one synthetic 834 interchange.
+
+    Args:
+        members: Number of subscribers.
+        dependents: Dependents per subscriber; the file has members * (1 + dependents) INS loops.
+        refs: REF segments per INS loop (>= 1).
+        dtps: Member level DTP segments per INS loop (>= 0).
+        delimiters: Element, repetition and sub-element separators to write.
+        coverages: HD loops per INS loop (>= 1).
+    """
+    if refs < 1 or dtps < 0 or members < 0 or dependents < 0 or coverages < 1:
+        raise ValueError(f"Invalid synthetic 834 options: members={members} dependents={dependents} refs={refs} "
+                         f"dtps={dtps} coverages={coverages}")
+    separator = delimiters.element_separator
+
+    def join(elements: Tuple[str, ...]) -> str:
+        return _join(separator, elements)
+
+    yield join(("ISA", "00", " " * 10, "00", " " * 10, "ZZ", "SENDER".ljust(15), "ZZ", "RECEIVER".ljust(15),
+                "240101", "1200", delimiters.repetition_separator, "00501", "000000001", "0", "P",
+                delimiters.sub_element_separator))
+    yield join(("GS", "BE", "SENDER", "RECEIVER", "20240101", "1200", "1", "X", "005010X220A1"))
+    transaction_set = [
+        ("ST", "834", "0001", "005010X220A1"),
+        ("BGN", "00", "12456", "20240101", "1200", "", "", "", "2"),
+        ("N1", "P5", "SPONSOR INC", "FI", "123456789"),
+        ("N1", "IN", "PAYER CO", "FI", "987654321"),
+    ]
+    for elements in transaction_set:
+        yield join(elements)
+    segment_count = len(transaction_set)
+    for member_number in range(members):
+        for dependent_number in range(dependents + 1):
+            for elements in synthetic_member_elements(member_number, dependent_number, refs, dtps, coverages):
+                segment_count += 1
+                yield join(elements)
+    yield join(("SE", str(segment_count + 1), "0001"))
+    yield join(("GE", "1", "1"))
+    yield join(("IEA", "1", "000000001"))
+
+
+def write_synthetic_834(filename: str, members: int, dependents: int = 0, refs: int = 2, dtps: int = 1,
+                        delimiters: EdiDelimiters = EdiDelimiters(), line_breaks: bool = True, coverages: int = 1) -> str:
+    """
+    Writes a synthetic 834 interchange (see iter_synthetic_834).
+
+    Args:
+        line_breaks: Follow each segment terminator with a newline (ignored when the
+            terminator itself is a newline).
+    Returns:
+        The filename.
+    """
+    terminator = delimiters.segment_terminator
+    if line_breaks and terminator != "\n":
+        terminator += "\n"
+    with open(filename, "w", newline="") as outfile:
+        batch = []
+        for segment in iter_synthetic_834(members, dependents, refs, dtps, delimiters, coverages):
+            batch.append(segment)
+            if len(batch) == 4096:
+                outfile.write(terminator.join(batch) + terminator)
+                batch.clear()
+        if batch:
+            outfile.write(terminator.join(batch) + terminator)
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic 834 file")
+    parser.add_argument("filename", help="output file")
+    parser.add_argument("--members", type=int, default=1000, help="subscribers")
+    parser.add_argument("--dependents", type=int, default=0, help="dependents per subscriber")
+    parser.add_argument("--refs", type=int, default=2, help="REF segments per INS loop")
+    parser.add_argument("--dtps", type=int, default=1, help="member level DTP segments per INS loop")
+    parser.add_argument("--coverages", type=int, default=1, help="HD loops per INS loop")
+    parser.add_argument("--element-separator", default="*")
+    parser.add_argument("--segment-terminator", default="~", help='e.g. "~", or "\\n" for one segment per line')
+    parser.add_argument("--no-line-breaks", action="store_true", help="do not add a newline after each terminator")
+    args = parser.parse_args()
+
+    delimiters = EdiDelimiters(element_separator=args.element_separator,
+                               segment_terminator=args.segment_terminator.replace("\\n", "\n"))
+    write_synthetic_834(args.filename, args.members, args.dependents, args.refs, args.dtps, delimiters,
+                        not args.no_line_breaks, args.coverages)
+
+
+if __name__ == "__main__":
+    main()
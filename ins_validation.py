@@ -0,0 +1,169 @@
+import argparse
+import functools
+import json
+from collections import Counter
+from loguru import logger
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from pydantic import ValidationError
+
+from edi_utils import EnvelopeError
+from ins_class import INS, REF, DTP, NM1, PER, N3, N4, DMG, HD, AMT, N1
+
+# Collected validation errors.
+#
+# By default a segment that fails model validation raises out of the parser and ends the
+# file. Passing a ValidationReport to ins_834.iter_ins_fields (or using
+# ins_834.iter_ins_validated) turns each failure into ValidationIssue records instead:
+# the segment is rebuilt without validation (short segments padded with empty elements)
+# so the member tree stays intact, and parsing continues to the end of the file.
+#
+# Each issue names the segment (index in the file, byte offset when the source knows it),
+# the element (e.g. "DTP03"), the rule (the pydantic error type, such as
+# "string_too_short" or "literal_error", "missing_element", or an edi_utils.EnvelopeError
+# rule such as "control_count_mismatch" for the SE/GE/IEA checks) and the member it belongs
+# to. The rules of code-list elements (qualifiers, type and status codes) are memoized per
+# distinct value by ins_class, so repeated codes are checked once.
+
+DEFAULT_MAX_ISSUES = 10000
+MISSING_ELEMENT = "missing_element"
+
+# Segment ID -> constructor whose fields the element positions are read from
+_SEGMENT_CONSTRUCTORS = {
+    "INS": INS.from_fields_ins_segment, "REF": REF.from_fields_ins_ref_segment, "DTP": DTP.from_fields_ins_dtp_segment,
+    "NM1": NM1.from_fields_ins_nm1_segment, "PER": PER.from_fields_ins_per_segment, "N3": N3.from_fields_ins_n3_segment,
+    "N4": N4.from_fields_ins_n4_segment, "DMG": DMG.from_fields_ins_dmg_segment, "HD": HD.from_fields_ins_hd_segment,
+    "AMT": AMT.from_fields_ins_amt_segment, "N1": N1.from_fields_n1_segment,
+}
+_PROBE_ELEMENTS = 20
+_PROBE_MARKER = "\x00"
+
+
+@functools.lru_cache(maxsize=None)
+def element_positions(segment_id: str) -> Dict[str, int]:
+    """Model field name -> element position (1-based) for a segment ID; empty for unmodeled segments.
+
+    Read off the constructor itself: it is fed marker values naming their position, so the
+    map cannot drift from ins_class. Fields not taken from an element (e.g. DMG01) are left out.
+    """
+    from_fields = _SEGMENT_CONSTRUCTORS.get(segment_id)
+    if from_fields is None:
+        return {}
+    probe = (segment_id,) + tuple(f"{_PROBE_MARKER}{position}" for position in range(1, _PROBE_ELEMENTS))
+    model = from_fields(probe, True)
+    return {name: int(value[1:]) for name, value in model.__dict__.items()
+            if isinstance(value, str) and value.startswith(_PROBE_MARKER)}
+
+
+class ValidationIssue(NamedTuple):
+    """One failed rule of one segment."""
+    segment_index: Optional[int]  # 1-based position of the segment in the input; None at the end of input
+    byte_offset: Optional[int]  # of the segment in the file, when the source tracks it
+    segment_id: str
+    element: Optional[str]  # e.g. "DTP03"; None when the field does not come from an element
+    field: Optional[str]  # model field name, e.g. "date_time_period"
+    rule: str  # pydantic error type, MISSING_ELEMENT or an EnvelopeError rule
+    message: str
+    value: Optional[str]
+    member_seq: Optional[int]  # 1-based member the segment belongs to; None in the headers
+
+
+class ValidationReport:
+    """
+    Collects the validation failures of one parse.
+
+    All failures are counted per (segment ID, element, rule); the first max_issues are kept
+    as ValidationIssue records. byte_offset is set by the segment source (see
+    ins_834.iter_ins_validated) to the offset of the segment being parsed.
+    """
+
+    def __init__(self, source: Optional[str] = None, max_issues: int = DEFAULT_MAX_ISSUES):
+        self.source = source
+        self.max_issues = max_issues
+        self.byte_offset: Optional[int] = None
+        self.issues: List[ValidationIssue] = []
+        self.counts: Counter = Counter()
+        self.issue_count = 0
+        self.segments_failed = 0
+        self.segments_skipped = 0  # failed segments that could not be rebuilt either
+
+    @property
+    def ok(self) -> bool:
+        return not self.segments_failed
+
+    def _add(self, issue: ValidationIssue) -> None:
+        self.issue_count += 1
+        self.counts[(issue.segment_id, issue.element, issue.rule)] += 1
+        if len(self.issues) < self.max_issues:
+            self.issues.append(issue)
+
+    def record(self, segment_index: Optional[int], fields: Sequence[str], error: Exception,
+               member_seq: Optional[int]) -> None:
+        """Records the issues of a segment whose handler raised error."""
+        self.segments_failed += 1
+        segment_id = fields[0]
+        if isinstance(error, EnvelopeError):
+            self._add(ValidationIssue(segment_index, self.byte_offset if segment_index else None, segment_id,
+                                      error.element, None, error.rule, str(error), error.value, member_seq))
+            return
+        if not isinstance(error, ValidationError):
+            # Required elements are read by position, so a short segment raises IndexError
+            element = f"{segment_id}{len(fields):02d}"
+            self._add(ValidationIssue(segment_index, self.byte_offset, segment_id, element, None, MISSING_ELEMENT,
+                                      f"segment has {len(fields) - 1} elements", None, member_seq))
+            return
+        positions = element_positions(segment_id)
+        for detail in error.errors(include_url=False):
+            field = str(detail["loc"][0]) if detail["loc"] else None
+            position = positions.get(field)
+            value = detail.get("input")
+            self._add(ValidationIssue(segment_index, self.byte_offset, segment_id,
+                                      f"{segment_id}{position:02d}" if position else None, field, detail["type"],
+                                      detail["msg"], value if isinstance(value, str) else None, member_seq))
+
+    def to_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "segments_failed": self.segments_failed,
+            "segments_skipped": self.segments_skipped,
+            "issue_count": self.issue_count,
+            "counts": [{"segment": segment_id, "element": element, "rule": rule, "count": count}
+                       for (segment_id, element, rule), count in self.counts.most_common()],
+            "issues": [issue._asdict() for issue in self.issues],
+            "issues_truncated": self.issue_count > len(self.issues),
+        }
+
+    def write_json(self, filename: str) -> None:
+        with open(filename, "w") as outfile:
+            json.dump(self.to_dict(), outfile, indent=2)
+        logger.info(f"Validation report written: {filename}")
+
+    def summary(self) -> str:
+        lines = [f"{self.source or 'input'}: {self.segments_failed} segments failed validation "
+                 f"({self.issue_count} issues, {self.segments_skipped} segments skipped)"]
+        for (segment_id, element, rule), count in self.counts.most_common():
+            lines.append(f"  {element or segment_id:8} {rule:30} {count}")
+        return "\n".join(lines)
+
+
+def main():
+    from ins_834 import iter_ins_validated
+
+    parser = argparse.ArgumentParser(description="Validate an 834 file, reporting every failed segment instead of stopping at the first")
+    parser.add_argument("input", help="834 file")
+    parser.add_argument("-o", "--output", help="write the report as JSON")
+    parser.add_argument("--max-issues", type=int, default=DEFAULT_MAX_ISSUES, help="issues kept in detail (all are counted)")
+    args = parser.parse_args()
+
+    report = ValidationReport(args.input, args.max_issues)
+    members = sum(1 for _ in iter_ins_validated(args.input, report))
+    print(f"{members} members")
+    print(report.summary())
+    if args.output:
+        report.write_json(args.output)
+    if not report.ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import datetime
+import itertools
+from loguru import logger
+from typing import Dict, Iterable, List, Optional, Sequence, TextIO, Tuple
+
+from edi_utils import DEFAULT_CHUNK_SIZE, EdiDelimiters, tokenizer_from_stream
+from ins_class import (INS, REF, DTP, NM1, PER, N3, N4, DMG, HD, AMT, N1, Coverage, Interchange, FunctionalGroup,
+                       TransactionSet)
+
+# X12 output of parsed members: corrected, filtered or split 834s.
+#
+# X12Writer streams segments to a text file, joining them in batches of WRITE_BATCH_SEGMENTS
+# so a multi-million member output costs one write call per batch and constant memory. It
+# counts segments, transaction sets and groups as they are written, so SE01/GE01/IEA01 are
+# always right for what was actually written. Each model is written back to the element
+# positions ins_class reads it from (SEGMENT_ELEMENTS); elements the models do not keep
+# (e.g. INS07) are written empty. Trailing empty elements are omitted, as X12 requires.
+#
+# write_834() wraps a member stream (e.g. a filtered ins_834.iter_ins_file) in a single
+# interchange / group / transaction set; write_interchanges() writes a tree built by
+# ins_834.parse_interchanges with all of its envelopes.
+
+WRITE_BATCH_SEGMENTS = 4096
+IMPLEMENTATION_CONVENTION = "005010X220A1"
+
+# Model -> (segment ID, field name per element position 1, 2, ...; "" for elements not modeled)
+SEGMENT_ELEMENTS: Dict[type, Tuple[str, Tuple[str, ...]]] = {
+    INS: ("INS", ("yes_no_response_code", "dependent_code", "maintenance_type_code", "maintenance_reason_code",
+                  "benefit_status_code", "medicare_status_code", "", "occ_length_code", "handicap_ind")),
+    REF: ("REF", ("reference_identification_qualifier", "reference_identification", "description")),
+    DTP: ("DTP", ("date_time_qualifier", "date_time_format_qualifier", "date_time_period")),
+    NM1: ("NM1", ("entity_identifier_code", "entity_type_qualifier", "name_last_or_organization_name", "name_first",
+                  "name_middle", "", "", "identification_code_qualifier", "identification_code",
+                  "entity_relationship_code", "entity_identifier_code_2")),
+    PER: ("PER", ("contact_function_code", "contact_enumeration_code", "contact_communication_number_qualifier",
+                  "contact_communication_number")),
+    N3: ("N3", ("address_information_1", "address_information_2")),
+    N4: ("N4", ("city_name", "state_or_province_code", "postal_code", "country_code", "location_identifier")),
+    DMG: ("DMG", ("date_time_format_qualifier", "date_time_period", "gender_code", "race_or_ethnicity_code")),
+    HD: ("HD", ("maintenance_reason_code", "", "source_of_submission_code", "plan_coverage_description",
+                "employee_status_code", "maintenance_type_code")),
+    AMT: ("AMT", ("amount_qualifier_code", "monetary_amount")),
+    N1: ("N1", ("entity_identifier_code", "name", "identification_code_qualifier", "identification_code")),
+}
+
+
+class X12Writer:
+    """
+    Writes X12 segments to a text stream, keeping the envelope counts.
+
+    Open and close the envelopes with begin_*/end_* in nesting order; end_transaction_set,
+    end_group and end_interchange write SE/GE/IEA with the counts of what was written
+    since the matching begin_*. Call flush() (or end_interchange) before closing the stream.
+    """
+
+    def __init__(self, outfile: TextIO, delimiters: EdiDelimiters = EdiDelimiters(), line_breaks: bool = True):
+        """
+        Args:
+            outfile: Text stream opened with newline="", so line breaks are written as given.
+            delimiters: Delimiters to write; the ISA header declares them.
+            line_breaks: Follow each segment terminator with a newline (ignored when the
+                terminator itself is a newline).
+        """
+        self.outfile = outfile
+        self.delimiters = delimiters
+        self.separator = delimiters.element_separator
+        terminator = delimiters.segment_terminator
+        self._terminator = terminator + "\n" if line_breaks and terminator != "\n" else terminator
+        # Element values cannot contain any delimiter; X12 has no escape for them
+        self._delimiters = tuple(delimiter for delimiter in (delimiters.element_separator, delimiters.sub_element_separator,
+                                                             delimiters.repetition_separator, terminator) if delimiter)
+        self._batch: List[str] = []
+        self.segments_written = 0
+        self._set_segments = 0
+        self._set_control_number: Optional[str] = None
+        self._transaction_sets = 0
+        self._group_control_number: Optional[str] = None
+        self._groups = 0
+        self._interchange_control_number: Optional[str] = None
+
+    def write_segment(self, segment_id: str, elements: Sequence[Optional[str]]) -> None:
+        """Writes one segment; None elements are written empty.
+
+        Raises:
+            ValueError: An element value contains one of the delimiters.
+        """
+        values = [element or "" for element in elements]
+        all_values = "".join(values)
+        for delimiter in self._delimiters:
+            if delimiter in all_values:
+                value = next(value for value in values if delimiter in value)
+                raise ValueError(f"{segment_id} element {value!r} contains the delimiter {delimiter!r}")
+        self._write_values(segment_id, values)
+
+    def _write_values(self, segment_id: str, values: List[str]) -> None:
+        separator = self.separator
+        segment = separator.join([segment_id, *values]).rstrip(separator)
+        batch = self._batch
+        batch.append(segment)
+        self._set_segments += 1
+        if len(batch) >= WRITE_BATCH_SEGMENTS:
+            self.flush()
+
+    def write_model(self, model) -> None:
+        """Writes a segment model (INS, REF, DTP, NM1, PER, N3, N4, DMG, HD, AMT, N1)."""
+        segment_id, names = SEGMENT_ELEMENTS[type(model)]
+        get = model.__dict__.get
+        self.write_segment(segment_id, [get(name) for name in names])
+
+    def write_member(self, ins: INS) -> None:
+        """
+        Writes an INS loop: INS, REF, DTP, the 2100A name loop, the other NM1 sub-loops and
+        the 2300 coverages (HD, DTP, AMT, REF).
+
+        The models do not record which coverage a 2310 provider loop followed, so 2310 loops
+        are written after the last coverage.
+        """
+        write_model = self.write_model
+        write_model(ins)
+        for ref in ins.ref_segments:
+            write_model(ref)
+        for dtp in ins.dtp_segments:
+            write_model(dtp)
+        self._write_name_loop(ins)
+        providers = []
+        for nm1_loop in ins.nm1_loops:
+            if nm1_loop.loop_id == "2310":
+                providers.append(nm1_loop)
+            else:
+                self._write_name_loop(nm1_loop)
+        for coverage in ins.coverages:
+            self._write_coverage(coverage)
+        if not ins.coverages and ins.hd_segment is not None:
+            write_model(ins.hd_segment)  # members built with an HD but no coverage loops
+        for nm1_loop in providers:
+            self._write_name_loop(nm1_loop)
+
+    def _write_name_loop(self, loop) -> None:
+        # INS (2100A) and NM1Loop share the nm1/per/n3/n4/dmg attributes
+        for segment in (loop.nm1_segment, loop.per_segment, loop.n3_segment, loop.n4_segment, loop.dmg_segment):
+            if segment is not None:
+                self.write_model(segment)
+
+    def _write_coverage(self, coverage: Coverage) -> None:
+        write_model = self.write_model
+        write_model(coverage.hd_segment)
+        for dtp in coverage.dtp_segments:
+            write_model(dtp)
+        for amt in coverage.amt_segments:
+            write_model(amt)
+        for ref in coverage.ref_segments:
+            write_model(ref)
+
+    # Envelopes
+
+    def begin_interchange(self, interchange: Optional[Interchange] = None) -> None:
+        """Writes the fixed-width ISA header, taking sender, receiver, date, time, control
+        number and usage indicator from interchange where it has them."""
+        interchange = interchange or Interchange()
+        now = datetime.datetime.now()
+        self._interchange_control_number = (interchange.control_number or "1").zfill(9)
+        self._groups = 0
+        # ISA11 and ISA16 are the repetition and sub-element separators themselves
+        self._write_values("ISA", [
+            "00", " " * 10, "00", " " * 10,
+            (interchange.sender_id_qualifier or "ZZ").ljust(2), (interchange.sender_id or "SENDER").ljust(15),
+            (interchange.receiver_id_qualifier or "ZZ").ljust(2), (interchange.receiver_id or "RECEIVER").ljust(15),
+            interchange.date or now.strftime("%y%m%d"), interchange.time or now.strftime("%H%M"),
+            self.delimiters.repetition_separator, "00501", self._interchange_control_number, "0",
+            interchange.usage_indicator or "P", self.delimiters.sub_element_separator])
+
+    def begin_group(self, group: Optional[FunctionalGroup] = None) -> None:
+        group = group or FunctionalGroup()
+        now = datetime.datetime.now()
+        self._group_control_number = group.control_number or "1"
+        self._transaction_sets = 0
+        self._groups += 1
+        self.write_segment("GS", [
+            group.functional_identifier_code or "BE", group.application_sender_code or "SENDER",
+            group.application_receiver_code or "RECEIVER", group.date or now.strftime("%Y%m%d"),
+            group.time or now.strftime("%H%M"), self._group_control_number, "X", group.version or IMPLEMENTATION_CONVENTION])
+
+    def begin_transaction_set(self, header: Optional[TransactionSet] = None) -> None:
+        """Writes ST and the transaction set header: BGN, header REF/DTP and the 1000A/B/C N1 loops."""
+        header = header or TransactionSet()
+        self._transaction_sets += 1
+        self._set_control_number = header.control_number or str(self._transaction_sets).zfill(4)
+        self._set_segments = 0
+        self.write_segment("ST", ["834", self._set_control_number,
+                                  header.implementation_convention_reference or IMPLEMENTATION_CONVENTION])
+        today = datetime.date.today().strftime("%Y%m%d")
+        self.write_segment("BGN", [header.transaction_set_purpose_code or "00", header.reference_identification or "1",
+                                   header.date or today, header.time, None, None, None, header.action_code or "2"])
+        for ref in header.ref_segments:
+            self.write_model(ref)
+        for dtp in header.dtp_segments:
+            self.write_model(dtp)
+        for n1 in (header.sponsor, header.payer, *header.brokers):
+            if n1 is not None:
+                self.write_model(n1)
+
+    def end_transaction_set(self) -> None:
+        # SE01 counts ST through SE
+        self.write_segment("SE", [str(self._set_segments + 1), self._set_control_number])
+
+    def end_group(self) -> None:
+        self.write_segment("GE", [str(self._transaction_sets), self._group_control_number])
+
+    def end_interchange(self) -> None:
+        self.write_segment("IEA", [str(self._groups), self._interchange_control_number])
+        self.flush()
+
+    def flush(self) -> None:
+        batch = self._batch
+        if batch:
+            terminator = self._terminator
+            self.outfile.write(terminator.join(batch) + terminator)
+            self.segments_written += len(batch)
+            batch.clear()
+
+
+def write_834(members: Iterable[INS], filename: str, header: Optional[TransactionSet] = None,
+              group: Optional[FunctionalGroup] = None, interchange: Optional[Interchange] = None,
+              delimiters: EdiDelimiters = EdiDelimiters(), line_breaks: bool = True) -> int:
+    """
+    Writes members as one 834 interchange with a single group and transaction set.
+
+    Args:
+        members: Members to write; may be a generator (e.g. a filtered ins_834.iter_ins_file),
+            each member is written as soon as it arrives.
+        filename: Output file.
+        header: Transaction set header (ST/BGN, header REF/DTP, sponsor, payer, brokers); its
+            members are not written. Defaults fill in a minimal BGN.
+        group: GS values; defaults are used for missing ones.
+        interchange: ISA values; defaults are used for missing ones.
+        delimiters: Delimiters to write.
+        line_breaks: Follow each segment terminator with a newline.
+    Returns:
+        The number of members written.
+    """
+    count = 0
+    with open(filename, "w", newline="") as outfile:
+        writer = X12Writer(outfile, delimiters, line_breaks)
+        writer.begin_interchange(interchange)
+        writer.begin_group(group)
+        writer.begin_transaction_set(header)
+        for ins in members:
+            writer.write_member(ins)
+            count += 1
+        writer.end_transaction_set()
+        writer.end_group()
+        writer.end_interchange()
+    logger.info(f"Wrote {count} members ({writer.segments_written} segments) to {filename}")
+    return count
+
+
+def write_interchanges(interchanges: Iterable[Interchange], filename: str, delimiters: EdiDelimiters = EdiDelimiters(),
+                       line_breaks: bool = True) -> int:
+    """
+    Writes a parsed tree (see ins_834.parse_interchanges) back to X12, envelopes included,
+    with the counts recomputed.
+
+    Returns:
+        The number of members written.
+    """
+    count = 0
+    with open(filename, "w", newline="") as outfile:
+        writer = X12Writer(outfile, delimiters, line_breaks)
+        for interchange in interchanges:
+            writer.begin_interchange(interchange)
+            for group in interchange.functional_groups:
+                writer.begin_group(group)
+                for transaction_set in group.transaction_sets:
+                    writer.begin_transaction_set(transaction_set)
+                    for ins in transaction_set.members:
+                        writer.write_member(ins)
+                        count += 1
+                    writer.end_transaction_set()
+                writer.end_group()
+            writer.end_interchange()
+    logger.info(f"Wrote {count} members ({writer.segments_written} segments) to {filename}")
+    return count
+
+
+def main():
+    from ins_834 import InsParseState, iter_ins_fields
+
+    parser = argparse.ArgumentParser(description="Write the members of an 834 file that pass a filter to a new 834")
+    parser.add_argument("input", help="834 file")
+    parser.add_argument("output", help="834 file to write")
+    parser.add_argument("--exclude-maintenance-type", action="append", default=[],
+                        help="drop members with this INS03 maintenance type, e.g. 024 for terminations (repeatable)")
+    parser.add_argument("--plan", help="keep only members with a coverage of this HD04 plan description, and only those coverages")
+    parser.add_argument("--trusted", action="store_true", help="build models without validation")
+    parser.add_argument("--no-line-breaks", action="store_true", help="do not add a newline after each terminator")
+    args = parser.parse_args()
+
+    def selected(ins: INS) -> bool:
+        if ins.maintenance_type_code in args.exclude_maintenance_type:
+            return False
+        if args.plan:
+            ins.coverages = [coverage for coverage in ins.coverages
+                             if coverage.hd_segment.plan_coverage_description == args.plan]
+            ins.hd_segment = ins.coverages[0].hd_segment if ins.coverages else None
+            return bool(ins.coverages)
+        return True
+
+    with open(args.input, "r", newline=None) as infile:
+        tokenizer, head = tokenizer_from_stream(infile, DEFAULT_CHUNK_SIZE)
+        state = InsParseState(args.trusted)
+        members = iter_ins_fields(tokenizer.iter_fields(infile, DEFAULT_CHUNK_SIZE, head), state=state)
+        # The envelopes and header loops have been read once the first member is out. They are
+        # taken from the tree, which keeps them after their SE/GE/IEA (e.g. a one-member ST/SE)
+        first = next(members, None)
+        members = itertools.chain([first] if first is not None else [], members)
+        interchange = state.interchanges[-1] if state.interchanges else None
+        group = interchange.functional_groups[-1] if interchange and interchange.functional_groups else None
+        header = group.transaction_sets[-1] if group and group.transaction_sets else None
+        count = write_834(filter(selected, members), args.output, header, group, interchange, tokenizer.delimiters,
+                          not args.no_line_breaks)
+    print(f"{args.output}: {count} of {state.ins_segments_count} members")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ins_synthetic import iter_synthetic_834  # noqa: E402
+
+SUBSCRIBERS = 20
+DEPENDENTS = 2
+
+
+@pytest.fixture
+def segments():
+    """Segments (without terminator) of a small synthetic 834, envelopes included."""
+    return list(iter_synthetic_834(SUBSCRIBERS, DEPENDENTS, coverages=2))
+
+
+@pytest.fixture
+def write_edi(tmp_path):
+    """Writes segments to an .edi file in tmp_path, one per line, and returns its path."""
+    def write(segments, name="input.edi", terminator="~"):
+        path = tmp_path / name
+        with open(path, "w", newline="") as outfile:
+            outfile.write("".join(f"{segment}{terminator}\n" for segment in segments))
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def edi_file(segments, write_edi):
+    return write_edi(segments)
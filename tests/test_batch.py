@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from ins_batch import is_up_to_date, output_path_for, process_file, run_batch
+
+
+# An unsaved write-only workbook left to the garbage collector raises "I/O operation on closed file"
+@pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+def test_failed_run_leaves_no_output(segments, write_edi, tmp_path):
+    path = write_edi(segments[:len(segments) // 2], "truncated.edi")
+    output_dir = str(tmp_path / "out")
+    for output_format in ("xlsx", "parquet"):
+        output_path = output_path_for(path, output_dir, output_format)
+        result = process_file(path, output_path, output_format)
+        assert result.status == "failed"
+        assert not is_up_to_date(path, output_path, output_format)
+        assert not os.path.exists(output_path)
+    assert os.listdir(output_dir) == []
+
+
+def test_rerun_skips_only_completed_files(segments, write_edi, tmp_path):
+    good = write_edi(segments, "good.edi")
+    bad = write_edi(segments[:-1], "bad.edi")
+    output_dir = str(tmp_path / "out")
+    first = {os.path.basename(result.input_path): result.status for result in run_batch([good, bad], output_dir, jobs=1)}
+    assert first == {"good.edi": "done", "bad.edi": "failed"}
+    second = {os.path.basename(result.input_path): result.status for result in run_batch([good, bad], output_dir, jobs=1)}
+    assert second == {"good.edi": "skipped", "bad.edi": "failed"}
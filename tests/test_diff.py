@@ -0,0 +1,38 @@
+import gc
+import os
+
+import pytest
+
+from edi_utils import EnvelopeError
+from ins_diff import MODIFIED, FieldChange, iter_member_diffs, write_diff_excel
+
+
+def test_changed_member_is_reported(segments, write_edi, tmp_path):
+    old = write_edi(segments, "old.edi")
+    first_dmg = next(seq for seq, segment in enumerate(segments) if segment.startswith("DMG*"))
+    segments[first_dmg] = segments[first_dmg].replace("*19800101*", "*19800102*")
+    diffs = list(iter_member_diffs(old, write_edi(segments, "new.edi"), str(tmp_path)))
+    assert [(diff.status, diff.member_key) for diff in diffs] == [(MODIFIED, "SUB000000000|100000000")]
+    assert diffs[0].changes == (FieldChange("dmg.date_time_period", "19800101", "19800102"),)
+    assert sorted(os.listdir(tmp_path)) == ["new.edi", "old.edi"]  # scratch database removed
+
+
+def test_truncated_resend_raises_before_removed_members(segments, write_edi, tmp_path):
+    old = write_edi(segments, "old.edi")
+    truncated = write_edi(segments[:len(segments) // 2], "truncated.edi")
+    diffs = []
+    with pytest.raises(EnvelopeError):
+        for diff in iter_member_diffs(old, truncated, str(tmp_path)):
+            diffs.append(diff)
+    assert diffs == []
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+def test_failed_excel_report(segments, write_edi, tmp_path):
+    old = write_edi(segments, "old.edi")
+    truncated = write_edi(segments[:len(segments) // 2], "truncated.edi")
+    report = str(tmp_path / "diff.xlsx")
+    with pytest.raises(EnvelopeError):
+        write_diff_excel(iter_member_diffs(old, truncated, str(tmp_path)), report)
+    gc.collect()  # finalizes an unclosed workbook's row writers now, inside the test
+    assert not os.path.exists(report)
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from edi_utils import EnvelopeError
+from ins_834 import iter_ins_file, iter_ins_file_parallel, iter_ins_mapped
+from ins_pipeline import run_file_pipeline
+
+# Each returns the number of members parsed
+PARSERS = {
+    "stream": lambda path: sum(1 for _ in iter_ins_file(path)),
+    "mmap": lambda path: sum(1 for _ in iter_ins_mapped(path)),
+    "parallel": lambda path: sum(1 for _ in iter_ins_file_parallel(path, workers=2, chunk_members=7)),
+    "pipeline": lambda path: asyncio.run(run_file_pipeline(path, list, chunk_members=7)),
+}
+
+
+def _replace_element(segments, segment_id, position, value):
+    prefix = segment_id + "*"
+    index = next(index for index, segment in enumerate(segments) if segment.startswith(prefix))
+    fields = segments[index].split("*")
+    fields[position] = value
+    return segments[:index] + ["*".join(fields)] + segments[index + 1:]
+
+
+def _count(segments, segment_id, position, delta):
+    fields = next(segment for segment in segments if segment.startswith(segment_id + "*")).split("*")
+    return _replace_element(segments, segment_id, position, str(int(fields[position]) + delta))
+
+
+CORRUPTIONS = {
+    "se_count": (lambda segments: _count(segments, "SE", 1, -1), "SE01", "control_count_mismatch"),
+    "se_control_number": (lambda segments: _replace_element(segments, "SE", 2, "0002"), "SE02", "control_number_mismatch"),
+    "ge_count": (lambda segments: _count(segments, "GE", 1, 1), "GE01", "control_count_mismatch"),
+    "ge_control_number": (lambda segments: _replace_element(segments, "GE", 2, "2"), "GE02", "control_number_mismatch"),
+    "iea_count": (lambda segments: _count(segments, "IEA", 1, 1), "IEA01", "control_count_mismatch"),
+    "iea_control_number": (lambda segments: _replace_element(segments, "IEA", 2, "000000002"), "IEA02",
+                           "control_number_mismatch"),
+    "missing_iea": (lambda segments: segments[:-1], None, "truncated"),
+    "truncated_member": (lambda segments: segments[:len(segments) // 2], None, "truncated"),
+}
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_valid_envelopes(parser, edi_file):
+    assert PARSERS[parser](edi_file) == len(list(iter_ins_file(edi_file)))
+
+
+@pytest.mark.parametrize("corruption", CORRUPTIONS)
+@pytest.mark.parametrize("parser", PARSERS)
+def test_envelope_errors(parser, corruption, segments, write_edi):
+    corrupt, element, rule = CORRUPTIONS[corruption]
+    path = write_edi(corrupt(segments))
+    with pytest.raises(EnvelopeError) as raised:
+        PARSERS[parser](path)
+    assert raised.value.rule == rule
+    assert raised.value.element == element
+
+
+def test_truncated_input_hands_out_no_last_member(segments, write_edi):
+    # The members read before the error are complete; the cut-off one is never yielded
+    path = write_edi(segments[:-3])  # without SE, GE and IEA
+    members = []
+    with pytest.raises(EnvelopeError):
+        for ins in iter_ins_file(path):
+            members.append(ins)
+    assert len(members) == len(list(iter_ins_file(write_edi(segments, "complete.edi")))) - 1
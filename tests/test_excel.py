@@ -0,0 +1,29 @@
+import openpyxl
+
+from ins_834 import iter_ins_file
+from ins_excel import create_excel, create_excel_streaming
+from ins_synthetic import iter_synthetic_834
+
+
+def _sheet_values(filename):
+    wb = openpyxl.load_workbook(filename)
+    return {ws.title: [tuple(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+
+def test_streaming_layout_matches_create_excel(write_edi, tmp_path, monkeypatch):
+    # create_excel needs every member to have an N3/N4, which synthetic dependents lack
+    members = list(iter_ins_file(write_edi(list(iter_synthetic_834(5, coverages=2)))))
+    monkeypatch.chdir(tmp_path)  # create_excel always writes ins.xlsx to the working directory
+    create_excel(members)
+    assert create_excel_streaming(iter(members), str(tmp_path / "streaming.xlsx")) == len(members)
+    assert _sheet_values(tmp_path / "streaming.xlsx") == _sheet_values(tmp_path / "ins.xlsx")
+
+
+def test_streaming_members_without_address(edi_file, tmp_path):
+    filename = str(tmp_path / "members.xlsx")
+    members = list(iter_ins_file(edi_file))
+    assert create_excel_streaming(iter(members), filename) == len(members)
+    sheets = _sheet_values(filename)
+    assert list(sheets) == ["INS", "INS-REF", "INS-DTP", "INS-HD"]
+    assert len(sheets["INS"]) == len(members) + 1
+    assert len(sheets["INS-REF"]) == sum(len(ins.ref_segments) for ins in members) + 1
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from ins_834 import iter_ins_file
+from ins_frames import member_states, members_to_frames
+
+
+def test_member_states_inherit_only_missing_states():
+    members = pd.DataFrame({
+        "member_seq": [1, 2, 3, 4, 5],
+        "subscriber_seq": [1, 1, 1, 4, 4],
+        "n4_state_or_province_code": pd.Categorical(["NY", "NJ", None, None, None]),
+    })
+    # A dependent keeps its own N403; one without an N4 takes the subscriber's
+    assert member_states(members).tolist() == ["NY", "NJ", "NY", "unknown", "unknown"]
+
+
+def test_member_states_from_parsed_members(segments, write_edi):
+    # Give the first dependent an address of its own (the synthetic dependents have none)
+    dependent = next(index for index, segment in enumerate(segments) if segment.startswith("INS*N*"))
+    nm1 = next(index for index in range(dependent, len(segments)) if segments[index].startswith("NM1*"))
+    segments.insert(nm1 + 1, "N4*NEWARK*NJ*07102")
+    se = next(index for index, segment in enumerate(segments) if segment.startswith("SE*"))
+    _, count, control_number = segments[se].split("*")
+    segments[se] = f"SE*{int(count) + 1}*{control_number}"
+
+    members = members_to_frames(iter_ins_file(write_edi(segments))).members
+    states = member_states(members).tolist()
+    assert states[:3] == ["IL", "NJ", "IL"]
+    assert set(states) == {"IL", "NJ"}
+
+
+def test_frames_do_not_need_pyarrow():
+    # A None entry in sys.modules makes the import fail as if pyarrow were not installed
+    code = "import sys; sys.modules['pyarrow'] = None; import ins_frames"
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   check=True)
@@ -0,0 +1,62 @@
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import ins_incremental
+from conftest import DEPENDENTS, SUBSCRIBERS
+from edi_utils import EnvelopeError
+from ins_incremental import ADDED, CHANGED, DROPPED, iter_ins_blocks, iter_member_changes
+
+
+def _statuses(path, index_path):
+    return Counter(change.status for change in iter_member_changes(path, index_path))
+
+
+def _index_rows(index_path):
+    connection = sqlite3.connect(index_path)
+    try:
+        return sorted(connection.execute("SELECT * FROM member_state"))
+    finally:
+        connection.close()
+
+
+def test_only_differences_are_reported(segments, write_edi, tmp_path):
+    index_path = str(tmp_path / "members.insidx")
+    assert _statuses(write_edi(segments), index_path) == {ADDED: SUBSCRIBERS * (1 + DEPENDENTS)}
+    assert _statuses(write_edi(segments), index_path) == {}
+    changed = [segment.replace("DOE3", "ROE3") if segment.startswith("NM1*") else segment for segment in segments]
+    assert _statuses(write_edi(changed), index_path) == {CHANGED: 1 + DEPENDENTS}
+
+
+def test_truncated_file_leaves_index_untouched(segments, write_edi, tmp_path):
+    index_path = str(tmp_path / "members.insidx")
+    full = write_edi(segments, "full.edi")
+    _statuses(full, index_path)
+    before = _index_rows(index_path)
+    with pytest.raises(EnvelopeError):
+        _statuses(write_edi(segments[:len(segments) // 2], "truncated.edi"), index_path)
+    assert _index_rows(index_path) == before
+    assert _statuses(full, index_path) == {}
+
+
+def test_dropped_members(segments, write_edi, tmp_path):
+    index_path = str(tmp_path / "members.insidx")
+    _statuses(write_edi(segments), index_path)
+    # Drop the last subscriber's INS loops and correct SE01
+    last_ins = max(index for index, segment in enumerate(segments) if segment.startswith("INS*Y*"))
+    se = next(index for index, segment in enumerate(segments) if segment.startswith("SE*"))
+    _, count, control_number = segments[se].split("*")
+    shortened = segments[:last_ins] + [f"SE*{int(count) - (se - last_ins)}*{control_number}"] + segments[se + 1:]
+    assert _statuses(write_edi(shortened), index_path) == {DROPPED: 1 + DEPENDENTS}
+
+
+@pytest.mark.parametrize("batch_blocks", [2, 500])
+def test_repeated_keys_are_numbered(segments, write_edi, monkeypatch, batch_blocks):
+    monkeypatch.setattr(ins_incremental, "OCCURRENCE_BATCH_BLOCKS", batch_blocks)
+    # Without NM109 all members of a subscriber share the key "<subscriber ID>|"
+    segments = [segment.split("***")[0] if segment.startswith("NM1*IL*") else segment for segment in segments]
+    connection = sqlite3.connect(":memory:")
+    keys = [block.member_key for _, block in iter_ins_blocks(write_edi(segments), connection)]
+    assert len(set(keys)) == len(keys) == SUBSCRIBERS * (1 + DEPENDENTS)
+    assert keys[:3] == ["SUB000000000|", "SUB000000000|#2", "SUB000000000|#3"]
@@ -0,0 +1,23 @@
+from edi_utils import MappedEdiFile, iter_edi_fields
+from ins_834 import iter_ins_file, iter_ins_mapped
+
+
+def test_mapped_fields_match_stream(edi_file):
+    with MappedEdiFile(edi_file) as edi:
+        assert list(edi.iter_fields()) == list(iter_edi_fields(edi_file))
+
+
+def test_mapped_escaped_terminator(write_edi):
+    path = write_edi(["N3*1 MAIN\\~SUITE 2", "N4*CITY"])
+    with MappedEdiFile(path) as edi:
+        assert list(edi.iter_fields()) == [("N3", "1 MAIN~SUITE 2"), ("N4", "CITY")]
+
+
+def test_unmaterialized_segments_are_ids_only(edi_file):
+    with MappedEdiFile(edi_file) as edi:
+        fields = list(edi.iter_fields(materialize={"INS"}))
+    assert fields == [segment if segment[0] == "INS" else (segment[0],) for segment in iter_edi_fields(edi_file)]
+
+
+def test_mapped_parse_matches_stream(edi_file):
+    assert list(iter_ins_mapped(edi_file)) == list(iter_ins_file(edi_file))
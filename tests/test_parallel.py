@@ -0,0 +1,14 @@
+from conftest import DEPENDENTS, SUBSCRIBERS
+from ins_834 import iter_ins_file, iter_ins_file_parallel
+
+
+def test_parallel_matches_serial(edi_file):
+    serial = list(iter_ins_file(edi_file))
+    assert len(serial) == SUBSCRIBERS * (1 + DEPENDENTS)
+    # Chunks of 7 members cut subscribers from their dependents
+    assert list(iter_ins_file_parallel(edi_file, workers=2, chunk_members=7)) == serial
+    assert list(iter_ins_file_parallel(edi_file, workers=2, chunk_members=1000, chunk_size=101)) == serial
+
+
+def test_parallel_trusted_matches_validated(edi_file):
+    assert list(iter_ins_file_parallel(edi_file, workers=2, chunk_members=5, trusted=True)) == list(iter_ins_file(edi_file))
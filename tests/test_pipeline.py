@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+import pytest
+
+from ins_834 import iter_ins_file
+from ins_batch import output_path_for
+from ins_pipeline import export_sink_for, run_file_pipeline, run_pipelines
+
+
+def test_pipeline_matches_serial(edi_file):
+    members = []
+    count = asyncio.run(run_file_pipeline(edi_file, members.extend, chunk_size=997, chunk_members=7, queue_size=1))
+    assert count == len(members)
+    assert members == list(iter_ins_file(edi_file))
+
+
+def test_sink_error_is_raised(edi_file):
+    def sink(members):
+        next(iter(members))
+        raise RuntimeError("sink failed")
+
+    with pytest.raises(RuntimeError, match="sink failed"):
+        asyncio.run(run_file_pipeline(edi_file, sink, chunk_members=7, queue_size=1))
+
+
+def test_run_pipelines_reports_each_file(segments, write_edi):
+    good = write_edi(segments, "good.edi")
+    bad = write_edi(segments[:-1], "bad.edi")
+    results = asyncio.run(run_pipelines([good, bad], lambda path: list, max_files=2, workers=1, chunk_members=7))
+    assert [(result.status, result.members) for result in results] == [("done", len(list(iter_ins_file(good)))), ("failed", 0)]
+
+
+def test_export_is_renamed_only_after_the_pipeline_succeeds(segments, write_edi, tmp_path):
+    good = write_edi(segments, "good.edi")
+    bad = write_edi(segments[:-1], "bad.edi")
+    output_dir = str(tmp_path / "out")
+    os.makedirs(output_dir)
+    results = asyncio.run(run_pipelines([good, bad], export_sink_for(output_dir), max_files=2, workers=1,
+                                        chunk_members=7))
+    assert [(result.status, result.output_path) for result in results] == [
+        ("done", output_path_for(good, output_dir, "xlsx")), ("failed", output_path_for(bad, output_dir, "xlsx"))]
+    assert os.listdir(output_dir) == ["good.xlsx"]
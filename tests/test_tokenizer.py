@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+from edi_utils import EdiTokenizer, tokenizer_from_stream
+
+
+def _tokenize(text, chunk_size):
+    stream = io.StringIO(text)
+    tokenizer, head = tokenizer_from_stream(stream, chunk_size)
+    return list(tokenizer.iter_segments(stream, chunk_size, head))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 106, 107, 1000, 1 << 20])
+@pytest.mark.parametrize("line_breaks", [True, False])
+def test_chunk_boundaries(segments, chunk_size, line_breaks):
+    text = "".join(f"{segment}~" + ("\r\n" if line_breaks else "") for segment in segments)
+    assert _tokenize(text, chunk_size) == segments
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 14))
+def test_escaped_terminator_across_chunks(chunk_size):
+    # The escape character may end one chunk and the terminator it protects start the next
+    assert _tokenize("N3*1 MAIN\\~SUITE 2~N4*CITY~", chunk_size) == ["N3*1 MAIN~SUITE 2", "N4*CITY"]
+
+
+def test_split_chunk_carries_partial_segment():
+    tokenizer = EdiTokenizer()
+    segments, carry = tokenizer.split_chunk("", "ST*834*0001~BGN*00")
+    assert (segments, carry) == (["ST*834*0001"], "BGN*00")
+    segments, carry = tokenizer.split_chunk(carry, "*1~SE*3")
+    assert (segments, carry) == (["BGN*00*1"], "SE*3")
+    assert tokenizer.split_chunk(carry, "*0001", final=True) == (["SE*3*0001"], "")
+
+
+def test_delimiters_from_isa(segments):
+    text = "".join(segment.replace("*", "|") + "'" for segment in segments)
+    text = text[:104] + ">" + text[105:]  # ISA16 sub-element separator
+    stream = io.StringIO(text)
+    tokenizer, head = tokenizer_from_stream(stream, 50)
+    assert tokenizer.delimiters.element_separator == "|"
+    assert tokenizer.delimiters.segment_terminator == "'"
+    assert len(list(tokenizer.iter_fields(stream, 50, head))) == len(segments)
@@ -0,0 +1,33 @@
+import pytest
+from pydantic import ValidationError
+
+from ins_class import DTP, HD, clear_validation_caches
+
+
+@pytest.mark.parametrize("fields", [
+    ("DTP", "34", "D8", "20240101"),  # code-list element
+    ("DTP", "348", "D8", "2024010"),  # other element
+    ("DTP", "3488", "DX8", "2024"),
+])
+def test_errors_match_model_validation(fields):
+    clear_validation_caches()
+    with pytest.raises(ValidationError) as expected:
+        DTP(date_time_qualifier=fields[1], date_time_format_qualifier=fields[2], date_time_period=fields[3])
+    errors = []
+    for _ in range(2):  # the second time from the memoized outcomes
+        with pytest.raises(ValidationError) as raised:
+            DTP.from_fields_ins_dtp_segment(fields)
+        errors.append(raised.value)
+    assert errors[0] is not errors[1]
+    for error in errors:
+        assert error.title == "DTP"
+        assert error.errors() == expected.value.errors()
+
+
+def test_valid_segment_matches_model():
+    fields = ("HD", "024", "", "HLT", "PPO", "FAM")
+    assert HD.from_fields_ins_hd_segment(fields) == HD.from_fields_ins_hd_segment(fields, trusted=True) == \
+        HD(maintenance_reason_code="024", source_of_submission_code="HLT", plan_coverage_description="PPO",
+           employee_status_code="FAM")
+    with pytest.raises(ValidationError, match="literal_error"):
+        HD.from_fields_ins_hd_segment(("HD", "024", "", "HLX", "PPO"))
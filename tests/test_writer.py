@@ -0,0 +1,68 @@
+import io
+import sys
+
+import pytest
+
+from edi_utils import EdiDelimiters
+from ins_834 import iter_ins_file, parse_interchanges_file
+from ins_class import N3, NM1
+from ins_synthetic import iter_synthetic_834
+from ins_writer import X12Writer, main, write_834, write_interchanges
+
+
+@pytest.mark.parametrize("delimiters", [EdiDelimiters(), EdiDelimiters("|", ">", "!", "'")])
+@pytest.mark.parametrize("line_breaks", [True, False])
+def test_write_834_round_trip(edi_file, tmp_path, delimiters, line_breaks):
+    members = list(iter_ins_file(edi_file))
+    output = str(tmp_path / "output.edi")
+    assert write_834(members, output, delimiters=delimiters, line_breaks=line_breaks) == len(members)
+    # The parser verifies the SE/GE/IEA counts written
+    assert list(iter_ins_file(output)) == members
+
+
+def test_write_interchanges_round_trip(edi_file, tmp_path):
+    interchanges = parse_interchanges_file(edi_file)
+    output = str(tmp_path / "output.edi")
+    write_interchanges(interchanges, output)
+    assert parse_interchanges_file(output) == interchanges
+    with open(edi_file) as original, open(output) as written:
+        assert written.read() == original.read()
+
+
+@pytest.mark.parametrize("value", ["1*MAIN", "1 MAIN~", "UNIT:4", "A^B"])
+def test_delimiter_in_element_is_rejected(value):
+    writer = X12Writer(io.StringIO())
+    with pytest.raises(ValueError, match="contains the delimiter"):
+        writer.write_model(N3(address_information_1=value))  # address_information_2 is stripped as trailing
+    with pytest.raises(ValueError, match="contains the delimiter"):
+        writer.write_segment("N3", ["1 MAIN", value])
+    writer.flush()
+    assert writer.outfile.getvalue() == ""
+
+
+def test_delimiter_check_uses_the_writer_delimiters():
+    writer = X12Writer(io.StringIO(), EdiDelimiters("|", ">", "!", "'"), line_breaks=False)
+    with pytest.raises(ValueError):
+        writer.write_model(NM1(entity_identifier_code="IL", entity_type_qualifier="1", name_last_or_organization_name="O'BRIEN"))
+    writer.write_model(NM1(entity_identifier_code="IL", entity_type_qualifier="1", name_last_or_organization_name="O*BRIEN"))
+    writer.flush()
+    assert writer.outfile.getvalue() == "NM1|IL|1|O*BRIEN'"
+
+
+def test_isa_declares_the_delimiters():
+    writer = X12Writer(io.StringIO(), EdiDelimiters("|", ">", "!", "'"), line_breaks=False)
+    writer.begin_interchange()
+    writer.flush()
+    isa = writer.outfile.getvalue()
+    assert len(isa) == 106
+    assert (isa[3], isa[82], isa[104], isa[105]) == ("|", "!", ">", "'")
+
+
+def test_main_keeps_the_header_of_a_single_member_file(write_edi, tmp_path, monkeypatch):
+    # The only member is completed by SE, after which the parser has closed the transaction set
+    path = write_edi(list(iter_synthetic_834(1, 0, coverages=1)))
+    output = str(tmp_path / "output.edi")
+    monkeypatch.setattr(sys, "argv", ["ins_writer", path, output])
+    main()
+    with open(path) as original, open(output) as written:
+        assert written.read() == original.read()